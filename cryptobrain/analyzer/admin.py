@@ -1,18 +1,40 @@
 from django.contrib import admin
-from .models import BitcoinPriceHistory, BitcoinNews
+from .models import BitcoinPriceHistory, PriceRollup, BitcoinNews, AnalysisCacheEntry, AnalysisJob
 
 @admin.register(BitcoinPriceHistory)
 class BitcoinPriceHistoryAdmin(admin.ModelAdmin):
     """Admin configuration for the BitcoinPriceHistory model."""
-    list_display = ('timestamp', 'price', 'volume_24h')
-    list_filter = ('timestamp',)
+    list_display = ('asset', 'timestamp', 'price', 'volume_24h')
+    list_filter = ('asset', 'timestamp')
     search_fields = ('timestamp',)
     ordering = ('-timestamp',)
 
+@admin.register(PriceRollup)
+class PriceRollupAdmin(admin.ModelAdmin):
+    """Admin configuration for the PriceRollup model."""
+    list_display = ('asset', 'resolution', 'bucket_start', 'open', 'high', 'low', 'close', 'tick_count')
+    list_filter = ('asset', 'resolution')
+    ordering = ('-bucket_start',)
+
 @admin.register(BitcoinNews)
 class BitcoinNewsAdmin(admin.ModelAdmin):
     """Admin configuration for the BitcoinNews model."""
-    list_display = ('title', 'published_at', 'source')
-    list_filter = ('published_at', 'source')
+    list_display = ('title', 'asset', 'published_at', 'source', 'cluster_key')
+    list_filter = ('asset', 'published_at', 'source')
     search_fields = ('title', 'source')
     ordering = ('-published_at',)
+
+@admin.register(AnalysisCacheEntry)
+class AnalysisCacheEntryAdmin(admin.ModelAdmin):
+    """Admin configuration for the AnalysisCacheEntry model."""
+    list_display = ('fingerprint', 'created_at', 'last_used_at', 'hit_count')
+    search_fields = ('fingerprint',)
+    ordering = ('-last_used_at',)
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    """Admin configuration for the AnalysisJob model."""
+    list_display = ('asset', 'status', 'priority', 'attempts', 'run_after', 'created_at', 'finished_at')
+    list_filter = ('status', 'priority', 'asset')
+    search_fields = ('fingerprint',)
+    ordering = ('-created_at',)
@@ -1,75 +1,118 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from langchain.output_parsers import PydanticOutputParser
-from pydantic import BaseModel, Field
-import os
+import asyncio
+import logging
+import threading
 from dotenv import load_dotenv
-from google.api_core.exceptions import ResourceExhausted, GoogleAPICallError
-from .processor import preprocess_news_titles
-from .prompts import ANALYSIS_PROMPT_TEMPLATE
+from .conf import app_settings
+from .processor import preprocess_news_titles, estimate_tokens
+from .analysis_cache import analysis_cache
+from .metrics import metrics
 
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-try:
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    if not gemini_api_key:
-        raise ValueError("GEMINI_API_KEY not found in environment variables. The AI agent cannot function.")
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", api_key=gemini_api_key, temperature=0.7)
-except (ValueError, Exception) as e:
-    llm = None
+# The LangChain/Gemini stack is imported on the first analysis. With WARM_UP,
+# each server worker loads it in the background right after startup. Headlines
+# are added to the prompt, one per story, until NEWS_TOKEN_BUDGET is spent.
+# If the model has not produced a prediction within DEADLINE seconds, or fails,
+# the analysis panel shows a rule-based analysis until the model's arrives.
+DEFAULT_AGENT_SETTINGS = {
+    'WARM_UP': True,
+    'NEWS_TOKEN_BUDGET': 300,
+    'DEADLINE': 8,
+}
+
+
+def get_agent_settings():
+    """Returns the AGENT settings merged over the built-in defaults."""
+    return app_settings('AGENT', DEFAULT_AGENT_SETTINGS)
 
 class APIQuotaExceededError(Exception):
     """Custom exception raised when the Google Generative AI API quota is exceeded."""
     pass
 
-class ComprehensiveAnalysis(BaseModel):
-    """
-    Defines the data structure for a comprehensive Bitcoin market analysis.
-    This Pydantic model ensures that the AI's output is structured and validated.
-    """
-    market_sentiment: str = Field(description="Overall market sentiment (e.g., 'Bullish', 'Bearish', 'Neutral', 'Cautiously Optimistic').")
-    trend_prediction: str = Field(description="Predicted trend for the next 24-48 hours (e.g., 'Uptrend', 'Downtrend', 'Sideways').")
-    confidence_score: float = Field(description="Confidence in the prediction, from 0.0 (low) to 1.0 (high).")
-    analysis_summary: str = Field(description="A concise summary of the key drivers for the sentiment and trend.")
-    detailed_reasoning: str = Field(description="A detailed, multi-point reasoning for the analysis, synthesizing news and technical indicators.")
-
-parser = PydanticOutputParser(pydantic_object=ComprehensiveAnalysis)
-
-prompt = PromptTemplate(
-    input_variables=["news_titles", "price_trend_description", "moving_average", "current_price", "volume_24h"],
-    template=ANALYSIS_PROMPT_TEMPLATE,
-    partial_variables={"format_instructions": parser.get_format_instructions()},
-)
-
 class AgentOrchestrator:
     """
     Orchestrates the AI analysis process by integrating the language model,
     data processing, and prompt engineering components.
+
+    The LangChain stack (``llm_chain``) is imported on the first analysis that
+    misses the cache, or earlier by ``warm_up``, so that starting a worker or
+    serving the dashboard does not pay for it.
     """
-    def __init__(self, llm):
+    def __init__(self, llm=None, cache=None, news_token_budget=None):
         """
         Initializes the AgentOrchestrator.
 
         Args:
-            llm: An instance of a LangChain compatible language model.
-                 If None, analysis methods will raise an error.
+            llm: An instance of a LangChain compatible language model, or None to
+                 build the Gemini model from GEMINI_API_KEY when the chain is loaded.
+                 If no model can be built, analysis methods will raise an error.
+            cache (AnalysisCache | None): Store consulted before invoking the model.
+                 Analyses whose inputs have not materially changed are served from it.
+            news_token_budget (int | None): Estimated prompt tokens the news headlines
+                 may take. Headlines past the budget are left out, least relevant first.
         """
         self.llm = llm
+        self.cache = cache
+        self.news_token_budget = news_token_budget
+        self._chain_module = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """Whether the LangChain stack has been imported."""
+        return self._chain_module is not None
+
+    def load(self):
+        """
+        Imports the LangChain stack and builds the model if needed. Blocking;
+        only the first call does any work, concurrent callers wait for it.
+
+        Returns:
+            module: The ``llm_chain`` module.
+        """
+        with self._load_lock:
+            if self._chain_module is None:
+                from . import llm_chain
+                if self.llm is None:
+                    self.llm = llm_chain.build_llm()
+                self._chain_module = llm_chain
+        return self._chain_module
+
+    async def warm_up(self):
+        """Loads the LangChain stack on a worker thread, logging instead of raising on failure."""
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception:
+            logger.exception("Could not load the AI agent.")
 
-    async def get_comprehensive_analysis(self, news_titles, price_trend, moving_average, current_price, volume_24h):
+    async def get_comprehensive_analysis(self, news_titles, price_trend, moving_average, current_price, volume_24h,
+                                         asset_name="Bitcoin", asset_symbol="BTC", on_partial=None):
         """
         Performs a comprehensive market analysis by invoking the AI chain.
 
         This method preprocesses input data, formats it for the AI model,
-        invokes the analysis chain, and returns the structured output.
+        invokes the analysis chain, and returns the structured output. If an
+        analysis was already produced for materially identical inputs, it is
+        returned from the cache without invoking the model.
+
+        With ``on_partial``, the completion is streamed and its JSON parsed as
+        it arrives: every time a field is complete, ``on_partial`` receives the
+        fields decoded so far. The prompt asks for the sentiment and trend
+        before the reasoning, so they are available long before the end. The
+        returned result is still validated against ComprehensiveAnalysis.
 
         Args:
-            news_titles (list[str]): A list of recent news headlines.
+            news_titles (list[str]): Recent news headlines, one per story, most recent first.
             price_trend (dict): A dictionary describing the price trend.
             moving_average (float): The 7-day moving average.
-            current_price (float): The current Bitcoin price.
+            current_price (float): The current price of the asset.
             volume_24h (float): The 24-hour trading volume.
+            asset_name (str): Display name of the analyzed asset.
+            asset_symbol (str): Ticker symbol of the analyzed asset.
+            on_partial (Callable[[dict], Awaitable[None]] | None): Coroutine function receiving
+                the complete fields of a streamed completion. Not called when the result is cached.
 
         Returns:
             dict: A dictionary containing the structured market analysis,
@@ -80,14 +123,24 @@ class AgentOrchestrator:
                           API error occurs.
             APIQuotaExceededError: If the API call fails due to quota limits.
         """
+        processed_titles = preprocess_news_titles(news_titles, token_budget=self.news_token_budget)
+        fingerprint = None
+        if self.cache is not None:
+            fingerprint = self._fingerprint(
+                self.cache, processed_titles, price_trend, moving_average, current_price, volume_24h, asset_symbol
+            )
+            cached_result = await self.cache.get(fingerprint)
+            if cached_result is not None:
+                return cached_result
+
+        chain_module = self._chain_module or await asyncio.to_thread(self.load)
         if not self.llm:
             raise RuntimeError("AI Agent is not configured. Check GEMINI_API_KEY.")
 
         try:
-            chain = prompt | self.llm | parser
-            processed_titles = preprocess_news_titles(news_titles)
-            
             invoke_payload = {
+                "asset_name": asset_name,
+                "asset_symbol": asset_symbol,
                 "news_titles": "\n".join([f"- {title}" for title in processed_titles]),
                 "price_trend_description": price_trend.get("description", "Neutral"),
                 "moving_average": moving_average,
@@ -95,14 +148,77 @@ class AgentOrchestrator:
                 "volume_24h": volume_24h
             }
 
-            response = await chain.ainvoke(invoke_payload)
-            return response.dict()
-        except ResourceExhausted as e:
+            with metrics.timer('llm', 'comprehensive_analysis'):
+                if on_partial is None:
+                    message = await (chain_module.prompt | self.llm).ainvoke(invoke_payload)
+                    response = chain_module.parser.parse(message.content)
+                else:
+                    message, response = await self._stream(chain_module, invoke_payload, on_partial)
+            self._count_tokens(chain_module, invoke_payload, message)
+            result = response.dict()
+        except chain_module.ResourceExhausted as e:
             raise APIQuotaExceededError("The analysis service is temporarily unavailable due to API quota limits.") from e
-        except GoogleAPICallError as e:
+        except chain_module.GoogleAPICallError as e:
             raise RuntimeError(f"An error occurred while communicating with the AI service: {e}") from e
         except Exception as e:
             raise RuntimeError(f"An unexpected error occurred in comprehensive analysis: {e}") from e
 
+        if fingerprint is not None:
+            await self.cache.set(fingerprint, result)
+        return result
+
+    def fingerprint(self, news_titles, price_trend, moving_average, current_price, volume_24h,
+                    asset_symbol="BTC", **kwargs):
+        """
+        Returns the fingerprint of the inputs of an analysis, as used to look
+        it up in the result cache. Takes the arguments of ``get_comprehensive_analysis``.
 
-agent_orchestrator = AgentOrchestrator(llm)
\ No newline at end of file
+        Returns:
+            str: A hex SHA-256 digest.
+        """
+        processed_titles = preprocess_news_titles(news_titles, token_budget=self.news_token_budget)
+        return self._fingerprint(
+            self.cache or analysis_cache, processed_titles, price_trend, moving_average, current_price,
+            volume_24h, asset_symbol
+        )
+
+    @staticmethod
+    def _fingerprint(result_cache, processed_titles, price_trend, moving_average, current_price, volume_24h,
+                     asset_symbol):
+        return result_cache.fingerprint(
+            asset_symbol, processed_titles, price_trend.get("description", "Neutral"),
+            current_price, moving_average, volume_24h
+        )
+
+    async def _stream(self, chain_module, invoke_payload, on_partial):
+        """Streams the completion, reporting complete fields, and returns the whole message and its parse."""
+        message = None
+        reported = 0
+        async for chunk in (chain_module.prompt | self.llm).astream(invoke_payload):
+            # Adding chunks concatenates their content and sums their token usage.
+            message = chunk if message is None else message + chunk
+            fields = chain_module.parse_partial(message.content)
+            # Only the last decoded field can still be growing.
+            if len(fields) - 1 > reported:
+                reported = len(fields) - 1
+                await on_partial(dict(list(fields.items())[:reported]))
+        if message is None:
+            raise RuntimeError("The model returned an empty completion.")
+        return message, chain_module.parser.parse(message.content)
+
+    @staticmethod
+    def _count_tokens(chain_module, invoke_payload, message):
+        if not metrics.enabled:
+            return
+        usage = getattr(message, 'usage_metadata', None)
+        if usage:
+            metrics.count_tokens(usage.get('input_tokens', 0), usage.get('output_tokens', 0))
+        else:
+            # Models that do not report their usage are estimated from the text.
+            prompt_text = chain_module.prompt.format(**invoke_payload)
+            metrics.count_tokens(estimate_tokens(prompt_text), estimate_tokens(message.content))
+
+
+agent_orchestrator = AgentOrchestrator(
+    cache=analysis_cache, news_token_budget=get_agent_settings()['NEWS_TOKEN_BUDGET']
+)
\ No newline at end of file
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import math
+import threading
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from django.db.models import F
+from django.utils import timezone
+from .conf import app_settings
+from .db_writer import db_writer
+from .models import AnalysisCacheEntry
+
+# Analyses are reused while the news set and trend are unchanged and price,
+# moving average and volume stay within the relative tolerances below.
+DEFAULT_ANALYSIS_CACHE_SETTINGS = {
+    'TTL': 6 * 60 * 60,
+    'MAX_ENTRIES': 500,
+    'PRICE_TOLERANCE': 0.005,
+    'VOLUME_TOLERANCE': 0.05,
+}
+
+
+def get_analysis_cache_settings():
+    """Returns the ANALYSIS_CACHE settings merged over the built-in defaults."""
+    return app_settings('ANALYSIS_CACHE', DEFAULT_ANALYSIS_CACHE_SETTINGS)
+
+
+def quantize(value, tolerance):
+    """
+    Maps a positive value to a bucket on a logarithmic grid with the given relative width.
+
+    Values within roughly ``tolerance`` of each other (e.g. 0.005 = 0.5%) fall into
+    the same bucket, so small price or volume moves do not change the fingerprint.
+
+    Args:
+        value (float): The value to quantize.
+        tolerance (float): Relative width of a bucket.
+
+    Returns:
+        int: The bucket index (0 for non-positive values).
+    """
+    value = float(value or 0)
+    if value <= 0:
+        return 0
+    return math.floor(math.log(value) / math.log1p(tolerance))
+
+
+def build_fingerprint(asset_symbol, processed_titles, trend_description, current_price, moving_average,
+                      volume_24h, price_tolerance, volume_tolerance):
+    """
+    Builds a canonical fingerprint of the inputs sent to the analysis prompt.
+
+    Titles are normalized and sorted so that reordering the news feed does not
+    produce a new fingerprint.
+
+    Returns:
+        str: A hex SHA-256 digest.
+    """
+    canonical = {
+        'asset': asset_symbol,
+        'titles': sorted({' '.join(title.lower().split()) for title in processed_titles}),
+        'trend': trend_description,
+        'price': quantize(current_price, price_tolerance),
+        'moving_average': quantize(moving_average, price_tolerance),
+        'volume': quantize(volume_24h, volume_tolerance),
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Persistent store of AI analysis results keyed by input fingerprint.
+
+    Entries expire ``ttl`` seconds after they were produced. When the store
+    grows past ``max_entries``, the least recently used entries are evicted.
+    Hit and miss counters are kept per process.
+
+    Lookups only read. Their use (``last_used_at`` and ``hit_count``) is
+    collected in memory and written through the database writer thread
+    together with the next stored analysis, or by ``flush``.
+    """
+
+    def __init__(self, ttl, max_entries, price_tolerance, volume_tolerance):
+        """
+        Initializes the AnalysisCache.
+
+        Args:
+            ttl (int): Seconds an analysis stays valid.
+            max_entries (int): Maximum number of stored analyses.
+            price_tolerance (float): Relative tolerance for price and moving average.
+            volume_tolerance (float): Relative tolerance for the 24h volume.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.price_tolerance = price_tolerance
+        self.volume_tolerance = volume_tolerance
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._uses = {}
+
+    @classmethod
+    def from_settings(cls):
+        """Builds a cache from the ANALYSIS_CACHE settings."""
+        config = get_analysis_cache_settings()
+        return cls(
+            ttl=config['TTL'],
+            max_entries=config['MAX_ENTRIES'],
+            price_tolerance=config['PRICE_TOLERANCE'],
+            volume_tolerance=config['VOLUME_TOLERANCE'],
+        )
+
+    def fingerprint(self, asset_symbol, processed_titles, trend_description, current_price, moving_average, volume_24h):
+        """Returns the fingerprint of the given inputs using this cache's tolerances."""
+        return build_fingerprint(
+            asset_symbol, processed_titles, trend_description, current_price, moving_average, volume_24h,
+            self.price_tolerance, self.volume_tolerance,
+        )
+
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Returns the hit and miss counters of this process."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+    def _get(self, fingerprint):
+        now = timezone.now()
+        result = AnalysisCacheEntry.objects.filter(
+            fingerprint=fingerprint,
+            created_at__gte=now - timedelta(seconds=self.ttl),
+        ).values_list('result', flat=True).first()
+        if result is None:
+            self._record(hit=False)
+            return None
+        with self._lock:
+            uses = self._uses.setdefault(fingerprint, [now, 0])
+            uses[0] = now
+            uses[1] += 1
+        self._record(hit=True)
+        return result
+
+    def _take_uses(self):
+        with self._lock:
+            uses, self._uses = self._uses, {}
+        return uses
+
+    @staticmethod
+    def _write_uses(uses):
+        for fingerprint, (last_used_at, hits) in uses.items():
+            AnalysisCacheEntry.objects.filter(fingerprint=fingerprint).update(
+                last_used_at=last_used_at, hit_count=F('hit_count') + hits
+            )
+
+    @db_writer.write
+    def _set(self, fingerprint, result, uses):
+        now = timezone.now()
+        self._write_uses(uses)
+        AnalysisCacheEntry.objects.update_or_create(
+            fingerprint=fingerprint,
+            defaults={'result': result, 'created_at': now, 'last_used_at': now, 'hit_count': 0},
+        )
+        self._evict(now)
+
+    @db_writer.write
+    def _flush(self, uses):
+        self._write_uses(uses)
+
+    def _evict(self, now):
+        AnalysisCacheEntry.objects.filter(created_at__lt=now - timedelta(seconds=self.ttl)).delete()
+        stale_ids = list(
+            AnalysisCacheEntry.objects.order_by('-last_used_at').values_list('pk', flat=True)[self.max_entries:]
+        )
+        if stale_ids:
+            AnalysisCacheEntry.objects.filter(pk__in=stale_ids).delete()
+
+    async def get(self, fingerprint):
+        """
+        Returns the stored analysis for ``fingerprint`` if it has not expired.
+
+        Returns:
+            dict | None: The analysis, conforming to ComprehensiveAnalysis.
+        """
+        return await sync_to_async(self._get)(fingerprint)
+
+    async def set(self, fingerprint, result):
+        """Stores an analysis under ``fingerprint`` and evicts expired or excess entries."""
+        await self._set(fingerprint, result, self._take_uses())
+
+    async def flush(self):
+        """Writes the use of the entries looked up since the last write."""
+        uses = self._take_uses()
+        if uses:
+            await self._flush(uses)
+
+
+analysis_cache = AnalysisCache.from_settings()
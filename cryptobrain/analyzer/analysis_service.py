@@ -0,0 +1,333 @@
+import asyncio
+import logging
+import time
+from django.core.cache import cache
+from django.utils import timezone
+from .agent import agent_orchestrator, get_agent_settings, APIQuotaExceededError
+from .assets import get_tracked_assets
+from .coalescing import single_flight
+from .indicators import indicator_engines, pending_since, feed_series, sync_indicators
+from .jobs import analysis_jobs
+from .live import publish
+from .models import AnalysisJob
+from .processor import rule_based_analysis
+from .storage import get_analysis_inputs_from_db
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_TIMEOUT = 900
+# How long a requested analysis in progress, or its failure, is remembered.
+# The model is given up on once the progress has expired.
+ANALYSIS_PROGRESS_TIMEOUT = 120
+ANALYSIS_ERROR_TIMEOUT = 30
+SLOW_ANALYSIS_MESSAGE = 'The AI analysis is taking longer than usual.'
+# Stories offered to the agent, which keeps as many as fit its news token budget.
+NEWS_STORIES = 20
+
+
+class AnalysisUnavailableError(Exception):
+    """Raised when the analysis context cannot be built. The message is shown to the user."""
+    pass
+
+
+def analysis_cache_key(asset_id):
+    """Returns the cache key of the rendered analysis context of an asset."""
+    return f'analysis_data:{asset_id}'
+
+
+def _demand_key(asset_id):
+    return f'analysis_demand:{asset_id}'
+
+
+def _progress_key(asset_id):
+    return f'analysis_progress:{asset_id}'
+
+
+def _fallback_key(asset_id):
+    return f'analysis_fallback:{asset_id}'
+
+
+async def record_analysis_demand(asset_id, window):
+    """Marks an asset as viewed so scheduled refreshes keep its analysis warm for ``window`` seconds."""
+    await cache.aset(_demand_key(asset_id), time.time(), timeout=window)
+
+
+def analysis_context(analysis_result, streaming=False, fallback_reason=None):
+    """
+    Maps an analysis result to the template context of the analysis partial.
+
+    Args:
+        analysis_result (dict): The fields of a ComprehensiveAnalysis, possibly
+            only the first ones of a streamed analysis.
+        streaming (bool): Whether the remaining fields are still being generated.
+        fallback_reason (str | None): Marks a rule-based analysis, with the
+            reason the model's analysis is not shown.
+
+    Returns:
+        dict: The template context. Predictions that are not decoded yet are left out.
+    """
+    confidence = analysis_result.get('confidence_score')
+    confidence_percentage = None if confidence is None else round(confidence * 100)
+    context = {
+        'analysis_summary': analysis_result.get('analysis_summary'),
+        'last_updated': timezone.now().strftime('%H:%M:%S'),
+        'streaming': streaming,
+        'fallback_reason': fallback_reason,
+    }
+    if 'market_sentiment' in analysis_result:
+        context['sentiment_prediction'] = {
+            'sentiment': analysis_result['market_sentiment'],
+            'confidence_percentage': confidence_percentage,
+        }
+    if 'trend_prediction' in analysis_result:
+        context['trend_prediction'] = {
+            'prediction': analysis_result['trend_prediction'],
+            'confidence_percentage': confidence_percentage,
+            'reasoning': analysis_result.get('detailed_reasoning'),
+        }
+    return context
+
+
+async def collect_analysis_inputs(asset):
+    """
+    Reads the precomputed technical indicators and the latest news into the
+    inputs of an analysis.
+
+    Args:
+        asset (dict): The tracked asset to analyze.
+
+    Returns:
+        dict: The keyword arguments of ``AgentOrchestrator.get_comprehensive_analysis``,
+            JSON serializable.
+
+    Raises:
+        AnalysisUnavailableError: If the data is unavailable.
+    """
+    engine = indicator_engines.get(asset['id'])
+    try:
+        series, news_items = await get_analysis_inputs_from_db(
+            asset['id'], since=pending_since(engine), news_limit=NEWS_STORIES
+        )
+    except Exception as e:
+        raise AnalysisUnavailableError('Could not retrieve market data for analysis.') from e
+
+    feed_series(engine, series)
+    indicators = engine.snapshot()
+    if not indicators['count'] or not news_items:
+        raise AnalysisUnavailableError('Not enough data for analysis. Please refresh in a moment.')
+
+    return {
+        'current_price': indicators['price'],
+        'volume_24h': indicators['volume_24h'] or 0,
+        'price_trend': indicators['trend'],
+        'moving_average': indicators['sma'],
+        'news_titles': [news.title for news in news_items],
+        'asset_name': asset['name'],
+        'asset_symbol': asset['symbol'],
+    }
+
+
+async def request_analysis(asset, priority=AnalysisJob.Priority.USER):
+    """
+    Queues an analysis of the current inputs of an asset. Inputs identical to
+    those of a pending or running job are not queued twice.
+
+    Args:
+        asset (dict): The tracked asset to analyze.
+        priority (AnalysisJob.Priority): The lane of the job.
+
+    Returns:
+        tuple[int, bool]: The id of the job and whether it was newly queued.
+
+    Raises:
+        AnalysisUnavailableError: If the data is unavailable.
+    """
+    inputs = await collect_analysis_inputs(asset)
+    return await analysis_jobs.enqueue(asset['id'], agent_orchestrator.fingerprint(**inputs), inputs, priority)
+
+
+async def build_fallback_context(asset, reason):
+    """
+    Builds the context of a rule-based analysis from the technical indicators.
+
+    Args:
+        asset (dict): The tracked asset to analyze.
+        reason (str): Why the model's analysis is not shown, displayed with it.
+
+    Returns:
+        dict | None: The template context, or None without any price data.
+    """
+    engine = await sync_indicators(asset['id'])
+    indicators = engine.snapshot()
+    if not indicators['count']:
+        return None
+    return analysis_context(rule_based_analysis(indicators), fallback_reason=reason)
+
+
+async def _store_fallback(asset, reason):
+    # A real analysis, even a stale one, is always preferred to the rules.
+    if await cache.aget(analysis_cache_key(asset['id'])) is not None:
+        return
+    try:
+        context = await build_fallback_context(asset, reason)
+    except Exception:
+        logger.exception("Rule-based analysis of %s failed.", asset['id'])
+        return
+    if context is not None:
+        await cache.aset(_fallback_key(asset['id']), context, timeout=ANALYSIS_CACHE_TIMEOUT)
+        await publish('analysis', asset['id'])
+
+
+async def _analyze(inputs, on_partial):
+    try:
+        analysis_result = await agent_orchestrator.get_comprehensive_analysis(**inputs, on_partial=on_partial)
+    except APIQuotaExceededError:
+        raise
+    except Exception as e:
+        raise AnalysisUnavailableError('AI analysis is temporarily unavailable.') from e
+    if not analysis_result:
+        raise AnalysisUnavailableError('AI analysis returned no data.')
+    return analysis_result
+
+
+async def run_analysis_job(job):
+    """
+    Runs a queued analysis, streaming it to the live update subscribers.
+
+    The fields are written to the cache and published as soon as the model
+    has produced them, so the sentiment and trend appear while the reasoning
+    is still being generated. The validated result becomes the cached
+    analysis of the asset.
+
+    If the model has not produced a prediction within AGENT['DEADLINE']
+    seconds of the job being queued, or fails, a rule-based analysis is
+    cached and published in the meantime; the model's result replaces it
+    when it arrives.
+
+    Args:
+        job (AnalysisJob): The claimed job.
+
+    Raises:
+        APIQuotaExceededError: If the API quota is exhausted; the job is retried.
+        AnalysisUnavailableError: If the analysis failed otherwise.
+    """
+    asset = get_tracked_assets().get(job.asset)
+    if asset is None:
+        raise AnalysisUnavailableError(f'{job.asset} is no longer tracked.')
+    asset_id = asset['id']
+    waited = (timezone.now() - job.created_at).total_seconds()
+    deadline = max(get_agent_settings()['DEADLINE'] - waited, 0)
+    decoded = {}
+
+    async def on_partial(fields):
+        decoded.update(fields)
+        await cache.aset(_progress_key(asset_id), {'fields': fields}, timeout=ANALYSIS_PROGRESS_TIMEOUT)
+        await publish('analysis', asset_id)
+
+    task = asyncio.ensure_future(_analyze(job.payload, on_partial))
+    try:
+        # Hedge: race the model against the deadline, then keep waiting for it.
+        done, _ = await asyncio.wait({task}, timeout=deadline)
+        if not done and 'market_sentiment' not in decoded:
+            await _store_fallback(asset, SLOW_ANALYSIS_MESSAGE)
+        try:
+            analysis_result = await asyncio.wait_for(task, max(ANALYSIS_PROGRESS_TIMEOUT - deadline, 0))
+        except asyncio.TimeoutError as e:
+            raise AnalysisUnavailableError('AI analysis timed out.') from e
+    except (AnalysisUnavailableError, APIQuotaExceededError) as e:
+        await cache.aset(_progress_key(asset_id), {'error': str(e)}, timeout=ANALYSIS_ERROR_TIMEOUT)
+        await publish('analysis', asset_id)
+        await _store_fallback(asset, str(e))
+        raise
+
+    await single_flight.store(analysis_cache_key(asset_id), analysis_context(analysis_result), ANALYSIS_CACHE_TIMEOUT)
+    await cache.adelete_many([_progress_key(asset_id), _fallback_key(asset_id)])
+    await publish('analysis', asset_id)
+
+
+async def _request_from_panel(asset):
+    # The progress entry doubles as a marker that the panel already queued an analysis.
+    if not await cache.aadd(_progress_key(asset['id']), {}, timeout=ANALYSIS_PROGRESS_TIMEOUT):
+        return
+    try:
+        await request_analysis(asset, AnalysisJob.Priority.USER)
+    except AnalysisUnavailableError as e:
+        await cache.aset(_progress_key(asset['id']), {'error': str(e)}, timeout=ANALYSIS_ERROR_TIMEOUT)
+        await _store_fallback(asset, str(e))
+
+
+async def get_analysis_progress(asset):
+    """
+    Returns the analysis context of an asset without waiting for the model,
+    so the panel's latency does not depend on the model provider.
+
+    A cached analysis is returned as is, and a stale one is queued for a
+    refresh. Otherwise an analysis is queued in the user lane if the panel
+    has not queued one yet, and the fields it has produced so far are
+    returned, or the rule-based analysis while it has not produced a
+    prediction past its deadline.
+
+    Returns:
+        tuple[dict, bool]: The template context and whether it is the model's complete analysis.
+
+    Raises:
+        AnalysisUnavailableError: If the last analysis failed and no
+            rule-based analysis could be built.
+    """
+    asset_id = asset['id']
+    entry = await cache.aget(analysis_cache_key(asset_id))
+    if entry is not None:
+        if entry['fresh_until'] <= time.time():
+            await _request_from_panel(asset)
+        return entry['value'], True
+    progress = await cache.aget(_progress_key(asset_id))
+    if progress is None:
+        await _request_from_panel(asset)
+        progress = await cache.aget(_progress_key(asset_id)) or {}
+    fields = progress.get('fields', {})
+    if 'market_sentiment' not in fields:
+        fallback = await cache.aget(_fallback_key(asset_id))
+        if fallback is not None:
+            return fallback, False
+    if 'error' in progress:
+        raise AnalysisUnavailableError(progress['error'])
+    return analysis_context(fields, streaming=True), False
+
+
+async def refresh_demanded_analyses(assets, limit):
+    """
+    Queues scheduled refreshes of the analyses of recently viewed assets
+    whose cached analysis is missing or stale.
+
+    Assets nobody has viewed within the demand window are skipped entirely,
+    the most out-of-date analyses go first and at most ``limit`` assets are
+    queued per call. Together with the input fingerprints, which deduplicate
+    queued jobs and key the result cache in the agent, this keeps model calls
+    well below one per asset per cycle.
+
+    Args:
+        assets (list[dict]): The tracked assets.
+        limit (int): Maximum number of assets queued in this call.
+
+    Returns:
+        int: The number of assets whose refresh was queued.
+    """
+    now = time.time()
+    candidates = []
+    for asset in assets:
+        if await cache.aget(_demand_key(asset['id'])) is None:
+            continue
+        entry = await cache.aget(analysis_cache_key(asset['id']))
+        fresh_until = entry['fresh_until'] if entry else 0
+        if fresh_until <= now:
+            candidates.append((fresh_until, asset))
+    candidates.sort(key=lambda candidate: candidate[0])
+
+    queued = 0
+    for _, asset in candidates[:limit]:
+        try:
+            await request_analysis(asset, AnalysisJob.Priority.SCHEDULED)
+            queued += 1
+        except AnalysisUnavailableError as e:
+            logger.info("Scheduled analysis of %s skipped: %s", asset['id'], e)
+    return queued
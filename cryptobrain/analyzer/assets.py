@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.http import Http404
+
+
+def get_tracked_assets():
+    """
+    Returns the tracked assets keyed by CoinGecko id.
+
+    Returns:
+        dict[str, dict]: Each value holds the ``id``, ``symbol`` and ``name`` of the asset.
+    """
+    return {asset_id: {'id': asset_id, **info} for asset_id, info in settings.TRACKED_ASSETS.items()}
+
+
+def get_asset(asset_id):
+    """
+    Returns the description of a tracked asset.
+
+    Raises:
+        Http404: If the asset is not tracked.
+    """
+    assets = get_tracked_assets()
+    if asset_id not in assets:
+        raise Http404(f"Unknown asset: {asset_id}")
+    return assets[asset_id]
+
+
+def get_request_asset(request):
+    """Returns the asset selected by the ``asset`` query parameter, defaulting to DEFAULT_ASSET."""
+    return get_asset(request.GET.get('asset', settings.DEFAULT_ASSET))
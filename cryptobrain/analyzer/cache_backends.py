@@ -0,0 +1,388 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import orjson
+from asgiref.sync import sync_to_async
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.redis import RedisCache as DjangoRedisCache
+
+_ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+)
+_PICKLE_MARKER = b'\x80'
+# Integers stored natively: SQLite and orjson are limited to signed 64 bits.
+_INT_MIN, _INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _is_machine_int(value):
+    return type(value) is int and _INT_MIN <= value <= _INT_MAX
+
+
+class OrjsonSerializer:
+    """
+    Serializes cache values with orjson, falling back to pickle.
+
+    JSON-native values (dicts with string keys, lists, strings, numbers, booleans
+    and None) are encoded with orjson, which is several times faster than
+    pickle. Anything else, including datetimes and model instances, is pickled
+    so it round-trips unchanged. Tuples are JSON-native to orjson and come back
+    as lists. Plain integers within the signed 64-bit range are left as-is so
+    the backends can increment them atomically; larger ones are pickled.
+    """
+
+    def dumps(self, obj):
+        if _is_machine_int(obj):
+            return obj
+        try:
+            return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+        except TypeError:
+            return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        if isinstance(data, int):
+            return data
+        if data[:1] == _PICKLE_MARKER:
+            return pickle.loads(data)
+        try:
+            return int(data)
+        except ValueError:
+            return orjson.loads(data)
+
+
+class ThreadPoolAsyncMixin:
+    """
+    Runs the async cache API on the default thread pool.
+
+    Django's ``BaseCache`` runs ``aget`` and friends through the thread-sensitive
+    executor, which serializes every call outside a request on one thread,
+    and implements ``aget_many`` and ``aincr`` as several round trips. The
+    backends below are safe to call from any thread, so each async call runs
+    its synchronous counterpart once on the thread pool: a call waiting for
+    the backend only holds up its own caller, never the event loop.
+    """
+
+    async def _in_thread(self, method, *args, **kwargs):
+        return await sync_to_async(method, thread_sensitive=False)(*args, **kwargs)
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return await self._in_thread(self.add, key, value, timeout, version)
+
+    async def aget(self, key, default=None, version=None):
+        return await self._in_thread(self.get, key, default, version)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return await self._in_thread(self.set, key, value, timeout, version)
+
+    async def atouch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return await self._in_thread(self.touch, key, timeout, version)
+
+    async def adelete(self, key, version=None):
+        return await self._in_thread(self.delete, key, version)
+
+    async def aget_many(self, keys, version=None):
+        return await self._in_thread(self.get_many, keys, version)
+
+    async def aset_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return await self._in_thread(self.set_many, data, timeout, version)
+
+    async def adelete_many(self, keys, version=None):
+        return await self._in_thread(self.delete_many, keys, version)
+
+    async def aincr(self, key, delta=1, version=None):
+        return await self._in_thread(self.incr, key, delta, version)
+
+    async def aclear(self):
+        return await self._in_thread(self.clear)
+
+    async def acompare_and_set(self, key, expected, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Async version of ``compare_and_set``."""
+        return await self._in_thread(self.compare_and_set, key, expected, value, timeout, version)
+
+    async def acompare_and_delete(self, key, expected, version=None):
+        """Async version of ``compare_and_delete``."""
+        return await self._in_thread(self.compare_and_delete, key, expected, version)
+
+
+class RedisCache(ThreadPoolAsyncMixin, DjangoRedisCache):
+    """
+    Django's Redis backend with orjson serialization and atomic compare-and-set.
+
+    Works with any server speaking the Redis protocol (Redis, Valkey, KeyDB,
+    Dragonfly). Requires the ``redis`` package.
+    """
+
+    _COMPARE_AND_SET = """
+        if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+            return 0
+        end
+        if ARGV[3] == '' then
+            redis.call('SET', KEYS[1], ARGV[2])
+        else
+            redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+        end
+        return 1
+    """
+
+    _COMPARE_AND_DELETE = """
+        if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+            return 0
+        end
+        return redis.call('DEL', KEYS[1])
+    """
+
+    def __init__(self, server, params):
+        options = {'serializer': OrjsonSerializer, **params.get('OPTIONS', {})}
+        super().__init__(server, {**params, 'OPTIONS': options})
+
+    def compare_and_set(self, key, expected, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Atomically replaces the value of ``key`` if it currently equals ``expected``.
+
+        Returns:
+            bool: Whether the value was replaced.
+        """
+        key = self.make_and_validate_key(key, version=version)
+        timeout = self.get_backend_timeout(timeout)
+        if timeout == 0:
+            return self._compare_and_delete(key, expected)
+        serializer = self._cache._serializer
+        client = self._cache.get_client(key, write=True)
+        ttl_ms = '' if timeout is None else int(timeout * 1000)
+        return bool(client.eval(
+            self._COMPARE_AND_SET, 1, key, serializer.dumps(expected), serializer.dumps(value), ttl_ms
+        ))
+
+    def compare_and_delete(self, key, expected, version=None):
+        """
+        Atomically deletes ``key`` if its value currently equals ``expected``.
+
+        Returns:
+            bool: Whether the key was deleted.
+        """
+        return self._compare_and_delete(self.make_and_validate_key(key, version=version), expected)
+
+    def _compare_and_delete(self, key, expected):
+        client = self._cache.get_client(key, write=True)
+        return bool(client.eval(self._COMPARE_AND_DELETE, 1, key, self._cache._serializer.dumps(expected)))
+
+
+_local = threading.local()
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+class SQLiteCache(ThreadPoolAsyncMixin, BaseCache):
+    """
+    Cache backend storing entries in a local SQLite file shared by every
+    process of the machine, with no external service.
+
+    The file runs in WAL mode, so readers never block and a write only holds
+    the lock for a single statement. ``add``, ``incr``, ``compare_and_set``
+    and ``compare_and_delete`` are single conditional statements and thus
+    atomic across processes, which the refresh locks rely on.
+
+    Set LOCATION to the path of the file. OPTIONS accepts the usual
+    MAX_ENTRIES and CULL_FREQUENCY, plus TIMEOUT (seconds a write waits for
+    the file lock).
+    """
+
+    _CULL_EVERY = 200
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = os.fspath(location)
+        self._lock_timeout = params.get('OPTIONS', {}).get('TIMEOUT', 5)
+        self._serializer = OrjsonSerializer()
+        self._writes = 0
+
+    def _connection(self):
+        connections = getattr(_local, 'connections', None)
+        if connections is None or _local.pid != os.getpid():
+            # SQLite connections must not be shared with forked children.
+            connections = _local.connections = {}
+            _local.pid = os.getpid()
+        connection = connections.get(self._path)
+        if connection is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=self._lock_timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._create_table(connection)
+            connections[self._path] = connection
+        return connection
+
+    def _create_table(self, connection):
+        with _init_lock:
+            if self._path in _initialized:
+                return
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)')
+            _initialized.add(self._path)
+
+    def _wrote(self, connection):
+        self._writes += 1
+        if self._writes % self._CULL_EVERY == 0:
+            self._cull(connection)
+
+    def _cull(self, connection):
+        now = time.time()
+        connection.execute('DELETE FROM cache_entries WHERE expires <= ?', (now,))
+        count = connection.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count > self._max_entries:
+            if self._cull_frequency == 0:
+                connection.execute('DELETE FROM cache_entries')
+                return
+            # Entries closest to expiry go first; entries without expiry go last.
+            connection.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                'SELECT key FROM cache_entries ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        connection = self._connection()
+        cursor = connection.execute(
+            'INSERT INTO cache_entries (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache_entries.expires IS NOT NULL AND cache_entries.expires <= ?',
+            (key, self._serializer.dumps(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        self._wrote(connection)
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else self._serializer.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        connection = self._connection()
+        connection.execute(
+            'INSERT INTO cache_entries (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires',
+            (key, self._serializer.dumps(value), self.get_backend_timeout(timeout)),
+        )
+        self._wrote(connection)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._connection().execute(
+            'UPDATE cache_entries SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        backend_keys = list(key_map)
+        connection = self._connection()
+        now = time.time()
+        result = {}
+        for start in range(0, len(backend_keys), 500):
+            chunk = backend_keys[start:start + 500]
+            rows = connection.execute(
+                f'SELECT key, value FROM cache_entries WHERE key IN ({",".join("?" * len(chunk))}) '
+                'AND (expires IS NULL OR expires > ?)',
+                (*chunk, now),
+            )
+            for backend_key, value in rows:
+                result[key_map[backend_key]] = self._serializer.loads(value)
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self.make_and_validate_key(key, version=version), self._serializer.dumps(value), expires)
+            for key, value in data.items()
+        ]
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT INTO cache_entries (key, value, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires',
+                rows,
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        self._wrote(connection)
+        return []
+
+    def delete_many(self, keys, version=None):
+        rows = [(self.make_and_validate_key(key, version=version),) for key in keys]
+        self._connection().executemany('DELETE FROM cache_entries WHERE key = ?', rows)
+
+    def incr(self, key, delta=1, version=None):
+        backend_key = self.make_and_validate_key(key, version=version)
+        row = None
+        if _is_machine_int(delta):
+            # SQLite turns an integer sum that overflows 64 bits into a REAL, which the typeof check rejects.
+            row = self._connection().execute(
+                "UPDATE cache_entries SET value = value + ? "
+                "WHERE key = ? AND typeof(value) = 'integer' AND typeof(value + ?) = 'integer' "
+                "AND (expires IS NULL OR expires > ?) "
+                "RETURNING value",
+                (delta, backend_key, delta, time.time()),
+            ).fetchone()
+        if row is None:
+            # Missing key, a non-integer value or a result beyond 64 bits: fall back to
+            # Django's read-modify-write.
+            return super().incr(key, delta, version=version)
+        return row[0]
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+    def compare_and_set(self, key, expected, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Atomically replaces the value of ``key`` if it currently equals ``expected``.
+
+        Values are compared in their serialized form.
+
+        Returns:
+            bool: Whether the value was replaced.
+        """
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache_entries SET value = ?, expires = ? '
+            'WHERE key = ? AND value = ? AND (expires IS NULL OR expires > ?)',
+            (self._serializer.dumps(value), self.get_backend_timeout(timeout), key,
+             self._serializer.dumps(expected), time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def compare_and_delete(self, key, expected, version=None):
+        """
+        Atomically deletes ``key`` if its value currently equals ``expected``.
+
+        Returns:
+            bool: Whether the key was deleted.
+        """
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'DELETE FROM cache_entries WHERE key = ? AND value = ? AND (expires IS NULL OR expires > ?)',
+            (key, self._serializer.dumps(expected), time.time()),
+        )
+        return cursor.rowcount == 1
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.cache import cache
+from django.db import connections
+from .conf import app_settings
+
+logger = logging.getLogger(__name__)
+
+# Concurrent misses on the same key share one computation. Stale entries are
+# served for STALE_GRACE seconds while a single background refresh runs.
+# LOCK_TIMEOUT bounds how long other processes wait for the lock holder.
+DEFAULT_COALESCING_SETTINGS = {
+    'STALE_GRACE': 300,
+    'LOCK_TIMEOUT': 120,
+    'POLL_INTERVAL': 0.25,
+}
+
+
+def get_coalescing_settings():
+    """Returns the CACHE_COALESCING settings merged over the built-in defaults."""
+    return app_settings('CACHE_COALESCING', DEFAULT_COALESCING_SETTINGS)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent cache misses so that a value is computed once and
+    shared by every caller waiting for it.
+
+    Within a process, the first caller for a key becomes the leader and the
+    others await the same ``concurrent.futures.Future`` (which, unlike an
+    asyncio future, can be awaited from any event loop). Across processes, the
+    leader takes a lock with the atomic ``cache.aadd`` and the other processes
+    poll the cache for its result, so the guarantee spans workers as long as
+    the cache backend is shared.
+
+    Entries are stored with a ``fresh_until`` marker and kept for an extra
+    grace window after it. A stale entry is served immediately while a single
+    background refresh replaces it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._refreshing = set()
+
+    async def get_or_refresh(self, key, compute, timeout, grace=None, on_update=None):
+        """
+        Returns the cached value for ``key``, computing it at most once on a miss.
+
+        Args:
+            key (str): The cache key.
+            compute (Callable[[], Awaitable]): Coroutine function producing the value.
+                Returning None skips caching; exceptions are shared with all waiters.
+            timeout (int): Seconds for which a computed value is considered fresh.
+            grace (int | None): Seconds a stale value may still be served while it is
+                refreshed. Defaults to CACHE_COALESCING['STALE_GRACE'].
+            on_update (Callable[[], None] | None): Called after a newly computed value
+                has been stored, including values stored by a background refresh.
+
+        Returns:
+            The fresh or stale cached value, or the newly computed one.
+        """
+        if grace is None:
+            grace = get_coalescing_settings()['STALE_GRACE']
+
+        entry = await cache.aget(key)
+        if entry is not None:
+            if entry['fresh_until'] <= time.time():
+                self.refresh_in_background(key, compute, timeout, grace, on_update)
+            return entry['value']
+
+        with self._lock:
+            future = self._inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not is_leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            value = await self._compute_with_lock(key, compute, timeout, grace, on_update, wait=True)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def _compute_with_lock(self, key, compute, timeout, grace, on_update, wait):
+        config = get_coalescing_settings()
+        lock_key = f'{key}:lock'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + config['LOCK_TIMEOUT']
+
+        while not await cache.aadd(lock_key, token, timeout=config['LOCK_TIMEOUT']):
+            if not wait:
+                return None
+            # Another process is computing this key; wait for it to publish a result.
+            await asyncio.sleep(config['POLL_INTERVAL'])
+            entry = await cache.aget(key)
+            if entry is not None:
+                return entry['value']
+            if time.monotonic() >= deadline:
+                logger.warning("Timed out waiting for the lock on %s; computing locally.", key)
+                return await self._compute_and_store(key, compute, timeout, grace, on_update)
+
+        try:
+            return await self._compute_and_store(key, compute, timeout, grace, on_update)
+        finally:
+            await self._release_lock(lock_key, token)
+
+    async def _release_lock(self, lock_key, token):
+        # Only the holder may release the lock; backends with an atomic
+        # compare-and-delete make the check race-free across processes.
+        compare_and_delete = getattr(cache, 'acompare_and_delete', None)
+        if compare_and_delete is not None:
+            await compare_and_delete(lock_key, token)
+        elif await cache.aget(lock_key) == token:
+            await cache.adelete(lock_key)
+
+    async def _compute_and_store(self, key, compute, timeout, grace, on_update):
+        value = await compute()
+        if value is not None:
+            await self.store(key, value, timeout, grace)
+            if on_update is not None:
+                on_update()
+        return value
+
+    async def store(self, key, value, timeout, grace=None):
+        """
+        Stores a value computed elsewhere as the entry of ``key``, fresh for
+        ``timeout`` seconds. Arguments are as for ``get_or_refresh``.
+        """
+        if grace is None:
+            grace = get_coalescing_settings()['STALE_GRACE']
+        entry = {'value': value, 'fresh_until': time.time() + timeout}
+        await cache.aset(key, entry, timeout=timeout + grace)
+
+    def refresh_in_background(self, key, compute, timeout, grace=None, on_update=None):
+        """
+        Computes and stores the value of ``key`` on a background thread and returns immediately.
+
+        Nothing is started if a refresh of ``key`` is already running in this
+        process or another process holds its lock. Arguments are as for
+        ``get_or_refresh``.
+        """
+        if grace is None:
+            grace = get_coalescing_settings()['STALE_GRACE']
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                asyncio.run(self._refresh(key, compute, timeout, grace, on_update))
+            except Exception:
+                logger.exception("Background refresh of %s failed.", key)
+            finally:
+                connections.close_all()
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        # A dedicated thread keeps the refresh alive after the request's event loop is gone.
+        threading.Thread(target=run, name=f'cryptobrain-refresh-{key}', daemon=True).start()
+
+    async def _refresh(self, key, compute, timeout, grace, on_update):
+        # Like a request, the refresh runs its database calls on a thread of its
+        # own and closes that thread's connections when it is done; otherwise
+        # every refresh would leave its connections open behind it.
+        async with ThreadSensitiveContext():
+            try:
+                await self._compute_with_lock(key, compute, timeout, grace, on_update, wait=False)
+            finally:
+                await sync_to_async(connections.close_all)()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,18 @@
+from django.conf import settings
+
+
+def app_settings(name, defaults):
+    """
+    Returns a dict setting of the project merged over the defaults of the module using it.
+
+    The defaults live next to the code that uses them, so the project settings
+    only need the keys they change.
+
+    Args:
+        name (str): The name of the setting, e.g. ``'INGESTION'``.
+        defaults (dict): The built-in defaults of the setting.
+
+    Returns:
+        dict: The merged settings.
+    """
+    return {**defaults, **getattr(settings, name, {})}
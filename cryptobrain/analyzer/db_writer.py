@@ -0,0 +1,163 @@
+import asyncio
+import functools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from django.db import close_old_connections, connections, transaction
+from .conf import app_settings
+
+logger = logging.getLogger(__name__)
+
+# Ingestion writes go through a single writer thread. Writes submitted within
+# FLUSH_INTERVAL seconds of each other are committed together, up to MAX_BATCH
+# writes per transaction.
+DEFAULT_DB_WRITER_SETTINGS = {
+    'MAX_BATCH': 64,
+    'FLUSH_INTERVAL': 0.02,
+}
+
+
+def get_db_writer_settings():
+    """Returns the DB_WRITER settings merged over the built-in defaults."""
+    return app_settings('DB_WRITER', DEFAULT_DB_WRITER_SETTINGS)
+
+
+class WriteQueue:
+    """
+    Serializes database writes through a single writer thread.
+
+    SQLite allows one writer at a time, and every commit costs a WAL sync.
+    Writes submitted close together are therefore grouped and committed in
+    one transaction. If a grouped transaction fails, its writes are retried
+    one by one so that a single bad write does not fail the others.
+
+    Decorate a synchronous write function with ``write`` to turn it into a
+    coroutine function that runs on the writer thread, much like
+    ``sync_to_async``.
+    """
+
+    def __init__(self, max_batch, flush_interval):
+        """
+        Initializes the WriteQueue.
+
+        Args:
+            max_batch (int): Maximum number of writes committed in one transaction.
+            flush_interval (float): Seconds to wait for more writes before committing.
+        """
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'writes': 0, 'transactions': 0, 'retried': 0}
+
+    @classmethod
+    def from_settings(cls):
+        """Builds a write queue from the DB_WRITER settings."""
+        config = get_db_writer_settings()
+        return cls(max_batch=config['MAX_BATCH'], flush_interval=config['FLUSH_INTERVAL'])
+
+    def _count(self, **amounts):
+        with self._stats_lock:
+            for field, amount in amounts.items():
+                self.stats[field] += amount
+
+    def snapshot(self):
+        """Returns a consistent copy of the counters of the writer thread."""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues a call of ``func`` on the writer thread.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the return value of ``func``.
+        """
+        future = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cryptobrain-db-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((func, args, kwargs, future))
+        return future
+
+    def write(self, func):
+        """Decorates a synchronous write function so that awaiting it runs it on the writer thread."""
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+        return wrapper
+
+    def close(self, timeout=10):
+        """Commits the pending writes and stops the writer thread."""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(None)
+        thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._execute(batch)
+        connections.close_all()
+
+    def _execute(self, batch):
+        # Writes whose caller was cancelled while queued are dropped; the others
+        # can no longer be cancelled once they are marked as running.
+        batch = [job for job in batch if job[3].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        close_old_connections()
+        try:
+            with transaction.atomic():
+                results = [func(*args, **kwargs) for func, args, kwargs, _ in batch]
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][3].set_exception(e)
+                return
+            logger.warning("Batched write of %d operations failed; retrying them one by one.", len(batch))
+            self._count(retried=len(batch))
+            for job in batch:
+                self._execute_one(job)
+            return
+
+        self._count(transactions=1, writes=len(batch))
+        for (_, _, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _execute_one(self, job):
+        func, args, kwargs, future = job
+        try:
+            with transaction.atomic():
+                result = func(*args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            self._count(transactions=1, writes=1)
+            future.set_result(result)
+
+
+db_writer = WriteQueue.from_settings()
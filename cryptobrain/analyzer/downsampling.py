@@ -0,0 +1,130 @@
+import numpy as np
+from .metrics import metrics
+from .series import PriceSeries
+
+
+@metrics.timed('compute')
+def lttb(series, threshold):
+    """
+    Downsamples a series with the Largest-Triangle-Three-Buckets algorithm.
+
+    LTTB keeps the first and last points and, for every bucket in between,
+    the point that forms the largest triangle with the previously selected
+    point and the average of the next bucket. It preserves the visual shape
+    of a line chart far better than uniform striding.
+
+    Args:
+        series (PriceSeries): The series to downsample.
+        threshold (int): Target number of points (at least 3).
+
+    Returns:
+        PriceSeries: The selected points, or the original series if it is already small enough.
+    """
+    length = len(series)
+    if threshold >= length or threshold < 3:
+        return series
+
+    x = series.timestamps.astype(np.float64)
+    y = series.prices
+    # Bucket boundaries over the points between the first and the last one.
+    edges = np.linspace(1, length - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else length
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs((x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return PriceSeries(series.timestamps[selected], series.prices[selected], series.volumes[selected])
+
+
+@metrics.timed('compute')
+def ohlcv_buckets(series, bucket_ms):
+    """
+    Aggregates a series into fixed time buckets aligned to the epoch.
+
+    The stored volume is a rolling 24h figure, so a bucket reports the last
+    volume observed in it rather than a sum.
+
+    Args:
+        series (PriceSeries): The series to aggregate.
+        bucket_ms (int): Bucket width in milliseconds.
+
+    Returns:
+        dict: Arrays ``timestamps`` (bucket start), ``open``, ``high``, ``low``,
+            ``close``, ``volume`` and ``count`` (ticks per bucket), one entry per
+            non-empty bucket.
+    """
+    if not series:
+        return empty_buckets()
+
+    bucket_ids = series.timestamps // bucket_ms
+    starts = np.flatnonzero(np.r_[True, bucket_ids[1:] != bucket_ids[:-1]])
+    ends = np.r_[starts[1:], len(series)] - 1
+    return {
+        'timestamps': bucket_ids[starts] * bucket_ms,
+        'open': series.prices[starts],
+        'high': np.maximum.reduceat(series.prices, starts),
+        'low': np.minimum.reduceat(series.prices, starts),
+        'close': series.prices[ends],
+        'volume': series.volumes[ends],
+        'count': ends - starts + 1,
+    }
+
+
+def empty_buckets():
+    """Returns an OHLCV bucket dict with no buckets."""
+    empty = np.empty(0, dtype=np.float64)
+    return {
+        'timestamps': np.empty(0, dtype=np.int64),
+        'open': empty, 'high': empty, 'low': empty, 'close': empty, 'volume': empty,
+        'count': np.empty(0, dtype=np.int64),
+    }
+
+
+@metrics.timed('compute')
+def rollup_buckets(buckets, bucket_ms):
+    """
+    Merges OHLCV buckets into wider buckets aligned to the epoch.
+
+    ``bucket_ms`` should be a multiple of the width of the input buckets so
+    that no input bucket straddles two output buckets.
+
+    Args:
+        buckets (dict): Buckets as returned by ``ohlcv_buckets``, ordered by time.
+        bucket_ms (int): Width of the output buckets in milliseconds.
+
+    Returns:
+        dict: The merged buckets, in the same format.
+    """
+    if not len(buckets['timestamps']):
+        return empty_buckets()
+
+    bucket_ids = buckets['timestamps'] // bucket_ms
+    starts = np.flatnonzero(np.r_[True, bucket_ids[1:] != bucket_ids[:-1]])
+    ends = np.r_[starts[1:], len(bucket_ids)] - 1
+    return {
+        'timestamps': bucket_ids[starts] * bucket_ms,
+        'open': buckets['open'][starts],
+        'high': np.maximum.reduceat(buckets['high'], starts),
+        'low': np.minimum.reduceat(buckets['low'], starts),
+        'close': buckets['close'][ends],
+        'volume': buckets['volume'][ends],
+        'count': np.add.reduceat(buckets['count'], starts),
+    }
+
+
+def concat_buckets(*parts):
+    """Concatenates time-ordered, non-overlapping OHLCV bucket dicts."""
+    return {key: np.concatenate([part[key] for part in parts]) for key in empty_buckets()}
@@ -1,81 +1,156 @@
-import aiohttp
+import logging
 import os
+from datetime import datetime
+from .metrics import metrics
+from .series import PriceSeries
+from .upstream import upstream, UpstreamError
 
-async def fetch_bitcoin_price():
-    """Fetches comprehensive Bitcoin market data from CoinGecko."""
-    url = "https://api.coingecko.com/api/v3/coins/bitcoin"
+logger = logging.getLogger(__name__)
+
+
+def _epoch_ms(iso_timestamp):
+    """Converts an ISO 8601 timestamp to epoch milliseconds, or None if it is missing or invalid."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=30) as response:
-                response.raise_for_status()
-                data = await response.json()
-
-                market_data = data.get('market_data', {})
-                price_data = {
-                    'price': market_data.get('current_price', {}).get('usd'),
-                    'total_volume': market_data.get('total_volume', {}).get('usd'),
-                    'price_change_percentage_24h': market_data.get('price_change_percentage_24h'),
-                    'high_24h': market_data.get('high_24h', {}).get('usd'),
-                    'low_24h': market_data.get('low_24h', {}).get('usd'),
-                    'market_cap': market_data.get('market_cap', {}).get('usd'),
-                }
-                if price_data['price'] is not None and price_data['total_volume'] is not None:
-                    return price_data
-                else:
-                    return None
-    except Exception:
+        return int(datetime.fromisoformat(iso_timestamp).timestamp() * 1000)
+    except (TypeError, ValueError):
         return None
 
-async def fetch_bitcoin_historical_price(days=7):
-    """Fetches historical market data for Bitcoin for a given number of days."""
-    url = f"https://api.coingecko.com/api/v3/coins/bitcoin/market_chart?vs_currency=usd&days={days}"
+def _parse_timestamp(iso_timestamp):
+    """Parses an ISO 8601 timestamp into an aware datetime, or None if it is missing, invalid or naive."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=30) as response:
-                response.raise_for_status()
-                data = await response.json()
-                prices = data.get('prices', [])
-                volumes = data.get('total_volumes', [])
-                if not prices or not volumes:
-                    return []
-                volume_map = {v[0]: v[1] for v in volumes}
-                historical_data = [
-                    (p[0], p[1], volume_map.get(p[0]))
-                    for p in prices if p[0] in volume_map
-                ]
-                return historical_data
-    except Exception:
-        return []
+        parsed = datetime.fromisoformat(iso_timestamp)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo is not None else None
+
+@metrics.timed('fetch')
+async def fetch_market_prices(asset_ids):
+    """
+    Fetches market data for several assets from CoinGecko in a single request.
+    The request is conditional, so an unchanged response is neither downloaded
+    nor parsed again.
+
+    Args:
+        asset_ids (list[str]): CoinGecko ids of the assets (at most 250).
+
+    Returns:
+        dict[str, dict] | None: Price data keyed by asset id, or None if nothing
+            changed since the last call. Assets without a price are omitted.
+    """
+    url = "https://api.coingecko.com/api/v3/coins/markets"
+    params = {'vs_currency': 'usd', 'ids': ','.join(asset_ids), 'per_page': 250}
+    try:
+        data = await upstream.provider('coingecko').fetch_json(
+            f"markets:{params['ids']}", url, params=params, conditional=True
+        )
+    except UpstreamError as e:
+        logger.warning("Market prices unavailable: %s", e)
+        return {}
+    if data is None:
+        return None
+
+    prices = {}
+    for market_data in data:
+        price_data = {
+            'price': market_data.get('current_price'),
+            'total_volume': market_data.get('total_volume'),
+            'price_change_percentage_24h': market_data.get('price_change_percentage_24h'),
+            'high_24h': market_data.get('high_24h'),
+            'low_24h': market_data.get('low_24h'),
+            'market_cap': market_data.get('market_cap'),
+            'last_updated': _epoch_ms(market_data.get('last_updated')),
+        }
+        if price_data['price'] is not None and price_data['total_volume'] is not None:
+            prices[market_data.get('id')] = price_data
+    return prices
+
+@metrics.timed('fetch')
+async def fetch_historical_price(asset_id, start, end):
+    """
+    Fetches the historical market data of an asset between two points in time.
 
-async def fetch_bitcoin_news():
-    """Fetches the latest Bitcoin news from CryptoPanic."""
+    Only the requested range is downloaded, so syncing the ticks missing since
+    the latest stored one costs as much as the gap, not the whole window.
+    CoinGecko picks the granularity: 5 minutes for ranges under a day, hourly
+    up to 90 days.
+
+    Args:
+        asset_id (str): CoinGecko id of the asset.
+        start (datetime): Beginning of the range.
+        end (datetime): End of the range.
+
+    Returns:
+        PriceSeries: The points that have both a price and a volume, empty if
+            the request failed.
+    """
+    url = f"https://api.coingecko.com/api/v3/coins/{asset_id}/market_chart/range"
+    params = {'vs_currency': 'usd', 'from': int(start.timestamp()), 'to': int(end.timestamp())}
+    try:
+        return await upstream.provider('coingecko').fetch_json(
+            f"market_chart:{asset_id}", url, params=params,
+            decode=lambda data: PriceSeries.from_market_chart(data.get('prices') or [], data.get('total_volumes') or []),
+        )
+    except UpstreamError as e:
+        logger.warning("Historical prices of %s unavailable: %s", asset_id, e)
+        return PriceSeries.empty()
+
+@metrics.timed('fetch')
+async def fetch_news(assets, since=None):
+    """
+    Fetches the latest news for several assets from CryptoPanic in a single request.
+
+    The request is conditional, and posts published before the newest
+    stored post of an asset are skipped for that asset without being turned
+    into items, so polling an unchanged feed costs next to nothing.
+
+    Args:
+        assets (list[dict]): Tracked assets, each with an ``id`` and a ``symbol``.
+        since (dict[str, datetime | None] | None): Publication time of the newest
+            stored post per asset id. Posts published in the same second are
+            kept; duplicates are dropped when they are saved.
+
+    Returns:
+        list[dict]: News items tagged with the ``asset`` id they mention. A post
+            mentioning several tracked assets yields one item per asset.
+    """
     api_key = os.getenv('CRYPTOPANIC_API_KEY')
     if not api_key:
         return []
-    url = f"https://cryptopanic.com/api/v1/posts/?auth_token={api_key}&currencies=bitcoin"
+    asset_ids_by_symbol = {asset['symbol'].upper(): asset['id'] for asset in assets}
+    currencies = ','.join(asset_ids_by_symbol)
+    url = f"https://cryptopanic.com/api/v1/posts/?auth_token={api_key}&currencies={currencies}"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=30) as response:
-                response_text = await response.text()
-                if response.status != 200:
-                    response.raise_for_status()
-                try:
-                    data = await response.json(content_type=None)
-                except aiohttp.ContentTypeError:
-                    return []
-                news_items = []
-                results = data.get('results')
-                if results is None:
-                    return []
-                for post in results[:20]:
-                    slug = post.get('slug')
-                    if post and slug:
-                        news_items.append({
-                            'title': post.get('title', 'No Title'),
-                            'source': post.get('source', {}).get('title'),
-                            'published_at': post.get('published_at'),
-                            'url': f"https://cryptopanic.com/news/{slug}"
-                        })
-                return news_items
-    except Exception:
-        return []
\ No newline at end of file
+        data = await upstream.provider('cryptopanic').fetch_json(f"posts:{currencies}", url, conditional=True)
+    except UpstreamError as e:
+        logger.warning("News unavailable: %s", e)
+        return []
+    if data is None:
+        return []
+
+    results = data.get('results')
+    if results is None:
+        return []
+    watermarks = {
+        asset_id: newest.replace(microsecond=0) for asset_id, newest in (since or {}).items() if newest is not None
+    }
+    # Posts older than every watermark are skipped before their currencies are read.
+    oldest = min(watermarks.values()) if len(watermarks) == len(asset_ids_by_symbol) else None
+    news_items = []
+    for post in results:
+        slug = post.get('slug')
+        published_at = post.get('published_at') or ''
+        published = _parse_timestamp(published_at)
+        if slug and published is not None and (oldest is None or published >= oldest):
+            codes = {currency.get('code', '').upper() for currency in post.get('currencies') or []}
+            for symbol in codes & asset_ids_by_symbol.keys():
+                asset_id = asset_ids_by_symbol[symbol]
+                if asset_id in watermarks and published < watermarks[asset_id]:
+                    continue
+                news_items.append({
+                    'asset': asset_id,
+                    'title': post.get('title', 'No Title'),
+                    'source': post.get('source', {}).get('title'),
+                    'published_at': published_at,
+                    'url': f"https://cryptopanic.com/news/{slug}"
+                })
+    return news_items
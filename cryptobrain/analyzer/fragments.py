@@ -0,0 +1,129 @@
+import threading
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from .coalescing import single_flight
+from .conf import app_settings
+from .live import data_version
+
+# The HTMX partials are cached as rendered HTML per data version and served with
+# an ETag, so unchanged polls get a 304. TIMEOUT bounds how long a fragment is
+# reused without a version bump (the price chart uses PRICE_CHART['CACHE_TIMEOUT']).
+DEFAULT_FRAGMENT_CACHE_SETTINGS = {
+    'TIMEOUT': 900,
+}
+
+
+def get_fragment_cache_settings():
+    """Returns the FRAGMENT_CACHE settings merged over the built-in defaults."""
+    return app_settings('FRAGMENT_CACHE', DEFAULT_FRAGMENT_CACHE_SETTINGS)
+
+
+class FragmentCache:
+    """
+    Caches the rendered HTML of the dashboard partials, keyed on the data
+    version of their topic.
+
+    Ingestion bumps a topic's version with ``publish`` whenever it stores new
+    data, so a cached fragment is valid exactly as long as the version it was
+    rendered for. The version also makes a strong ETag: a poll carrying the
+    current one in If-None-Match is answered with a 304 after a single cache
+    read, without loading data, rendering a template or sending the body.
+
+    Renders go through ``single_flight``, so concurrent misses for the same
+    fragment render it once. Error fragments are returned but never cached.
+    """
+
+    def __init__(self, timeout):
+        """
+        Initializes the FragmentCache.
+
+        Args:
+            timeout (int): Seconds a rendered fragment stays fresh, as an upper
+                bound for data that changes without a version bump.
+        """
+        self.timeout = timeout
+        self._stats_lock = threading.Lock()
+        self.stats = {'hits': 0, 'renders': 0, 'uncacheable': 0, 'not_modified': 0}
+
+    @classmethod
+    def from_settings(cls):
+        """Builds a fragment cache from the FRAGMENT_CACHE settings."""
+        return cls(timeout=get_fragment_cache_settings()['TIMEOUT'])
+
+    def _count(self, field):
+        with self._stats_lock:
+            self.stats[field] += 1
+
+    def etag(self, topic, asset_id, version, variant=''):
+        """Returns the quoted ETag of a fragment at a data version."""
+        return f'"{topic}-{asset_id}-{version}{f"-{variant}" if variant else ""}"'
+
+    async def get_or_render(self, topic, asset_id, render, variant='', version=None, timeout=None):
+        """
+        Returns a rendered fragment, rendering it at most once per data version.
+
+        Args:
+            topic (str): The live update topic whose data the fragment shows.
+            asset_id (str): The asset the fragment belongs to.
+            render (Callable[[], Awaitable[tuple[str, bool]]]): Coroutine function
+                returning the HTML and whether it may be cached (False for errors).
+            variant (str): Distinguishes fragments of the same topic, e.g. chart ranges.
+            version (int | None): The data version, if the caller already read it.
+            timeout (int | None): Overrides the default freshness in seconds.
+
+        Returns:
+            tuple[bytes, str | None]: The HTML and its ETag, or None for an
+                uncacheable fragment.
+        """
+        if version is None:
+            version = await data_version(topic, asset_id)
+        rendered = {}
+
+        async def compute():
+            html, cacheable = await render()
+            self._count('renders')
+            rendered['html'] = html.encode()
+            return rendered['html'] if cacheable else None
+
+        key = f'fragment:{topic}:{asset_id}:{version}:{variant}'
+        html = await single_flight.get_or_refresh(key, compute, timeout=timeout or self.timeout)
+        if html is not None:
+            if not rendered:
+                self._count('hits')
+            return html, self.etag(topic, asset_id, version, variant)
+
+        self._count('uncacheable')
+        if not rendered:
+            # Waited on another caller whose render could not be cached.
+            html, _ = await render()
+            rendered['html'] = html.encode()
+        return rendered['html'], None
+
+    async def respond(self, request, topic, asset_id, render, variant='', timeout=None):
+        """
+        Serves a fragment, answering with a 304 if the client already has the current version.
+
+        Args:
+            request (HttpRequest): The HTMX request.
+            topic, asset_id, render, variant, timeout: See ``get_or_render``.
+
+        Returns:
+            HttpResponse: The fragment, or a 304 Not Modified with an empty body.
+        """
+        version = await data_version(topic, asset_id)
+        etag = self.etag(topic, asset_id, version, variant)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            self._count('not_modified')
+            response = HttpResponseNotModified()
+        else:
+            html, etag = await self.get_or_render(topic, asset_id, render, variant, version, timeout)
+            response = HttpResponse(html)
+        if etag:
+            response['ETag'] = etag
+            # Browsers revalidate on every poll instead of reusing the fragment blindly.
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+fragment_cache = FragmentCache.from_settings()
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+import weakref
+import aiohttp
+from .conf import app_settings
+
+# One pooled aiohttp session per event loop, reused by every fetcher. Timeouts are in seconds.
+DEFAULT_HTTP_CLIENT_SETTINGS = {
+    'POOL_LIMIT': 100,
+    'LIMIT_PER_HOST': 10,
+    'DNS_CACHE_TTL': 300,
+    'KEEPALIVE_TIMEOUT': 30,
+    'CONNECT_TIMEOUT': 5,
+    'READ_TIMEOUT': 20,
+    'TOTAL_TIMEOUT': 30,
+}
+
+
+def get_http_client_settings():
+    """Returns the HTTP_CLIENT settings merged over the built-in defaults."""
+    return app_settings('HTTP_CLIENT', DEFAULT_HTTP_CLIENT_SETTINGS)
+
+
+class PoolStats:
+    """Thread-safe counters describing how often pooled connections were reused."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+        self.connect_time_total = 0.0
+
+    def increment(self, field, amount=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def as_dict(self):
+        """
+        Returns the counters along with an estimate of the time saved by reuse.
+
+        The estimate multiplies the number of reused connections by the average
+        time it took to establish a new one (DNS + TCP + TLS).
+        """
+        with self._lock:
+            avg_connect = self.connect_time_total / self.connections_created if self.connections_created else 0.0
+            return {
+                'requests': self.requests,
+                'connections_created': self.connections_created,
+                'connections_reused': self.connections_reused,
+                'dns_cache_hits': self.dns_cache_hits,
+                'dns_cache_misses': self.dns_cache_misses,
+                'avg_connect_seconds': avg_connect,
+                'estimated_seconds_saved': avg_connect * self.connections_reused,
+            }
+
+
+class HttpClientPool:
+    """
+    Lifecycle-managed pool of aiohttp sessions shared by all fetchers.
+
+    aiohttp sessions are bound to the event loop that created them, so one
+    session is kept per running loop. In practice a process has one long-lived
+    loop (the ASGI server or the ingestion thread), which means every fetcher
+    reuses the same keep-alive connections and DNS cache.
+    """
+
+    def __init__(self):
+        self.stats = PoolStats()
+        self._sessions = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _build_trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+        stats = self.stats
+
+        async def on_request_start(session, context, params):
+            stats.increment('requests')
+
+        async def on_connection_create_start(session, context, params):
+            context.connect_started = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            stats.increment('connections_created')
+            stats.increment('connect_time_total', time.perf_counter() - context.connect_started)
+
+        async def on_connection_reuseconn(session, context, params):
+            stats.increment('connections_reused')
+
+        async def on_dns_cache_hit(session, context, params):
+            stats.increment('dns_cache_hits')
+
+        async def on_dns_cache_miss(session, context, params):
+            stats.increment('dns_cache_misses')
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    def _create_session(self):
+        config = get_http_client_settings()
+        connector = aiohttp.TCPConnector(
+            limit=config['POOL_LIMIT'],
+            limit_per_host=config['LIMIT_PER_HOST'],
+            ttl_dns_cache=config['DNS_CACHE_TTL'],
+            use_dns_cache=True,
+            keepalive_timeout=config['KEEPALIVE_TIMEOUT'],
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=config['TOTAL_TIMEOUT'],
+            sock_connect=config['CONNECT_TIMEOUT'],
+            sock_read=config['READ_TIMEOUT'],
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self._build_trace_config()],
+        )
+
+    def get_session(self):
+        """
+        Returns the shared session for the running event loop, creating it on first use.
+
+        Returns:
+            aiohttp.ClientSession: A pooled session. Callers must not close it.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.get(loop)
+            if session is None or session.closed:
+                session = self._create_session()
+                self._sessions[loop] = session
+            return session
+
+    async def close(self):
+        """Closes the session that belongs to the running event loop, if any."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+
+http_client = HttpClientPool()
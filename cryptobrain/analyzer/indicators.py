@@ -0,0 +1,300 @@
+import math
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+from .conf import app_settings
+from .processor import describe_trend
+from .storage import get_price_series_from_db
+
+# The indicators are maintained incrementally in memory as ingestion stores new
+# price ticks, over the last WINDOW_DAYS of history.
+DEFAULT_INDICATOR_SETTINGS = {
+    'WINDOW_DAYS': 7,
+    'SMA_WINDOW': 7,
+    'EMA_SPAN': 7,
+}
+
+# Running sums are rebuilt from the window after this many updates to keep
+# floating point drift from the add/subtract cycle bounded.
+REBASE_INTERVAL = 100_000
+
+
+def get_indicator_settings():
+    """Returns the INDICATORS settings merged over the built-in defaults."""
+    return app_settings('INDICATORS', DEFAULT_INDICATOR_SETTINGS)
+
+
+class StreamingIndicators:
+    """
+    Incrementally maintained technical indicators over a sliding time window.
+
+    Every tick is folded in with O(1) amortized work: the SMA and EMA keep
+    running values, the trend slope is an online least-squares fit over running
+    sums, min/max use monotonic deques and volatility keeps running sums of log
+    returns. Ticks older than the window are evicted as new ones arrive.
+    The mean 24h volume over the window is kept the same way.
+
+    The slope is measured per tick, like ``calculate_price_trend``, so both
+    produce the same trend description for the same series.
+    """
+
+    def __init__(self, window_seconds, sma_window, ema_span):
+        """
+        Initializes the StreamingIndicators.
+
+        Args:
+            window_seconds (float): Length of the sliding window for trend, min/max and volatility.
+            sma_window (int): Number of ticks in the simple moving average.
+            ema_span (int): Span of the exponential moving average.
+        """
+        self.window_seconds = window_seconds
+        self.sma_window = sma_window
+        self.ema_alpha = 2.0 / (ema_span + 1)
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_settings(cls):
+        """Builds an engine from the INDICATORS settings."""
+        config = get_indicator_settings()
+        return cls(
+            window_seconds=config['WINDOW_DAYS'] * 86400,
+            sma_window=config['SMA_WINDOW'],
+            ema_span=config['EMA_SPAN'],
+        )
+
+    def reset(self):
+        """Drops every tick and indicator value."""
+        with self._lock:
+            self._window = deque()
+            self._sma_prices = deque()
+            self._sma_sum = 0.0
+            self._ema = None
+            self._min_deque = deque()
+            self._max_deque = deque()
+            self._next_index = 0
+            self._x_ref = 0
+            self._y_ref = 0.0
+            self._sum_x = self._sum_y = self._sum_xy = self._sum_xx = 0.0
+            self._sum_r = self._sum_rr = 0.0
+            self._return_count = 0
+            self._sum_volume = 0.0
+            self._volume_count = 0
+            self._updates_since_rebase = 0
+            self.last_timestamp = None
+            self.last_price = None
+            self.last_volume = None
+
+    def update(self, timestamp, price, volume=None):
+        """
+        Folds a new tick into every indicator.
+
+        Args:
+            timestamp (float): Epoch seconds of the tick.
+            price (float): The price at that time.
+            volume (float | None): The 24h volume reported with the tick.
+
+        Returns:
+            bool: False if the tick was not newer than the last one and was ignored.
+        """
+        price = float(price)
+        with self._lock:
+            if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                return False
+
+            log_return = None
+            if self.last_price and price > 0:
+                log_return = math.log(price / self.last_price)
+
+            if not self._window:
+                self._x_ref = self._next_index
+                self._y_ref = price
+                self._sum_x = self._sum_y = self._sum_xy = self._sum_xx = 0.0
+                self._sum_r = self._sum_rr = 0.0
+                self._return_count = 0
+                self._sum_volume = 0.0
+                self._volume_count = 0
+            if volume is not None:
+                volume = float(volume)
+            x = self._next_index - self._x_ref
+            y = price - self._y_ref
+            self._next_index += 1
+            self._window.append((timestamp, price, x, log_return, volume))
+            self._add_point(x, y, log_return, volume)
+
+            self._sma_prices.append(price)
+            self._sma_sum += price
+            if len(self._sma_prices) > self.sma_window:
+                self._sma_sum -= self._sma_prices.popleft()
+
+            self._ema = price if self._ema is None else self._ema + self.ema_alpha * (price - self._ema)
+
+            while self._min_deque and self._min_deque[-1][1] >= price:
+                self._min_deque.pop()
+            self._min_deque.append((timestamp, price))
+            while self._max_deque and self._max_deque[-1][1] <= price:
+                self._max_deque.pop()
+            self._max_deque.append((timestamp, price))
+
+            self.last_timestamp = timestamp
+            self.last_price = price
+            if volume is not None:
+                self.last_volume = volume
+
+            self._evict(timestamp - self.window_seconds)
+            self._updates_since_rebase += 1
+            if self._updates_since_rebase >= REBASE_INTERVAL:
+                self._rebase()
+            return True
+
+    def _add_point(self, x, y, log_return, volume, sign=1):
+        self._sum_x += sign * x
+        self._sum_y += sign * y
+        self._sum_xy += sign * x * y
+        self._sum_xx += sign * x * x
+        if log_return is not None:
+            self._sum_r += sign * log_return
+            self._sum_rr += sign * log_return * log_return
+            self._return_count += sign
+        if volume is not None:
+            self._sum_volume += sign * volume
+            self._volume_count += sign
+
+    def _evict(self, cutoff):
+        while self._window and self._window[0][0] < cutoff:
+            _, price, x, log_return, volume = self._window.popleft()
+            self._add_point(x, price - self._y_ref, log_return, volume, sign=-1)
+        while self._min_deque and self._min_deque[0][0] < cutoff:
+            self._min_deque.popleft()
+        while self._max_deque and self._max_deque[0][0] < cutoff:
+            self._max_deque.popleft()
+
+    def _rebase(self):
+        points = list(self._window)
+        self._window.clear()
+        self._sum_x = self._sum_y = self._sum_xy = self._sum_xx = 0.0
+        self._sum_r = self._sum_rr = 0.0
+        self._return_count = 0
+        self._sum_volume = 0.0
+        self._volume_count = 0
+        if points:
+            first_x = points[0][2]
+            self._x_ref += first_x
+            self._y_ref = points[0][1]
+            for timestamp, price, x, log_return, volume in points:
+                point = (timestamp, price, x - first_x, log_return, volume)
+                self._window.append(point)
+                self._add_point(point[2], price - self._y_ref, log_return, volume)
+        self._updates_since_rebase = 0
+
+    def _slope(self):
+        n = len(self._window)
+        if n < 2:
+            return 0.0
+        denominator = n * self._sum_xx - self._sum_x ** 2
+        if denominator == 0:
+            return 0.0
+        return (n * self._sum_xy - self._sum_x * self._sum_y) / denominator
+
+    def _mean_price(self):
+        n = len(self._window)
+        return self._sum_y / n + self._y_ref if n else 0.0
+
+    def _volatility(self):
+        n = self._return_count
+        if n < 2:
+            return 0.0
+        variance = (self._sum_rr - self._sum_r ** 2 / n) / (n - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def moving_average(self):
+        """Returns the simple moving average, or 0.0 until enough ticks have arrived."""
+        with self._lock:
+            if len(self._sma_prices) < self.sma_window:
+                return 0.0
+            return self._sma_sum / self.sma_window
+
+    def price_trend(self):
+        """Returns the trend over the window in the same shape as ``calculate_price_trend``."""
+        with self._lock:
+            if len(self._window) < 2:
+                return {"slope": 0.0, "description": "Neutral"}
+            slope = self._slope()
+            return {"slope": slope, "description": describe_trend(slope, self._mean_price())}
+
+    def snapshot(self):
+        """
+        Returns a consistent, point-in-time copy of every indicator.
+
+        Returns:
+            dict: Latest tick, SMA, EMA, trend, rolling min/max, volatility and mean volume.
+        """
+        with self._lock:
+            count = len(self._window)
+            slope = self._slope() if count >= 2 else 0.0
+            mean_price = self._mean_price()
+            return {
+                'count': count,
+                'last_timestamp': self.last_timestamp,
+                'price': self.last_price,
+                'volume_24h': self.last_volume,
+                'sma': self._sma_sum / self.sma_window if len(self._sma_prices) >= self.sma_window else 0.0,
+                'ema': self._ema,
+                'mean_price': mean_price,
+                'trend': {
+                    'slope': slope,
+                    'description': describe_trend(slope, mean_price) if count >= 2 else "Neutral",
+                },
+                'min': self._min_deque[0][1] if self._min_deque else None,
+                'max': self._max_deque[0][1] if self._max_deque else None,
+                'volatility': self._volatility(),
+                'mean_volume': self._sum_volume / self._volume_count if self._volume_count else None,
+            }
+
+
+class IndicatorRegistry:
+    """Holds one StreamingIndicators engine per asset, created on first use."""
+
+    def __init__(self):
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def get(self, asset):
+        """Returns the engine of ``asset``, creating an empty one if needed."""
+        with self._lock:
+            engine = self._engines.get(asset)
+            if engine is None:
+                engine = self._engines[asset] = StreamingIndicators.from_settings()
+            return engine
+
+
+indicator_engines = IndicatorRegistry()
+
+
+async def sync_indicators(asset):
+    """
+    Feeds the engine of ``asset`` the price ticks stored since its last update.
+
+    On first use this loads the whole window; afterwards it only reads the rows
+    written by ingestion (possibly in another process) since the latest tick.
+
+    Returns:
+        StreamingIndicators: The up-to-date engine.
+    """
+    engine = indicator_engines.get(asset)
+    feed_series(engine, await get_price_series_from_db(asset, since=pending_since(engine)))
+    return engine
+
+
+def pending_since(engine):
+    """Returns the time after which ``engine`` has not seen any tick (the start of its window if it is empty)."""
+    if engine.last_timestamp is None:
+        return timezone.now() - timedelta(seconds=engine.window_seconds)
+    return datetime.fromtimestamp(engine.last_timestamp, tz=dt_timezone.utc)
+
+
+def feed_series(engine, series):
+    """Folds the ticks of a PriceSeries into an engine, in order."""
+    for timestamp_ms, price, volume in zip(series.timestamps.tolist(), series.prices.tolist(), series.volumes.tolist()):
+        engine.update(timestamp_ms / 1000, price, None if math.isnan(volume) else volume)
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+from django.core.cache import cache
+from django.utils import timezone
+from .conf import app_settings
+from .http_client import http_client
+from .upstream import upstream
+from .db_writer import db_writer
+from .indicators import indicator_engines, feed_series
+from .analysis_cache import analysis_cache
+from .jobs import analysis_jobs
+from .metrics import metrics
+from .retention import retention_policy
+from .live import publish
+from .assets import get_tracked_assets
+from .fetchers import fetch_market_prices, fetch_historical_price, fetch_news
+from .storage import (
+    save_price_history_bulk,
+    save_single_price_history,
+    save_news_items,
+    get_newest_news_times,
+    get_latest_price_from_db,
+    map_price_data,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Intervals are in seconds. run.py starts the scheduler in-process when AUTOSTART
+# is enabled; `manage.py ingest` runs it standalone.
+DEFAULT_INGESTION_SETTINGS = {
+    'AUTOSTART': True,
+    'PRICE_INTERVAL': 60,
+    'HISTORY_INTERVAL': 900,
+    'NEWS_INTERVAL': 300,
+    'PURGE_INTERVAL': 3600,
+    'BACKFILL_DAYS': 7,
+    'BATCH_SIZE': 500,
+    'ANALYSIS_INTERVAL': 300,
+    'ANALYSIS_MAX_PER_CYCLE': 3,
+    'ANALYSIS_DEMAND_WINDOW': 3600,
+}
+
+
+def market_snapshot_cache_key(asset_id):
+    """Returns the cache key of the latest market snapshot of an asset."""
+    return f'market_snapshot:{asset_id}'
+
+
+def get_ingestion_settings():
+    """Returns the INGESTION settings merged over the built-in defaults."""
+    return app_settings('INGESTION', DEFAULT_INGESTION_SETTINGS)
+
+
+class IngestionScheduler:
+    """
+    Periodically runs the fetchers and persists their results so that request
+    handlers only ever read from the database and the cache.
+
+    The scheduler can run in the foreground (``run_forever``, used by the
+    ``ingest`` management command) or on a daemon thread with its own event
+    loop (``start``, used by ``run.py``). While it runs forever, it also runs
+    the worker pool of the analysis job queue.
+    """
+    def __init__(self, price_interval, history_interval, news_interval,
+                 purge_interval, backfill_days, batch_size,
+                 analysis_interval, analysis_max_per_cycle):
+        """
+        Initializes the IngestionScheduler.
+
+        Args:
+            price_interval (int): Seconds between current price snapshots.
+            history_interval (int): Seconds between historical price syncs.
+            news_interval (int): Seconds between news syncs.
+            purge_interval (int): Seconds between rollups and purges of expired price data.
+            backfill_days (int): Maximum number of days of history to backfill.
+            batch_size (int): Maximum number of rows written per INSERT.
+            analysis_interval (int): Seconds between scheduled analysis refreshes.
+            analysis_max_per_cycle (int): Maximum number of assets analyzed per refresh.
+        """
+        self.price_interval = price_interval
+        self.history_interval = history_interval
+        self.news_interval = news_interval
+        self.purge_interval = purge_interval
+        self.backfill_days = backfill_days
+        self.batch_size = batch_size
+        self.analysis_interval = analysis_interval
+        self.analysis_max_per_cycle = analysis_max_per_cycle
+        self.assets = list(get_tracked_assets().values())
+        self._thread = None
+        self._loop = None
+        self._stop_event = None
+
+    @classmethod
+    def from_settings(cls):
+        """Builds a scheduler from the INGESTION settings."""
+        config = get_ingestion_settings()
+        return cls(
+            price_interval=config['PRICE_INTERVAL'],
+            history_interval=config['HISTORY_INTERVAL'],
+            news_interval=config['NEWS_INTERVAL'],
+            purge_interval=config['PURGE_INTERVAL'],
+            backfill_days=config['BACKFILL_DAYS'],
+            batch_size=config['BATCH_SIZE'],
+            analysis_interval=config['ANALYSIS_INTERVAL'],
+            analysis_max_per_cycle=config['ANALYSIS_MAX_PER_CYCLE'],
+        )
+
+    async def ingest_price(self):
+        """
+        Fetches the market data of every tracked asset in one batched request,
+        stores each snapshot in the cache and records it as a price tick.
+        """
+        prices = await fetch_market_prices([asset['id'] for asset in self.assets])
+        if prices is None:
+            # Nothing changed upstream: keep the current snapshots alive.
+            for asset in self.assets:
+                await cache.atouch(market_snapshot_cache_key(asset['id']), timeout=self.price_interval * 5)
+            return
+        if not prices:
+            logger.warning("Price ingestion skipped: no market data returned.")
+            return
+        for asset_id, price_data in prices.items():
+            # Ticks are stamped with the provider's update time, so serving the
+            # same snapshot again (e.g. while the upstream is unavailable) rewrites
+            # the same tick instead of recording a stale price as a new one.
+            tick = map_price_data(
+                {'price': price_data['price'], 'volume_24h': price_data['total_volume']}, price_data['last_updated']
+            )
+            snapshot = {'price_data': price_data, 'fetched_at': tick['timestamp']}
+            await cache.aset(market_snapshot_cache_key(asset_id), snapshot, timeout=self.price_interval * 5)
+            await save_single_price_history(asset_id, tick)
+            indicator_engines.get(asset_id).update(tick['timestamp'].timestamp(), tick['price'], tick['volume_24h'])
+            await publish('market_data', asset_id)
+
+    async def ingest_history(self):
+        """Backfills the missing history of every tracked asset, one asset at a time."""
+        for asset in self.assets:
+            await self._run_job(self.ingest_asset_history, asset['id'])
+
+    async def ingest_asset_history(self, asset_id):
+        """
+        Fetches the historical prices of an asset missing since its latest stored
+        tick, bounded by ``backfill_days``, and writes them in batches. Only the
+        range after the latest tick is requested.
+        """
+        latest = await get_latest_price_from_db(asset_id)
+        now = timezone.now()
+        start = now - timedelta(days=self.backfill_days)
+        if latest is not None:
+            start = max(start, latest.timestamp)
+
+        series = await fetch_historical_price(asset_id, start, now)
+        if not series:
+            logger.warning("History ingestion for %s skipped: no historical data returned.", asset_id)
+            return
+        if latest is not None:
+            series = series.slice(start_ms=int(latest.timestamp.timestamp() * 1000) + 1)
+        if series:
+            price_data_list = [
+                map_price_data({'price': price, 'volume_24h': volume}, timestamp)
+                for timestamp, price, volume in zip(
+                    series.timestamps.tolist(), series.prices.tolist(), series.volumes.tolist()
+                )
+            ]
+            await save_price_history_bulk(asset_id, price_data_list, batch_size=self.batch_size)
+            feed_series(indicator_engines.get(asset_id), series)
+            await publish('price_chart', asset_id)
+        logger.info("History ingestion stored %d new price points for %s.", len(series), asset_id)
+
+    async def ingest_news(self):
+        """
+        Fetches the latest news of every tracked asset in one request and stores the unseen items.
+
+        Posts older than the newest stored item of the same asset are skipped,
+        so a busy asset does not hide the posts of a quiet one. The watermarks
+        are read from the database, so they only move once a save has
+        committed and survive restarts.
+        """
+        since = await get_newest_news_times([asset['id'] for asset in self.assets])
+        news_items = await fetch_news(self.assets, since=since)
+        if news_items:
+            for asset_id in await save_news_items(news_items, batch_size=self.batch_size):
+                await publish('latest_news', asset_id)
+
+    async def purge(self):
+        """Rolls the price history of every tracked asset up into the retention tiers and drops expired partitions."""
+        for asset in self.assets:
+            deleted = await retention_policy.enforce(asset['id'], batch_size=self.batch_size)
+            if deleted:
+                logger.info("Retention removed %d expired price rows of %s.", deleted, asset['id'])
+        await analysis_jobs.purge()
+        await analysis_cache.flush()
+        logger.info("HTTP pool stats: %s", http_client.stats.as_dict())
+        logger.info("Upstream stats: %s", upstream.stats())
+        logger.info("Analysis job stats: %s", analysis_jobs.stats)
+
+    async def refresh_analyses(self):
+        """Keeps the AI analysis of recently viewed assets warm by queuing scheduled refreshes."""
+        # Imported here so that ingestion does not load the AI stack at import time.
+        from .analysis_service import refresh_demanded_analyses
+        await refresh_demanded_analyses(self.assets, self.analysis_max_per_cycle)
+
+    async def share_metrics(self):
+        """Shares the metrics of this process, which runs the fetchers and the analyses, with the web server."""
+        await metrics.share()
+
+    async def run_analysis_workers(self):
+        """Runs queued analyses until the scheduler stops, retrying on exhausted API quotas."""
+        from .agent import APIQuotaExceededError
+        from .analysis_service import run_analysis_job
+        await analysis_jobs.run(run_analysis_job, (APIQuotaExceededError,), self._stop_event)
+
+    def _jobs(self):
+        return [
+            (self.ingest_price, self.price_interval),
+            (self.ingest_history, self.history_interval),
+            (self.ingest_news, self.news_interval),
+            (self.purge, self.purge_interval),
+            (self.refresh_analyses, self.analysis_interval),
+            (self.share_metrics, metrics.share_interval),
+        ]
+
+    async def _run_job(self, job, *args):
+        try:
+            await job(*args)
+        except Exception:
+            logger.exception("Ingestion job %s%s failed.", job.__name__, args or '')
+
+    async def run_once(self):
+        """Runs every job a single time, backfilling history before anything else."""
+        await self._run_job(self.ingest_history)
+        await asyncio.gather(
+            self._run_job(self.ingest_price),
+            self._run_job(self.ingest_news),
+        )
+        await self._run_job(self.purge)
+
+    async def run_forever(self):
+        """Backfills on startup, then runs every job on its own interval until stopped."""
+        self._stop_event = asyncio.Event()
+        try:
+            await self._run_until_stopped()
+        finally:
+            await http_client.close()
+            db_writer.close()
+
+    async def _run_until_stopped(self):
+        workers = asyncio.create_task(self._run_job(self.run_analysis_workers))
+        try:
+            await self._run_jobs_until_stopped()
+        finally:
+            self._stop_event.set()
+            await workers
+
+    async def _run_jobs_until_stopped(self):
+        await self.run_once()
+
+        loop = asyncio.get_running_loop()
+        next_runs = {job: loop.time() + interval for job, interval in self._jobs()}
+        intervals = dict(self._jobs())
+        while not self._stop_event.is_set():
+            now = loop.time()
+            due = [job for job, next_run in next_runs.items() if next_run <= now]
+            for job in due:
+                next_runs[job] = now + intervals[job]
+            if due:
+                await asyncio.gather(*(self._run_job(job) for job in due))
+            timeout = max(0.0, min(next_runs.values()) - loop.time())
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _thread_main(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self.run_forever())
+        finally:
+            self._loop.close()
+
+    def start(self):
+        """Starts the scheduler on a daemon thread with its own event loop."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._thread_main, name='cryptobrain-ingestion', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Signals the scheduler to stop and waits for the current jobs to finish."""
+        if self._loop and self._stop_event:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread:
+            self._thread.join(timeout)
+
+
+def start_background_ingestion():
+    """
+    Starts the background ingestion scheduler if INGESTION['AUTOSTART'] is enabled.
+
+    Returns:
+        IngestionScheduler | None: The running scheduler, or None if disabled.
+    """
+    if not get_ingestion_settings()['AUTOSTART']:
+        return None
+    scheduler = IngestionScheduler.from_settings()
+    scheduler.start()
+    return scheduler
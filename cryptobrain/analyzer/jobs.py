@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .conf import app_settings
+from .db_writer import db_writer
+from .models import AnalysisJob
+
+logger = logging.getLogger(__name__)
+
+# Analyses are queued in the database and run by the worker pool of the
+# ingestion scheduler, at most CONCURRENCY at once. Jobs requested by the panel
+# run before scheduled refreshes. Exhausted API quotas are retried up to
+# MAX_ATTEMPTS times, BACKOFF seconds later, doubling up to MAX_BACKOFF.
+# Finished jobs are kept for KEEP_HOURS.
+DEFAULT_ANALYSIS_JOBS_SETTINGS = {
+    'CONCURRENCY': 2,
+    'MAX_ATTEMPTS': 4,
+    'BACKOFF': 30,
+    'MAX_BACKOFF': 600,
+    'POLL_INTERVAL': 0.5,
+    'KEEP_HOURS': 24,
+}
+
+ACTIVE_STATUSES = (AnalysisJob.Status.PENDING, AnalysisJob.Status.RUNNING)
+FINISHED_STATUSES = (AnalysisJob.Status.DONE, AnalysisJob.Status.FAILED)
+
+
+def get_analysis_jobs_settings():
+    """Returns the ANALYSIS_JOBS settings merged over the built-in defaults."""
+    return app_settings('ANALYSIS_JOBS', DEFAULT_ANALYSIS_JOBS_SETTINGS)
+
+
+@db_writer.write
+def _enqueue(asset, fingerprint, payload, priority):
+    active = AnalysisJob.objects.filter(fingerprint=fingerprint, status__in=ACTIVE_STATUSES).first()
+    if active is None:
+        try:
+            with transaction.atomic():
+                job = AnalysisJob.objects.create(
+                    asset=asset, fingerprint=fingerprint, payload=payload, priority=priority
+                )
+            return job.pk, True
+        except IntegrityError:
+            # Another process queued the same inputs in the meantime.
+            active = AnalysisJob.objects.get(fingerprint=fingerprint, status__in=ACTIVE_STATUSES)
+    if priority < active.priority:
+        AnalysisJob.objects.filter(pk=active.pk).update(priority=priority)
+    return active.pk, False
+
+
+@sync_to_async
+def _has_due_job(now):
+    return AnalysisJob.objects.filter(status=AnalysisJob.Status.PENDING, run_after__lte=now).exists()
+
+
+@db_writer.write
+def _claim(now):
+    job = AnalysisJob.objects.filter(
+        status=AnalysisJob.Status.PENDING, run_after__lte=now
+    ).order_by('priority', 'run_after', 'pk').first()
+    if job is None:
+        return None
+    # The status check makes the claim safe against pools in other processes.
+    claimed = AnalysisJob.objects.filter(pk=job.pk, status=AnalysisJob.Status.PENDING).update(
+        status=AnalysisJob.Status.RUNNING, attempts=F('attempts') + 1
+    )
+    if not claimed:
+        return None
+    job.status = AnalysisJob.Status.RUNNING
+    job.attempts += 1
+    return job
+
+
+@db_writer.write
+def _finish(job_id, status, error=''):
+    AnalysisJob.objects.filter(pk=job_id).update(status=status, error=error, finished_at=timezone.now())
+
+
+@db_writer.write
+def _retry_later(job_id, run_after, error):
+    AnalysisJob.objects.filter(pk=job_id).update(status=AnalysisJob.Status.PENDING, run_after=run_after, error=error)
+
+
+@db_writer.write
+def _requeue_running():
+    return AnalysisJob.objects.filter(status=AnalysisJob.Status.RUNNING).update(status=AnalysisJob.Status.PENDING)
+
+
+@db_writer.write
+def _purge_finished(before):
+    deleted, _ = AnalysisJob.objects.filter(status__in=FINISHED_STATUSES, finished_at__lt=before).delete()
+    return deleted
+
+
+@sync_to_async
+def get_latest_job(asset):
+    """
+    Returns the state of the most recently queued analysis job of an asset.
+
+    Returns:
+        dict | None: The ``status``, ``attempts``, ``run_after`` and ``error`` of the job.
+    """
+    return AnalysisJob.objects.filter(asset=asset).order_by('-created_at').values(
+        'status', 'attempts', 'run_after', 'error'
+    ).first()
+
+
+class AnalysisJobQueue:
+    """
+    Persistent queue of AI analyses, stored in the database so that no
+    external broker is needed, with a worker pool that runs them.
+
+    Jobs carry the inputs of an analysis and their fingerprint: queueing
+    inputs identical to a pending or running job returns that job instead,
+    moving it to the faster lane if needed. Jobs run by priority lane (user
+    requests before scheduled refreshes), then in order. At most
+    ``concurrency`` analyses run at once, which bounds the concurrent model
+    calls. Retryable failures, such as an exhausted API quota, are retried
+    with exponential backoff.
+
+    Any process may queue jobs; the pool runs in one process, the ingestion
+    scheduler. Writes go through the database writer thread.
+    """
+
+    def __init__(self, concurrency, max_attempts, backoff, max_backoff, poll_interval, keep):
+        """
+        Initializes the AnalysisJobQueue.
+
+        Args:
+            concurrency (int): Maximum number of jobs running at once.
+            max_attempts (int): Attempts of a job before it fails for good.
+            backoff (float): Seconds before the first retry, doubled for every further one.
+            max_backoff (float): Upper bound of the delay between retries in seconds.
+            poll_interval (float): Seconds between checks for due jobs while idle.
+            keep (timedelta): How long finished jobs are kept.
+        """
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.keep = keep
+        self._stats_lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'deduplicated': 0, 'completed': 0, 'retried': 0, 'failed': 0}
+
+    @classmethod
+    def from_settings(cls):
+        """Builds a job queue from the ANALYSIS_JOBS settings."""
+        config = get_analysis_jobs_settings()
+        return cls(
+            concurrency=config['CONCURRENCY'],
+            max_attempts=config['MAX_ATTEMPTS'],
+            backoff=config['BACKOFF'],
+            max_backoff=config['MAX_BACKOFF'],
+            poll_interval=config['POLL_INTERVAL'],
+            keep=timedelta(hours=config['KEEP_HOURS']),
+        )
+
+    def _count(self, field):
+        with self._stats_lock:
+            self.stats[field] += 1
+
+    async def enqueue(self, asset, fingerprint, payload, priority=AnalysisJob.Priority.USER):
+        """
+        Queues an analysis unless one with the same inputs is already pending or running.
+
+        Args:
+            asset (str): The asset id.
+            fingerprint (str): Fingerprint of the inputs.
+            payload (dict): The inputs, JSON serializable.
+            priority (AnalysisJob.Priority): The lane of the job.
+
+        Returns:
+            tuple[int, bool]: The id of the job and whether it was newly queued.
+        """
+        job_id, created = await _enqueue(asset, fingerprint, payload, priority)
+        self._count('enqueued' if created else 'deduplicated')
+        return job_id, created
+
+    async def purge(self):
+        """Deletes the jobs finished longer than ``keep`` ago and returns their number."""
+        return await _purge_finished(timezone.now() - self.keep)
+
+    async def run(self, handler, retryable, stop_event):
+        """
+        Runs queued jobs until ``stop_event`` is set.
+
+        Jobs left running by a previous pool that stopped are queued again
+        first. On stop, the running jobs are cancelled and run again on the
+        next start.
+
+        Args:
+            handler (Callable[[AnalysisJob], Awaitable]): Runs a job; raising fails it.
+            retryable (tuple[type[Exception], ...]): Failures that are retried with backoff.
+            stop_event (asyncio.Event): Stops the pool when set.
+        """
+        requeued = await _requeue_running()
+        if requeued:
+            logger.info("Queued %d interrupted analysis jobs again.", requeued)
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        def release(task):
+            tasks.discard(task)
+            slots.release()
+
+        try:
+            while not stop_event.is_set():
+                await slots.acquire()
+                job = await self._next_job()
+                if job is None:
+                    slots.release()
+                    try:
+                        await asyncio.wait_for(stop_event.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                task = asyncio.create_task(self._execute(job, handler, retryable))
+                tasks.add(task)
+                task.add_done_callback(release)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _next_job(self):
+        now = timezone.now()
+        # A read first keeps the idle polling off the writer thread.
+        if not await _has_due_job(now):
+            return None
+        return await _claim(now)
+
+    async def _execute(self, job, handler, retryable):
+        try:
+            await handler(job)
+        except retryable as e:
+            if job.attempts < self.max_attempts:
+                delay = min(self.backoff * 2 ** (job.attempts - 1), self.max_backoff)
+                logger.info("Analysis job %s of %s failed (%s); retrying in %ds.", job.pk, job.asset, e, delay)
+                await _retry_later(job.pk, timezone.now() + timedelta(seconds=delay), str(e))
+                self._count('retried')
+            else:
+                logger.warning("Analysis job %s of %s failed after %d attempts: %s", job.pk, job.asset, job.attempts, e)
+                await _finish(job.pk, AnalysisJob.Status.FAILED, str(e))
+                self._count('failed')
+        except Exception as e:
+            logger.warning("Analysis job %s of %s failed: %s", job.pk, job.asset, e)
+            await _finish(job.pk, AnalysisJob.Status.FAILED, str(e))
+            self._count('failed')
+        else:
+            await _finish(job.pk, AnalysisJob.Status.DONE)
+            self._count('completed')
+
+
+analysis_jobs = AnalysisJobQueue.from_settings()
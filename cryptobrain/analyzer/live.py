@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from django.core.cache import cache
+from .conf import app_settings
+
+logger = logging.getLogger(__name__)
+
+# Dashboards subscribe to /live/ (Server-Sent Events). Each worker polls the
+# data versions every POLL_INTERVAL seconds and pushes changed fragments.
+# Slow clients keep at most QUEUE_SIZE pending updates.
+DEFAULT_LIVE_UPDATES_SETTINGS = {
+    'POLL_INTERVAL': 1.0,
+    'HEARTBEAT_INTERVAL': 15,
+    'QUEUE_SIZE': 8,
+    'RETRY_MS': 5000,
+}
+
+
+def get_live_updates_settings():
+    """Returns the LIVE_UPDATES settings merged over the built-in defaults."""
+    return app_settings('LIVE_UPDATES', DEFAULT_LIVE_UPDATES_SETTINGS)
+
+
+def _version_key(topic, asset_id):
+    return f'live_version:{topic}:{asset_id}'
+
+
+async def data_version(topic, asset_id):
+    """Returns the current data version of a topic for an asset (0 if it was never published)."""
+    return await cache.aget(_version_key(topic, asset_id), 0)
+
+
+async def publish(topic, asset_id):
+    """
+    Announces that new data is available for a topic of an asset.
+
+    Only a version number is written to the cache, so publishing is cheap and
+    works from any process sharing the cache (the ingestion scheduler, the
+    ``ingest`` command or a server worker). Every worker's hub notices the new
+    version on its next poll and pushes the update to its subscribers.
+    """
+    await cache.aset(_version_key(topic, asset_id), time.time_ns(), timeout=None)
+
+
+def format_event(event, data, retry=None):
+    """
+    Encodes a Server-Sent Events message.
+
+    Args:
+        event (str): The event name.
+        data (str): The payload; multi-line payloads are split across ``data:`` lines.
+        retry (int | None): Reconnection delay in milliseconds to send to the client.
+
+    Returns:
+        bytes: The encoded message.
+    """
+    lines = [f'event: {event}']
+    if retry is not None:
+        lines.append(f'retry: {retry}')
+    lines.extend(f'data: {line}' for line in (data.splitlines() or ['']))
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+class Subscriber:
+    """An SSE connection of one client, fed by the hub through a bounded queue."""
+
+    def __init__(self, asset_id, queue_size):
+        self.asset_id = asset_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, message):
+        """Queues a message, discarding the oldest pending one if the client is not keeping up."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+class LiveHub:
+    """
+    Fans data updates out to the SSE subscribers of this process.
+
+    One poller task per process reads the data versions of every subscribed
+    asset with a single ``cache.aget_many`` per interval. When a version
+    changes, the topic's fragment is rendered once and the same encoded
+    message is queued for every subscriber of that asset, so the rendering
+    cost depends on the number of updates, not on the number of viewers.
+    """
+
+    def __init__(self, poll_interval, queue_size):
+        """
+        Initializes the LiveHub.
+
+        Args:
+            poll_interval (float): Seconds between two reads of the data versions.
+            queue_size (int): Maximum number of pending messages per subscriber.
+        """
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._renderers = {}
+        self._subscribers = {}
+        self._versions = {}
+        self._task = None
+        self.stats = {'published': 0, 'delivered': 0, 'dropped': 0}
+
+    @classmethod
+    def from_settings(cls):
+        """Builds a hub from the LIVE_UPDATES settings."""
+        config = get_live_updates_settings()
+        return cls(poll_interval=config['POLL_INTERVAL'], queue_size=config['QUEUE_SIZE'])
+
+    def register(self, topic, renderer):
+        """
+        Registers the renderer of a topic.
+
+        Args:
+            topic (str): The event name sent to the clients.
+            renderer (Callable[[str], Awaitable[str | None]]): Coroutine function rendering
+                the payload for an asset id. Returning None skips the update.
+        """
+        self._renderers[topic] = renderer
+
+    def subscriber_count(self):
+        """Returns the number of connected subscribers in this process."""
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def subscribe(self, asset_id):
+        """Adds a subscriber for an asset and starts the poller if needed."""
+        subscriber = Subscriber(asset_id, self.queue_size)
+        if asset_id not in self._subscribers:
+            self._subscribers[asset_id] = set()
+            # Clients render the current data on load; only later changes are pushed.
+            for topic in self._renderers:
+                self._versions[(topic, asset_id)] = await data_version(topic, asset_id)
+        self._subscribers[asset_id].add(subscriber)
+        self._ensure_poller()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Removes a subscriber; the poller stops once nobody is subscribed."""
+        subscribers = self._subscribers.get(subscriber.asset_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        self.stats['dropped'] += subscriber.dropped
+        if not subscribers:
+            del self._subscribers[subscriber.asset_id]
+            for topic in self._renderers:
+                self._versions.pop((topic, subscriber.asset_id), None)
+
+    def _ensure_poller(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self):
+        while self._subscribers:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception("Live update poll failed.")
+            await asyncio.sleep(self.poll_interval)
+
+    async def poll_once(self):
+        """Reads the data versions of every subscribed asset and broadcasts the changed topics."""
+        keys = {_version_key(topic, asset_id): (topic, asset_id) for (topic, asset_id) in list(self._versions)}
+        if not keys:
+            return
+        current = await cache.aget_many(list(keys))
+        for key, (topic, asset_id) in keys.items():
+            version = current.get(key, 0)
+            if version != self._versions.get((topic, asset_id)):
+                self._versions[(topic, asset_id)] = version
+                await self.broadcast(topic, asset_id)
+
+    async def broadcast(self, topic, asset_id):
+        """Renders a topic once for an asset and queues it for all of its subscribers."""
+        subscribers = self._subscribers.get(asset_id)
+        if not subscribers:
+            return 0
+        payload = await self._renderers[topic](asset_id)
+        if payload is None:
+            return 0
+        message = format_event(topic, payload)
+        for subscriber in list(subscribers):
+            subscriber.offer(message)
+        self.stats['published'] += 1
+        self.stats['delivered'] += len(subscribers)
+        return len(subscribers)
+
+    async def stream(self, subscriber, heartbeat_interval, retry_ms):
+        """
+        Yields the SSE messages of a subscriber until the client disconnects.
+
+        A comment line is sent every ``heartbeat_interval`` seconds so proxies
+        keep the connection open.
+        """
+        try:
+            yield format_event('connected', '', retry=retry_ms)
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+
+live_hub = LiveHub.from_settings()
@@ -0,0 +1,61 @@
+# The LangChain/Gemini part of the AI agent. Importing it loads LangChain, the
+# Gemini client and pydantic, so AgentOrchestrator only imports it on the first
+# analysis or in the background warm-up, never while the server starts.
+import os
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain.prompts import PromptTemplate
+from langchain.output_parsers import PydanticOutputParser
+from langchain_core.utils.json import parse_json_markdown
+from pydantic import BaseModel, Field
+from google.api_core.exceptions import ResourceExhausted, GoogleAPICallError
+from .prompts import ANALYSIS_PROMPT_TEMPLATE
+
+
+class ComprehensiveAnalysis(BaseModel):
+    """
+    Defines the data structure for a comprehensive market analysis of a crypto asset.
+    This Pydantic model ensures that the AI's output is structured and validated.
+    """
+    market_sentiment: str = Field(description="Overall market sentiment (e.g., 'Bullish', 'Bearish', 'Neutral', 'Cautiously Optimistic').")
+    trend_prediction: str = Field(description="Predicted trend for the next 24-48 hours (e.g., 'Uptrend', 'Downtrend', 'Sideways').")
+    confidence_score: float = Field(description="Confidence in the prediction, from 0.0 (low) to 1.0 (high).")
+    analysis_summary: str = Field(description="A concise summary of the key drivers for the sentiment and trend.")
+    detailed_reasoning: str = Field(description="A detailed, multi-point reasoning for the analysis, synthesizing news and technical indicators.")
+
+parser = PydanticOutputParser(pydantic_object=ComprehensiveAnalysis)
+
+prompt = PromptTemplate(
+    input_variables=["asset_name", "asset_symbol", "news_titles", "price_trend_description", "moving_average", "current_price", "volume_24h"],
+    template=ANALYSIS_PROMPT_TEMPLATE,
+    partial_variables={"format_instructions": parser.get_format_instructions()},
+)
+
+
+def parse_partial(text):
+    """
+    Parses the JSON object of a completion that is still being generated.
+
+    Returns:
+        dict: The fields decoded so far; the last one may be incomplete.
+    """
+    try:
+        data = parse_json_markdown(text)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def build_llm():
+    """
+    Builds the Gemini chat model from the GEMINI_API_KEY environment variable.
+
+    Returns:
+        ChatGoogleGenerativeAI | None: The model, or None if it cannot be configured.
+    """
+    try:
+        gemini_api_key = os.getenv("GEMINI_API_KEY")
+        if not gemini_api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables. The AI agent cannot function.")
+        return ChatGoogleGenerativeAI(model="gemini-1.5-flash", api_key=gemini_api_key, temperature=0.7)
+    except (ValueError, Exception):
+        return None
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = [
+    'CREATE TABLE price_history (id INTEGER PRIMARY KEY AUTOINCREMENT, asset VARCHAR(50) NOT NULL, '
+    'timestamp DATETIME NOT NULL, price DECIMAL NOT NULL, volume_24h DECIMAL NULL)',
+    'CREATE INDEX price_history_asset_timestamp ON price_history (asset, timestamp)',
+]
+READ_QUERY = (
+    'SELECT timestamp, CAST(price AS REAL), CAST(volume_24h AS REAL) FROM price_history '
+    'WHERE asset = ? AND timestamp >= ? ORDER BY timestamp'
+)
+INSERT_QUERY = 'INSERT INTO price_history (asset, timestamp, price, volume_24h) VALUES (?, ?, ?, ?)'
+
+PROFILES = {
+    'rollback journal (previous)': ['PRAGMA journal_mode=DELETE', 'PRAGMA synchronous=FULL'],
+    'production (settings)': None,
+}
+
+
+def _timestamp(dt):
+    return dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks dashboard read latency on SQLite with and without concurrent "
+        "batched writes, for the previous rollback-journal setup and the production "
+        "pragmas from settings. Runs on a temporary database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=7 * 24 * 60, help="Seeded price rows.")
+        parser.add_argument('--readers', type=int, default=4, help="Concurrent reader threads.")
+        parser.add_argument('--duration', type=float, default=3.0, help="Seconds per measurement phase.")
+        parser.add_argument('--write-batch', type=int, default=100, help="Rows inserted per write transaction.")
+
+    def handle(self, *args, **options):
+        for name, pragmas in PROFILES.items():
+            if pragmas is None:
+                pragmas = settings.SQLITE_PRAGMAS
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self._seed(path, pragmas, options['rows'])
+                idle, _ = self._measure(path, pragmas, options['readers'], options['duration'], None)
+                loaded, writes = self._measure(
+                    path, pragmas, options['readers'], options['duration'], options['write_batch']
+                )
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f"  idle:        {self._summary(idle)}")
+            self.stdout.write(f"  under write: {self._summary(loaded)}")
+            self.stdout.write(f"  writes:      {writes / options['duration']:.0f} rows/s committed")
+
+    def _connect(self, path, pragmas):
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        for pragma in pragmas:
+            connection.execute(pragma)
+        return connection
+
+    def _seed(self, path, pragmas, rows):
+        connection = self._connect(path, pragmas)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        start = datetime.now(timezone.utc) - timedelta(minutes=rows)
+        connection.execute('BEGIN IMMEDIATE')
+        connection.executemany(INSERT_QUERY, (
+            ('bitcoin', _timestamp(start + timedelta(minutes=i)), 50000 + i % 500, 1e9) for i in range(rows)
+        ))
+        connection.execute('COMMIT')
+        connection.close()
+
+    def _measure(self, path, pragmas, readers, duration, write_batch):
+        stop = threading.Event()
+        latencies = [[] for _ in range(readers)]
+        written = [0]
+        since = _timestamp(datetime.now(timezone.utc) - timedelta(days=1))
+
+        def read(samples):
+            connection = self._connect(path, pragmas)
+            while not stop.is_set():
+                started = time.perf_counter()
+                connection.execute(READ_QUERY, ('bitcoin', since)).fetchall()
+                samples.append(time.perf_counter() - started)
+            connection.close()
+
+        def write():
+            connection = self._connect(path, pragmas)
+            base = datetime.now(timezone.utc)
+            while not stop.is_set():
+                connection.execute('BEGIN IMMEDIATE')
+                connection.executemany(INSERT_QUERY, (
+                    ('ethereum', _timestamp(base + timedelta(seconds=written[0] + i)), 3000.0, 1e8)
+                    for i in range(write_batch)
+                ))
+                connection.execute('COMMIT')
+                written[0] += write_batch
+            connection.close()
+
+        threads = [threading.Thread(target=read, args=(samples,)) for samples in latencies]
+        if write_batch:
+            threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return [sample for samples in latencies for sample in samples], written[0]
+
+    def _summary(self, samples):
+        samples = sorted(samples)
+        if not samples:
+            return "no reads completed"
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        p99 = samples[int(len(samples) * 0.99) - 1]
+        return (f"{len(samples)} reads, p50 {statistics.median(samples) * 1000:.2f} ms, "
+                f"p95 {p95 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, max {samples[-1] * 1000:.2f} ms")
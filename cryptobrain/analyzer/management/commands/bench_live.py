@@ -0,0 +1,104 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+import aiohttp
+from django.core.management.base import BaseCommand
+from analyzer.live import LiveHub
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the live update fan-out: one rendered fragment broadcast to N "
+        "concurrent SSE subscribers, in-process or against a running server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000, help="Number of concurrent subscribers.")
+        parser.add_argument('--updates', type=int, default=20, help="Number of broadcasts to measure.")
+        parser.add_argument('--payload-bytes', type=int, default=4096, help="Size of the rendered fragment.")
+        parser.add_argument(
+            '--url',
+            help="Open the subscribers as real SSE connections to this /live/ URL of a running "
+                 "ASGI server and measure how many connect, instead of benchmarking in-process.",
+        )
+
+    def handle(self, *args, **options):
+        if options['url']:
+            asyncio.run(self._bench_connections(options['url'], options['clients']))
+        else:
+            asyncio.run(self._bench_fanout(options['clients'], options['updates'], options['payload_bytes']))
+
+    async def _bench_fanout(self, clients, updates, payload_bytes):
+        fragment = '<div>' + 'x' * max(0, payload_bytes - 11) + '</div>'
+        renders = 0
+
+        async def renderer(asset_id):
+            nonlocal renders
+            renders += 1
+            return fragment
+
+        hub = LiveHub(poll_interval=3600, queue_size=8)
+        hub.register('market_data', renderer)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        subscribers = [await hub.subscribe('bitcoin') for _ in range(clients)]
+        streams = [hub.stream(subscriber, heartbeat_interval=3600, retry_ms=5000) for subscriber in subscribers]
+        for stream in streams:
+            await stream.__anext__()  # the initial 'connected' event
+        subscribe_seconds = time.perf_counter() - started
+        memory_per_client = tracemalloc.get_traced_memory()[0] / clients
+        tracemalloc.stop()
+
+        latencies = []
+        for _ in range(updates):
+            started = time.perf_counter()
+            await hub.broadcast('market_data', 'bitcoin')
+            await asyncio.gather(*(stream.__anext__() for stream in streams))
+            latencies.append(time.perf_counter() - started)
+
+        for stream in streams:
+            await stream.aclose()
+
+        self.stdout.write(f"Subscribers: {clients} (connected in {subscribe_seconds * 1000:.1f} ms, "
+                          f"~{memory_per_client / 1024:.1f} KiB each)")
+        self.stdout.write(f"Renders: {renders} for {updates} updates "
+                          f"({hub.stats['delivered']} messages delivered)")
+        self.stdout.write(f"Broadcast to all subscribers: median {statistics.median(latencies) * 1000:.2f} ms, "
+                          f"max {max(latencies) * 1000:.2f} ms")
+        self.stdout.write(f"Per subscriber: {statistics.median(latencies) / clients * 1e6:.2f} us")
+        self.stdout.write(f"Remaining subscribers after disconnect: {hub.subscriber_count()}")
+
+    async def _bench_connections(self, url, clients):
+        connected = 0
+        failed = 0
+        ready = asyncio.Event()
+
+        async def client(session):
+            nonlocal connected, failed
+            try:
+                async with session.get(url) as response:
+                    async for line in response.content:
+                        if line.startswith(b'event: connected'):
+                            connected += 1
+                            break
+                    else:
+                        failed += 1
+                        return
+                    await ready.wait()
+            except Exception:
+                failed += 1
+
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            started = time.perf_counter()
+            tasks = [asyncio.create_task(client(session)) for _ in range(clients)]
+            while connected + failed < clients:
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - started
+            ready.set()
+            await asyncio.gather(*tasks)
+
+        self.stdout.write(f"Connected: {connected}/{clients} SSE clients in {elapsed:.2f} s ({failed} failed)")
@@ -0,0 +1,73 @@
+import asyncio
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from analyzer.metrics import MetricsRegistry, get_metrics_settings
+
+
+def noop(value):
+    return value
+
+
+async def async_noop(value):
+    return value
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the overhead of the metrics instrumentation per call: a plain function "
+        "and coroutine against their timed versions and the timer context manager, and the "
+        "time to render the /metrics/ exposition."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=200_000, help="Calls per timed run.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case.")
+
+    def handle(self, *args, **options):
+        config = get_metrics_settings()
+        registry = MetricsRegistry(enabled=True, buckets=config['BUCKETS'], share_interval=config['SHARE_INTERVAL'])
+        timed = registry.timed('compute')(noop)
+        async_timed = registry.timed('compute')(async_noop)
+
+        def timer(value):
+            with registry.timer('compute', 'noop'):
+                return value
+
+        calls, repeat = options['calls'], options['repeat']
+        cases = [
+            ('function', self._measure(noop, calls, repeat), self._measure(timed, calls, repeat)),
+            ('coroutine', self._measure_async(async_noop, calls, repeat),
+             self._measure_async(async_timed, calls, repeat)),
+            ('timer block', self._measure(noop, calls, repeat), self._measure(timer, calls, repeat)),
+        ]
+        for name, plain, instrumented in cases:
+            self.stdout.write(
+                f"{name:12} plain {plain * 1e9:7.0f} ns, instrumented {instrumented * 1e9:7.0f} ns, "
+                f"overhead {(instrumented - plain) * 1e9:6.0f} ns per call"
+            )
+
+        # A realistic exposition: every stage and operation of the app with observations.
+        for index in range(60):
+            registry.stage_seconds.observe(('db', f'operation_{index}'), index / 1000)
+        started = time.perf_counter()
+        body = registry.render()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"render       {elapsed * 1000:7.2f} ms for {len(body.splitlines())} lines")
+
+    def _measure(self, func, calls, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for value in range(calls):
+                func(value)
+            samples.append((time.perf_counter() - started) / calls)
+        return statistics.median(samples)
+
+    def _measure_async(self, func, calls, repeat):
+        async def run():
+            started = time.perf_counter()
+            for value in range(calls):
+                await func(value)
+            return (time.perf_counter() - started) / calls
+        return statistics.median(asyncio.run(run()) for _ in range(repeat))
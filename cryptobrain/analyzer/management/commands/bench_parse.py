@@ -0,0 +1,103 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+import orjson
+from django.core.management.base import BaseCommand
+from analyzer.series import PriceSeries
+
+
+def previous_market_chart(body):
+    """The previous path: decode the text with ``json``, then match volumes through a dict."""
+    data = json.loads(body.decode('utf-8'))
+    prices = data.get('prices', [])
+    volumes = data.get('total_volumes', [])
+    volume_map = {v[0]: v[1] for v in volumes}
+    return [(p[0], p[1], volume_map.get(p[0])) for p in prices if p[0] in volume_map]
+
+
+def current_market_chart(body):
+    """The current path: decode the bytes with orjson straight into a PriceSeries."""
+    data = orjson.loads(body)
+    return PriceSeries.from_market_chart(data.get('prices') or [], data.get('total_volumes') or [])
+
+
+def previous_markets(body):
+    return json.loads(body.decode('utf-8'))
+
+
+def current_markets(body):
+    return orjson.loads(body)
+
+
+def market_chart_body(points):
+    """A market chart document shaped like CoinGecko's, with ``points`` 5-minute points."""
+    start = 1_700_000_000_000
+    timestamps = [start + i * 300_000 for i in range(points)]
+    return json.dumps({
+        'prices': [[t, 50000 + random.random() * 1000] for t in timestamps],
+        'market_caps': [[t, 1e12 + random.random() * 1e9] for t in timestamps],
+        'total_volumes': [[t, 3e10 + random.random() * 1e9] for t in timestamps],
+    }).encode()
+
+
+def markets_body(assets):
+    """A /coins/markets document with ``assets`` entries."""
+    return json.dumps([
+        {
+            'id': f'asset-{i}', 'symbol': f'a{i}', 'name': f'Asset {i}', 'image': f'https://example.com/{i}.png',
+            'current_price': random.random() * 1000, 'market_cap': random.random() * 1e10,
+            'market_cap_rank': i + 1, 'total_volume': random.random() * 1e9, 'high_24h': 1.0, 'low_24h': 0.5,
+            'price_change_24h': 0.1, 'price_change_percentage_24h': 1.5, 'circulating_supply': 1e9,
+            'total_supply': 2e9, 'max_supply': None, 'ath': 2.0, 'ath_date': '2024-03-14T07:10:36.635Z',
+            'roi': None, 'last_updated': '2026-10-18T10:00:00.000Z',
+        }
+        for i in range(assets)
+    ]).encode()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the decoding of CoinGecko payloads (market charts of several sizes and "
+        "the batched markets document): parse time and peak memory of the previous json + "
+        "dict path and the current orjson + NumPy path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--points', type=int, nargs='+', default=[288, 2016, 105_120],
+            help="Market chart sizes (a day, a week and a year of 5-minute points by default).",
+        )
+        parser.add_argument('--assets', type=int, default=250, help="Entries in the markets document.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per case.")
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        cases = [
+            (f"market chart, {points} points", market_chart_body(points), previous_market_chart, current_market_chart)
+            for points in options['points']
+        ]
+        cases.append((f"markets, {options['assets']} assets", markets_body(options['assets']),
+                      previous_markets, current_markets))
+
+        for name, body, previous, current in cases:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name} ({len(body) / 1024:.0f} KiB)"))
+            for label, parse in (('previous', previous), ('current', current)):
+                elapsed, peak = self._measure(parse, body, options['repeat'])
+                self.stdout.write(f"  {label:8} {elapsed * 1000:8.2f} ms (median), peak {peak / 1024:9.0f} KiB")
+
+    def _measure(self, parse, body, repeat):
+        parse(body)
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            parse(body)
+            samples.append(time.perf_counter() - started)
+        # Peak memory is measured on a separate run, since tracing slows the parse down.
+        tracemalloc.start()
+        result = parse(body)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        return statistics.median(samples), peak
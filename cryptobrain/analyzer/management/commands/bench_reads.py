@@ -0,0 +1,113 @@
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import connection
+from analyzer.models import BitcoinPriceHistory, BitcoinNews
+from analyzer.storage import (
+    get_price_series_from_db,
+    get_latest_news_from_db,
+    get_latest_price_from_db,
+    get_analysis_inputs_from_db,
+)
+
+
+@sync_to_async
+def previous_latest_news(asset, limit=10):
+    return list(BitcoinNews.objects.filter(asset=asset).order_by('-published_at')[:limit])
+
+
+@sync_to_async
+def previous_latest_price(asset):
+    return BitcoinPriceHistory.objects.filter(asset=asset).order_by('-timestamp').first()
+
+
+async def previous_analysis_inputs(asset, since):
+    return await asyncio.gather(get_price_series_from_db(asset, since=since), previous_latest_news(asset))
+
+
+async def current_analysis_inputs(asset, since):
+    return await get_analysis_inputs_from_db(asset, since=since)
+
+
+async def previous_panels(asset, since):
+    return await asyncio.gather(previous_latest_price(asset), previous_latest_news(asset, limit=20))
+
+
+async def current_panels(asset, since):
+    return await asyncio.gather(get_latest_price_from_db(asset), get_latest_news_from_db(asset, limit=20))
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the dashboard database reads on a temporary database: the analysis "
+        "inputs (new ticks and latest news) and the market data and news panels, for "
+        "the previous sync_to_async reads and the current ones, at several concurrency levels."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=7 * 24 * 60, help="Seeded price rows.")
+        parser.add_argument('--requests', type=int, default=400, help="Measured calls per scenario.")
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 8, 32], help="Concurrent callers."
+        )
+
+    def handle(self, *args, **options):
+        scenarios = {
+            'analysis inputs': (previous_analysis_inputs, current_analysis_inputs),
+            'market data + news panels': (previous_panels, current_panels),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            old_name = connection.settings_dict['NAME']
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self._seed(options['rows'])
+                for name, (previous, current) in scenarios.items():
+                    self.stdout.write(self.style.MIGRATE_HEADING(name))
+                    for concurrency in options['concurrency']:
+                        for label, read in (('previous', previous), ('current', current)):
+                            samples = asyncio.run(self._measure(read, options['requests'], concurrency))
+                            self.stdout.write(f"  {label:8} x{concurrency:<3} {self._summary(samples)}")
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _seed(self, rows):
+        now = datetime.now(timezone.utc)
+        BitcoinPriceHistory.objects.bulk_create(
+            BitcoinPriceHistory(asset='bitcoin', timestamp=now - timedelta(minutes=i), price=50000 + i % 500,
+                                volume_24h=1e9)
+            for i in range(rows)
+        )
+        BitcoinNews.objects.bulk_create(
+            BitcoinNews(asset='bitcoin', title=f"Headline {i}", source='bench', url=f'https://example.com/{i}',
+                        published_at=now - timedelta(minutes=i), cluster_key=f'{i:016x}',
+                        cluster_updated_at=now - timedelta(minutes=i))
+            for i in range(200)
+        )
+
+    async def _measure(self, read, requests, concurrency):
+        # A warm indicator engine only reads the ticks of the last few minutes.
+        since = datetime.now(timezone.utc) - timedelta(minutes=5)
+        samples = []
+
+        async def caller(count):
+            for _ in range(count):
+                started = time.perf_counter()
+                await read('bitcoin', since)
+                samples.append(time.perf_counter() - started)
+
+        await read('bitcoin', since)
+        per_caller = max(1, requests // concurrency)
+        await asyncio.gather(*(caller(per_caller) for _ in range(concurrency)))
+        return samples
+
+    def _summary(self, samples):
+        samples = sorted(samples)
+        p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+        return (f"p50 {statistics.median(samples) * 1000:6.2f} ms, p95 {p95 * 1000:6.2f} ms, "
+                f"max {samples[-1] * 1000:6.2f} ms")
@@ -0,0 +1,116 @@
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from analyzer.models import BitcoinPriceHistory
+from analyzer.storage import save_price_history_bulk_sync, save_single_price_history_sync
+
+
+def previous_bulk_save(asset, price_data_list, batch_size):
+    """The previous strategy: read the stored timestamps, then insert the missing rows.
+
+    The timestamps are looked up per batch; a single IN list of every row
+    would exceed SQLite's limit on query parameters for large backfills.
+    """
+    points = iter(price_data_list)
+    while batch := list(islice(points, batch_size)):
+        existing = set(
+            BitcoinPriceHistory.objects.filter(
+                asset=asset, timestamp__in=[p['timestamp'] for p in batch]
+            ).values_list('timestamp', flat=True)
+        )
+        new_prices = [BitcoinPriceHistory(asset=asset, **p) for p in batch if p['timestamp'] not in existing]
+        if new_prices:
+            BitcoinPriceHistory.objects.bulk_create(new_prices, batch_size=batch_size)
+
+
+def previous_single_save(asset, price_data):
+    """The previous strategy for ticks: one ``update_or_create`` per tick."""
+    BitcoinPriceHistory.objects.update_or_create(
+        asset=asset,
+        timestamp=price_data['timestamp'],
+        defaults={'price': price_data['price'], 'volume_24h': price_data['volume_24h']},
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks price history writes on a temporary database: a minute-resolution "
+        "backfill into an empty table, the same backfill again (every row a duplicate), "
+        "and single tick saves, for the previous pre-read strategy and the current upserts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500_000, help="Rows in the backfill.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per INSERT statement.")
+        parser.add_argument('--ticks', type=int, default=2000, help="Single tick saves, half of them updates.")
+
+    def handle(self, *args, **options):
+        start = datetime.now(timezone.utc) - timedelta(minutes=options['rows'])
+        points = [
+            {'timestamp': start + timedelta(minutes=i), 'price': 50000 + i % 500, 'volume_24h': 1e9}
+            for i in range(options['rows'])
+        ]
+        ticks = [
+            {'timestamp': start + timedelta(minutes=i // 2), 'price': 50000 + i, 'volume_24h': 1e9}
+            for i in range(options['ticks'])
+        ]
+        strategies = {
+            'pre-read + insert (previous)': (previous_bulk_save, previous_single_save),
+            'upsert (current)': (save_price_history_bulk_sync, save_single_price_history_sync),
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            old_name = connection.settings_dict['NAME']
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                for name, (bulk_save, single_save) in strategies.items():
+                    self.stdout.write(self.style.MIGRATE_HEADING(name))
+                    BitcoinPriceHistory.objects.all().delete()
+                    self._run("backfill", lambda: bulk_save('bitcoin', points, options['batch_size']),
+                              len(points), len(points))
+                    self._run("re-backfill", lambda: bulk_save('bitcoin', points, options['batch_size']),
+                              len(points), len(points))
+                    BitcoinPriceHistory.objects.all().delete()
+                    self._run("ticks", lambda: [single_save('bitcoin', tick) for tick in ticks],
+                              len(ticks), len({tick['timestamp'] for tick in ticks}))
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, label, write, rows, expected):
+        """
+        Times one write scenario and reports its throughput.
+
+        Args:
+            label (str): Name of the scenario.
+            write (Callable[[], Any]): Performs the writes.
+            rows (int): Rows submitted by ``write``.
+            expected (int): Rows the table must hold afterwards.
+
+        Raises:
+            CommandError: If the table does not hold ``expected`` rows, so a
+                strategy that silently wrote nothing is never reported as fast.
+        """
+        statements = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal statements
+            statements += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            with transaction.atomic():
+                write()
+            elapsed = time.perf_counter() - started
+        stored = BitcoinPriceHistory.objects.count()
+        if stored != expected:
+            raise CommandError(f"{label}: {stored} rows stored, expected {expected}.")
+        self.stdout.write(
+            f"  {label + ':':13} {elapsed:7.2f} s, {rows / elapsed:9.0f} rows/s, "
+            f"{statements} statements, {stored} rows stored"
+        )
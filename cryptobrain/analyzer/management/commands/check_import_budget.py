@@ -0,0 +1,92 @@
+import os
+import re
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Imports a server worker performs before it can serve the dashboard.
+STARTUP_CODE = (
+    "import django; django.setup(); "
+    "import cryptobrain.asgi, cryptobrain.urls"
+)
+# The part of the startup that is the same for every Django project, used as the
+# yardstick of --setup-ratio.
+BASELINE_CODE = "import django; django.setup()"
+# Modules that must only be imported on the first analysis.
+DEFAULT_FORBIDDEN = ['langchain', 'langchain_core', 'langchain_google_genai', 'google.api_core', 'pydantic']
+LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the import time of a server worker with `python -X importtime` and fails "
+        "if it exceeds the budget or imports a module that should be loaded lazily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget-ms', type=float, default=800, help="Maximum total import time.")
+        parser.add_argument(
+            '--setup-ratio', type=float, default=None,
+            help="Maximum total import time as a multiple of the time `django.setup()` takes on the same "
+                 "machine, instead of --budget-ms. Both are slowed down alike by a busy machine.",
+        )
+        parser.add_argument(
+            '--forbid', nargs='*', default=DEFAULT_FORBIDDEN,
+            help="Packages that must not be imported at startup.",
+        )
+        parser.add_argument('--top', type=int, default=10, help="Number of slowest imports to list.")
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help="Measured startups; the fastest is checked, so load on the machine does not fail the budget.",
+        )
+
+    def handle(self, *args, **options):
+        repeat = max(1, options['repeat'])
+        if options['setup_ratio'] is None:
+            imports, total_ms = min(
+                (self._measure(STARTUP_CODE) for _ in range(repeat)), key=lambda measurement: measurement[1]
+            )
+            budget_ms = options['budget_ms']
+        else:
+            # Each startup is paired with a baseline measured right before it, under
+            # the same load; the pair with the lowest ratio is checked.
+            pairs = [(self._measure(BASELINE_CODE)[1], self._measure(STARTUP_CODE)) for _ in range(repeat)]
+            baseline_ms, (imports, total_ms) = min(pairs, key=lambda pair: pair[1][1] / pair[0])
+            budget_ms = options['setup_ratio'] * baseline_ms
+            self.stdout.write(f"django.setup() imports: {baseline_ms:.0f} ms")
+
+        self.stdout.write(f"Startup imports: {len(imports)} modules, {total_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+        top_level = sorted((entry for entry in imports if entry[3] == 0), key=lambda entry: -entry[2])
+        for name, _, cumulative_us, _ in top_level[:options['top']]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+        forbidden = sorted({
+            name for name, _, _, _ in imports
+            if any(name == package or name.startswith(package + '.') for package in options['forbid'])
+        })
+        errors = []
+        if forbidden:
+            errors.append(f"lazily loaded modules imported at startup: {', '.join(forbidden[:10])}")
+        if total_ms > budget_ms:
+            errors.append(f"startup imports take {total_ms:.0f} ms, over the {budget_ms:.0f} ms budget")
+        if errors:
+            raise CommandError('; '.join(errors))
+        self.stdout.write(self.style.SUCCESS("Import budget OK."))
+
+    def _measure(self, code):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'cryptobrain.settings')}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"The startup imports failed:\n{result.stderr[-2000:]}")
+
+        imports = []
+        for line in result.stderr.splitlines():
+            match = LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+        return imports, sum(self_us for _, self_us, _, _ in imports) / 1000
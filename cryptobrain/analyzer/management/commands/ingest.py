@@ -0,0 +1,37 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from analyzer.db_writer import db_writer
+from analyzer.http_client import http_client
+from analyzer.ingestion import IngestionScheduler
+
+
+class Command(BaseCommand):
+    help = "Runs the market data ingestion scheduler (prices, history and news) in the foreground."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Backfill and run every ingestion job a single time, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        scheduler = IngestionScheduler.from_settings()
+        if options['once']:
+            asyncio.run(self._run_once(scheduler))
+            self.stdout.write(self.style.SUCCESS("Ingestion pass completed."))
+            self.stdout.write(f"HTTP pool stats: {http_client.stats.as_dict()}")
+            return
+
+        self.stdout.write("Ingestion scheduler running. Press Ctrl+C to stop.")
+        try:
+            asyncio.run(scheduler.run_forever())
+        except KeyboardInterrupt:
+            self.stdout.write("Ingestion scheduler stopped.")
+
+    async def _run_once(self, scheduler):
+        try:
+            await scheduler.run_once()
+        finally:
+            await http_client.close()
+            db_writer.close()
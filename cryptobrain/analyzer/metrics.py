@@ -0,0 +1,352 @@
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+from .conf import app_settings
+
+# Stage timings and counters are exposed in the Prometheus text format on
+# /metrics/, per process. The ingestion scheduler shares its own every
+# SHARE_INTERVAL seconds through the cache. BUCKETS are in seconds; every bucket
+# is a series of each stage and operation, so keep them few.
+DEFAULT_METRICS_SETTINGS = {
+    'ENABLED': True,
+    'BUCKETS': [0.001, 0.005, 0.01, 0.025, 0.1, 0.25, 1.0, 2.5, 10.0, 30.0],
+    'SHARE_INTERVAL': 15,
+}
+
+SHARED_METRICS_KEY = 'metrics:ingestion'
+
+
+def get_metrics_settings():
+    """Returns the METRICS settings merged over the built-in defaults."""
+    return app_settings('METRICS', DEFAULT_METRICS_SETTINGS)
+
+
+class Histogram:
+    """Thread-safe histogram of observed values, with one series per label combination."""
+
+    def __init__(self, name, help_text, labelnames, buckets):
+        """
+        Initializes the Histogram.
+
+        Args:
+            name (str): Metric name.
+            help_text (str): Description shown in the exposition.
+            labelnames (tuple[str, ...]): Names of the labels of every series.
+            buckets (Sequence[float]): Upper bounds of the buckets, without +Inf.
+        """
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        """Records ``value`` in the series of the ``labels`` tuple."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def family(self):
+        """Returns a copy of the histogram as a metric family, see ``MetricsRegistry.snapshot``."""
+        with self._lock:
+            series = [[list(labels), list(counts), total] for labels, (counts, total) in self._series.items()]
+        return {
+            'name': self.name, 'type': 'histogram', 'help': self.help,
+            'labelnames': list(self.labelnames), 'buckets': list(self.buckets), 'series': series,
+        }
+
+
+class Counter:
+    """Thread-safe monotonic counter, with one series per label combination."""
+
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        """Adds ``amount`` to the series of the ``labels`` tuple."""
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def family(self):
+        """Returns a copy of the counter as a metric family, see ``MetricsRegistry.snapshot``."""
+        with self._lock:
+            series = [[list(labels), value] for labels, value in self._series.items()]
+        return {'name': self.name, 'type': 'counter', 'help': self.help, 'labelnames': list(self.labelnames),
+                'series': series}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _component_families():
+    # Imported here: these modules time their own work through this one.
+    from .analysis_cache import analysis_cache
+    from .db_writer import db_writer
+    from .fragments import fragment_cache
+    from .http_client import http_client
+    from .jobs import analysis_jobs
+    from .live import live_hub
+    from .news_clusters import news_clusters
+    from .upstream import upstream
+
+    fragments = dict(fragment_cache.stats)
+    results = analysis_cache.stats()
+    cache_series = [
+        [['fragment', 'hit'], fragments['hits'] + fragments['not_modified']],
+        [['fragment', 'miss'], fragments['renders']],
+        [['analysis_result', 'hit'], results['hits']],
+        [['analysis_result', 'miss'], results['misses']],
+    ]
+
+    component_series = []
+    circuit_series = []
+    for name, provider_stats in upstream.stats().items():
+        for field, value in provider_stats.items():
+            if field == 'circuit':
+                circuit_series.append([[name], int(value != 'closed')])
+            else:
+                component_series.append([[f'upstream_{name}', field], value])
+    pool_stats = http_client.stats.as_dict()
+    for field in ('requests', 'connections_created', 'connections_reused', 'dns_cache_hits', 'dns_cache_misses'):
+        component_series.append([['http_pool', field], pool_stats[field]])
+    for component, stats in (
+        ('db_writer', db_writer.snapshot()), ('live_hub', live_hub.stats),
+        ('analysis_jobs', analysis_jobs.stats), ('fragment_cache', fragments),
+    ):
+        component_series.extend([[component, field], value] for field, value in dict(stats).items())
+
+    return [
+        {'name': 'cryptobrain_cache_requests_total', 'type': 'counter',
+         'help': "Cache lookups by cache and result.", 'labelnames': ['cache', 'result'], 'series': cache_series},
+        {'name': 'cryptobrain_component_events_total', 'type': 'counter',
+         'help': "Counters kept by the components (upstream providers, HTTP pool, DB writer, live hub, jobs, fragments).",
+         'labelnames': ['component', 'event'], 'series': component_series},
+        {'name': 'cryptobrain_upstream_circuit_open', 'type': 'gauge',
+         'help': "Whether the circuit breaker of an upstream provider is open or half-open.",
+         'labelnames': ['provider'], 'series': circuit_series},
+        {'name': 'cryptobrain_live_subscribers', 'type': 'gauge',
+         'help': "Dashboards connected to the live updates of this process.",
+         'labelnames': [], 'series': [[[], live_hub.subscriber_count()]]},
+        {'name': 'cryptobrain_news_cluster_index_size', 'type': 'gauge',
+         'help': "Titles held in the news cluster index.", 'labelnames': ['asset'],
+         'series': [[[asset], size] for asset, size in news_clusters.sizes().items()]},
+    ]
+
+
+class MetricsRegistry:
+    """
+    Per-process timings and counters, exposed in the Prometheus text format.
+
+    Work is timed per stage (``fetch``, ``db``, ``compute``, ``llm``,
+    ``render``, ``request``) and operation in a single histogram, with the
+    ``timed`` decorator or the ``timer`` context manager. Recording costs two
+    clock reads, a bisection and a short lock; with METRICS['ENABLED'] off,
+    ``timed`` returns the function unchanged.
+
+    The counters the components already keep (upstream providers, HTTP pool,
+    DB writer, live hub, caches, job queue) are read when the metrics are
+    exported rather than recorded twice.
+
+    The ingestion scheduler, which runs the fetchers and the AI analyses,
+    may run in another process than the web server. It shares its snapshot
+    through the cache, and ``render`` exports it next to the local metrics
+    with ``process="ingestion"``. Every series also carries the ``pid`` of
+    its process, so the counters of different web workers, each answering
+    some of the scrapes, are never mistaken for one counter going back and
+    forth.
+    """
+
+    def __init__(self, enabled, buckets, share_interval):
+        """
+        Initializes the MetricsRegistry.
+
+        Args:
+            enabled (bool): Whether anything is recorded.
+            buckets (Sequence[float]): Upper bounds in seconds of the duration buckets.
+            share_interval (int): Seconds between two snapshots shared by the ingestion scheduler.
+        """
+        self.enabled = enabled
+        self.share_interval = share_interval
+        self.stage_seconds = Histogram(
+            'cryptobrain_stage_duration_seconds', "Time spent per stage and operation.",
+            ('stage', 'operation'), buckets,
+        )
+        self.llm_tokens = Counter(
+            'cryptobrain_llm_tokens_total', "Tokens sent to and generated by the model.", ('kind',)
+        )
+
+    @classmethod
+    def from_settings(cls):
+        """Builds a registry from the METRICS settings."""
+        config = get_metrics_settings()
+        return cls(enabled=config['ENABLED'], buckets=config['BUCKETS'], share_interval=config['SHARE_INTERVAL'])
+
+    def timed(self, stage, operation=None):
+        """
+        Decorates a function or coroutine function to record its duration.
+
+        Args:
+            stage (str): The stage label.
+            operation (str | None): The operation label, the function name by default.
+        """
+        def decorator(func):
+            if not self.enabled:
+                return func
+            labels = (stage, operation or func.__name__)
+            observe = self.stage_seconds.observe
+
+            if iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        observe(labels, time.perf_counter() - started)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    observe(labels, time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def timer(self, stage, operation):
+        """Records the duration of the enclosed block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.stage_seconds.observe((stage, operation), time.perf_counter() - started)
+
+    def count_tokens(self, prompt_tokens, completion_tokens):
+        """Adds the token counts of a model call."""
+        if self.enabled:
+            self.llm_tokens.inc(('prompt',), prompt_tokens)
+            self.llm_tokens.inc(('completion',), completion_tokens)
+
+    def snapshot(self):
+        """
+        Returns every metric of this process as plain data that can be cached.
+
+        Returns:
+            list[dict]: Metric families with a ``name``, ``type``, ``help``,
+                ``labelnames`` and ``series`` of ``[label values, value]``; histogram
+                series are ``[label values, bucket counts, sum]`` with ``buckets``.
+        """
+        return [self.stage_seconds.family(), self.llm_tokens.family(), *_component_families()]
+
+    async def share(self):
+        """Publishes the snapshot of the ingestion process for the web server's ``render``."""
+        await cache.aset(SHARED_METRICS_KEY, {'pid': os.getpid(), 'families': self.snapshot()},
+                         timeout=self.share_interval * 4)
+
+    def render(self):
+        """
+        Renders the metrics of this process and the shared ones of the
+        ingestion process in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition.
+        """
+        sources = [(('web', os.getpid()), self.snapshot())]
+        shared = cache.get(SHARED_METRICS_KEY)
+        # Under run.py with a single worker, the scheduler runs in this process.
+        if shared is not None and shared['pid'] != os.getpid():
+            sources.append((('ingestion', shared['pid']), shared['families']))
+
+        families = {}
+        for process, source in sources:
+            for family in source:
+                families.setdefault(family['name'], (family, []))[1].append((process, family))
+
+        lines = []
+        for name, (first, members) in families.items():
+            lines.append(f"# HELP {name} {first['help']}")
+            lines.append(f"# TYPE {name} {first['type']}")
+            for process, family in members:
+                labelnames = ['process', 'pid', *family['labelnames']]
+                if family['type'] == 'histogram':
+                    self._render_histogram(lines, family, labelnames, process)
+                    continue
+                for values, value in family['series']:
+                    lines.append(f"{name}{_format_labels(labelnames, [*process, *values])} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def _render_histogram(self, lines, family, labelnames, process):
+        name = family['name']
+        bounds = [*family['buckets'], float('inf')]
+        for values, counts, total in family['series']:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = _format_labels([*labelnames, 'le'], [*process, *values, _format_value(bound)])
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = _format_labels(labelnames, [*process, *values])
+            lines.append(f"{name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{name}_count{labels} {cumulative}")
+
+
+metrics = MetricsRegistry.from_settings()
+
+
+class RequestTimingMiddleware:
+    """Records the duration of every request under the ``request`` stage, by URL name."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, started)
+        return response
+
+    def _observe(self, request, started):
+        if metrics.enabled:
+            match = request.resolver_match
+            operation = match.url_name if match and match.url_name else 'unmatched'
+            metrics.stage_seconds.observe(('request', operation), time.perf_counter() - started)
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.11 on 2026-10-18 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0004_analysiscacheentry'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bitcoinpricehistory',
+            name='analyzer_bi_timesta_cabbff_idx',
+        ),
+        migrations.AddField(
+            model_name='bitcoinnews',
+            name='asset',
+            field=models.CharField(default='bitcoin', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='bitcoinpricehistory',
+            name='asset',
+            field=models.CharField(default='bitcoin', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='bitcoinnews',
+            name='url',
+            field=models.URLField(),
+        ),
+        migrations.AddIndex(
+            model_name='bitcoinnews',
+            index=models.Index(fields=['asset', 'published_at'], name='analyzer_bi_asset_07b581_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitcoinpricehistory',
+            index=models.Index(fields=['asset', 'timestamp'], name='analyzer_bi_asset_cf6733_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bitcoinnews',
+            constraint=models.UniqueConstraint(fields=('asset', 'url'), name='unique_news_url_per_asset'),
+        ),
+    ]
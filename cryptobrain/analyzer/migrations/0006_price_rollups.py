@@ -0,0 +1,31 @@
+# Generated by Django 5.1.11 on 2026-10-18 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0005_asset_dimension'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asset', models.CharField(default='bitcoin', max_length=50)),
+                ('resolution', models.PositiveIntegerField(help_text='Bucket width in seconds.')),
+                ('bucket_start', models.DateTimeField()),
+                ('open', models.FloatField()),
+                ('high', models.FloatField()),
+                ('low', models.FloatField()),
+                ('close', models.FloatField()),
+                ('volume_24h', models.FloatField(blank=True, null=True)),
+                ('tick_count', models.PositiveIntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('asset', 'resolution', 'bucket_start'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.11 on 2026-10-18 02:23
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_ticks(apps, schema_editor):
+    """Keeps only the most recently saved tick per (asset, timestamp)."""
+    BitcoinPriceHistory = apps.get_model('analyzer', 'BitcoinPriceHistory')
+    duplicates = (
+        BitcoinPriceHistory.objects.values('asset', 'timestamp')
+        .annotate(keep=Max('id'), count=Count('id')).filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        BitcoinPriceHistory.objects.filter(
+            asset=duplicate['asset'], timestamp=duplicate['timestamp']
+        ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0006_price_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ticks, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='bitcoinpricehistory',
+            name='analyzer_bi_asset_cf6733_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='bitcoinpricehistory',
+            constraint=models.UniqueConstraint(fields=('asset', 'timestamp'), name='unique_price_tick_per_asset'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.11 on 2026-10-18 02:40
+
+import hashlib
+from django.db import migrations, models
+
+
+def assign_singleton_clusters(apps, schema_editor):
+    """Puts every stored news item in a cluster of its own, named like analyzer.news_clusters.cluster_key_for."""
+    BitcoinNews = apps.get_model('analyzer', 'BitcoinNews')
+    items = list(BitcoinNews.objects.only('id', 'asset', 'url'))
+    for item in items:
+        item.cluster_key = hashlib.blake2b(f'{item.asset}:{item.url}'.encode(), digest_size=8).hexdigest()
+    BitcoinNews.objects.bulk_update(items, ['cluster_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0007_unique_price_ticks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitcoinnews',
+            name='cluster_key',
+            field=models.CharField(blank=True, default='', help_text='Groups near-duplicate titles of the same story.', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='bitcoinnews',
+            index=models.Index(fields=['asset', 'cluster_key'], name='analyzer_bi_asset_7f7a41_idx'),
+        ),
+        migrations.RunPython(assign_singleton_clusters, migrations.RunPython.noop),
+    ]
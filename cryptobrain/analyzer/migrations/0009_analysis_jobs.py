@@ -0,0 +1,34 @@
+# Generated by Django 5.1.11 on 2026-10-18 02:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0008_news_clusters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asset', models.CharField(max_length=50)),
+                ('fingerprint', models.CharField(help_text='Fingerprint of the analysis inputs.', max_length=64)),
+                ('payload', models.JSONField(help_text='The analysis inputs, as passed to the agent.')),
+                ('priority', models.PositiveSmallIntegerField(choices=[(0, 'User'), (10, 'Scheduled')], default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'priority', 'run_after'], name='analyzer_an_status_8db154_idx'), models.Index(fields=['asset', 'created_at'], name='analyzer_an_asset_3f6f10_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('fingerprint',), name='unique_active_analysis_job')],
+            },
+        ),
+    ]
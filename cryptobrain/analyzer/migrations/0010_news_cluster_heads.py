@@ -0,0 +1,46 @@
+# Generated by Django 5.1.11 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+def mark_cluster_heads(apps, schema_editor):
+    """Makes the earliest item of every cluster name it, with the size and newest publication of the cluster."""
+    BitcoinNews = apps.get_model('analyzer', 'BitcoinNews')
+    heads = {}
+    items = BitcoinNews.objects.order_by('published_at', 'id').only('id', 'asset', 'cluster_key', 'published_at')
+    for item in items.iterator():
+        key = (item.asset, item.cluster_key or f'id:{item.id}')
+        head = heads.get(key)
+        if head is None:
+            item.cluster_size = 1
+            item.cluster_updated_at = item.published_at
+            heads[key] = item
+        else:
+            head.cluster_size += 1
+            head.cluster_updated_at = item.published_at
+    BitcoinNews.objects.bulk_update(heads.values(), ['cluster_size', 'cluster_updated_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0009_analysis_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitcoinnews',
+            name='cluster_size',
+            field=models.PositiveIntegerField(default=1, help_text='Items in the cluster, kept on the item that names it.'),
+        ),
+        migrations.AddField(
+            model_name='bitcoinnews',
+            name='cluster_updated_at',
+            field=models.DateTimeField(blank=True, help_text='Newest publication in the cluster, set only on the item that names it.', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bitcoinnews',
+            index=models.Index(fields=['asset', 'cluster_updated_at'], name='analyzer_bi_asset_989128_idx'),
+        ),
+        migrations.RunPython(mark_cluster_heads, migrations.RunPython.noop),
+    ]
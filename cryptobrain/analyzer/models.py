@@ -2,24 +2,121 @@ from django.db import models
 from django.utils import timezone
 
 class BitcoinPriceHistory(models.Model):
-    """Stores historical price data for Bitcoin."""
+    """Stores historical price data for a tracked asset (Bitcoin by default)."""
+    asset = models.CharField(max_length=50, default='bitcoin')
     timestamp = models.DateTimeField()
     price = models.DecimalField(max_digits=15, decimal_places=2)
     volume_24h = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
 
     class Meta:
-        indexes = [models.Index(fields=['timestamp'])]
+        # The constraint's index also serves the (asset, timestamp) range queries.
+        constraints = [models.UniqueConstraint(fields=['asset', 'timestamp'], name='unique_price_tick_per_asset')]
 
     def __str__(self):
-        return f"{self.timestamp} - ${self.price}"
+        return f"{self.asset} {self.timestamp} - ${self.price}"
+
+class PriceRollup(models.Model):
+    """Stores the OHLCV aggregate of an asset's price history over one fixed-width time bucket."""
+    asset = models.CharField(max_length=50, default='bitcoin')
+    resolution = models.PositiveIntegerField(help_text="Bucket width in seconds.")
+    bucket_start = models.DateTimeField()
+    open = models.FloatField()
+    high = models.FloatField()
+    low = models.FloatField()
+    close = models.FloatField()
+    volume_24h = models.FloatField(null=True, blank=True)
+    tick_count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['asset', 'resolution', 'bucket_start'], name='unique_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.asset} {self.resolution}s {self.bucket_start} - ${self.close}"
 
 class BitcoinNews(models.Model):
-    """Stores news articles related to Bitcoin, fetched from various sources."""
+    """Stores news articles related to a tracked asset, fetched from various sources."""
+    asset = models.CharField(max_length=50, default='bitcoin')
     title = models.CharField(max_length=200)
     source = models.CharField(max_length=100, null=True, blank=True)
     published_at = models.DateTimeField()
-    url = models.URLField(unique=True)
+    url = models.URLField()
+    cluster_key = models.CharField(
+        max_length=16, blank=True, default='', help_text="Groups near-duplicate titles of the same story."
+    )
+    cluster_size = models.PositiveIntegerField(default=1, help_text="Items in the cluster, kept on the item that names it.")
+    cluster_updated_at = models.DateTimeField(
+        null=True, blank=True, help_text="Newest publication in the cluster, set only on the item that names it."
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['asset', 'published_at']),
+            models.Index(fields=['asset', 'cluster_key']),
+            models.Index(fields=['asset', 'cluster_updated_at']),
+        ]
+        constraints = [models.UniqueConstraint(fields=['asset', 'url'], name='unique_news_url_per_asset')]
+
     def __str__(self):
         return self.title
+
+class AnalysisCacheEntry(models.Model):
+    """Stores AI analysis results keyed by a fingerprint of the inputs that produced them."""
+    fingerprint = models.CharField(max_length=64, unique=True)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    hit_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['last_used_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.fingerprint[:12]} ({self.hit_count} hits)"
+
+class AnalysisJob(models.Model):
+    """Stores a queued AI analysis of an asset, run by the analysis worker pool."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    class Priority(models.IntegerChoices):
+        # Lower values run first.
+        USER = 0
+        SCHEDULED = 10
+
+    asset = models.CharField(max_length=50)
+    fingerprint = models.CharField(max_length=64, help_text="Fingerprint of the analysis inputs.")
+    payload = models.JSONField(help_text="The analysis inputs, as passed to the agent.")
+    priority = models.PositiveSmallIntegerField(choices=Priority.choices, default=Priority.USER)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_after']),
+            models.Index(fields=['asset', 'created_at']),
+        ]
+        constraints = [
+            # At most one pending or running job per set of inputs.
+            models.UniqueConstraint(
+                fields=['fingerprint'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_active_analysis_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.asset} {self.status} ({self.fingerprint[:12]})"
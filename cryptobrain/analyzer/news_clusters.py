@@ -0,0 +1,228 @@
+import hashlib
+import re
+import threading
+import zlib
+from collections import deque
+from datetime import timedelta
+import numpy as np
+from .conf import app_settings
+
+# Near-duplicate titles of the same story are grouped with MinHash signatures
+# (NUM_PERM hashes of SHINGLE_SIZE-character shingles, split into BANDS for
+# locality sensitive hashing). A title joins a story when its estimated
+# similarity reaches THRESHOLD; stories stay open for WINDOW_DAYS.
+DEFAULT_NEWS_CLUSTERING_SETTINGS = {
+    'NUM_PERM': 96,
+    'BANDS': 32,
+    'SHINGLE_SIZE': 4,
+    'THRESHOLD': 0.5,
+    'WINDOW_DAYS': 3,
+}
+
+# Universal hashing modulo a Mersenne prime: every product of a coefficient
+# and a 31-bit shingle hash fits in 64 bits.
+_PRIME = (1 << 31) - 1
+_WORD = re.compile(r'[a-z0-9$%.,]+')
+
+
+def get_news_clustering_settings():
+    """Returns the NEWS_CLUSTERING settings merged over the built-in defaults."""
+    return app_settings('NEWS_CLUSTERING', DEFAULT_NEWS_CLUSTERING_SETTINGS)
+
+
+def cluster_key_for(asset, url):
+    """Returns the key of the cluster founded by a news item: a short digest of its asset and URL."""
+    return hashlib.blake2b(f'{asset}:{url}'.encode(), digest_size=8).hexdigest()
+
+
+class _Entry:
+    __slots__ = ('signature', 'bands', 'cluster_key', 'published_at')
+
+    def __init__(self, signature, bands, cluster_key, published_at):
+        self.signature = signature
+        self.bands = bands
+        self.cluster_key = cluster_key
+        self.published_at = published_at
+
+
+class NewsClusterIndex:
+    """
+    Groups news titles of the same story, published with small wording
+    changes by different outlets, into clusters.
+
+    Each title is reduced to a MinHash signature of its character shingles,
+    whose agreement with another signature estimates the Jaccard similarity
+    of the two titles. The signatures are split into bands for locality
+    sensitive hashing: an incoming title is only compared with the titles
+    sharing at least one band with it, so assigning a title costs time in
+    the number of its near-duplicates, not in the size of the index.
+
+    The index is kept per asset, in memory, for the titles published within
+    the last ``window``. It is loaded from the database on first use and
+    updated incrementally as news items are saved.
+    """
+
+    def __init__(self, num_perm, bands, shingle_size, threshold, window):
+        """
+        Initializes the NewsClusterIndex.
+
+        Args:
+            num_perm (int): Number of hash functions in a signature. Must be a multiple of ``bands``.
+            bands (int): Number of LSH bands. More bands find more candidates at lower similarity.
+            shingle_size (int): Length of the character shingles.
+            threshold (float): Minimum estimated similarity for joining a cluster.
+            window (timedelta): How long a title stays in the index after it was published.
+        """
+        if num_perm % bands:
+            raise ValueError("NUM_PERM must be a multiple of BANDS.")
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.window = window
+        # A fixed seed keeps signatures comparable across processes and restarts.
+        rng = np.random.default_rng(0x5EED)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._entries = {}
+
+    @classmethod
+    def from_settings(cls):
+        """Builds an index from the NEWS_CLUSTERING settings."""
+        config = get_news_clustering_settings()
+        return cls(
+            num_perm=config['NUM_PERM'],
+            bands=config['BANDS'],
+            shingle_size=config['SHINGLE_SIZE'],
+            threshold=config['THRESHOLD'],
+            window=timedelta(days=config['WINDOW_DAYS']),
+        )
+
+    def signature(self, title):
+        """
+        Computes the MinHash signature of a title.
+
+        Returns:
+            np.ndarray: ``num_perm`` uint64 minimum hash values.
+        """
+        text = ' '.join(_WORD.findall(title.lower()))
+        size = self.shingle_size
+        shingles = {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode()) & _PRIME for shingle in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def is_loaded(self, asset):
+        """Whether the index of an asset has been loaded."""
+        return asset in self._entries
+
+    def load(self, asset, items):
+        """
+        Builds the index of an asset from stored news items.
+
+        Args:
+            asset (str): The asset id.
+            items (Iterable[tuple[str, str, str, datetime]]): ``(title, url,
+                cluster_key, published_at)`` of the items published within the
+                window, oldest first. Items without a cluster key are assigned one.
+        """
+        with self._lock:
+            self._entries[asset] = deque()
+            self._buckets[asset] = {}
+        for title, url, cluster_key, published_at in items:
+            self.assign(asset, title, url, published_at, cluster_key=cluster_key or None)
+
+    def assign(self, asset, title, url, published_at, cluster_key=None):
+        """
+        Adds a news item to the index and returns the key of its cluster.
+
+        Args:
+            asset (str): The asset id.
+            title (str): The news title.
+            url (str): The news URL, which names the cluster if the item founds one.
+            published_at (datetime): Publication time, used to expire the item.
+            cluster_key (str | None): Known cluster of the item, skipping the lookup.
+
+        Returns:
+            str: The cluster key.
+        """
+        entry = self.match(asset, title, url, published_at, cluster_key=cluster_key)
+        self.add(asset, [entry])
+        return entry.cluster_key
+
+    def match(self, asset, title, url, published_at, pending=(), cluster_key=None):
+        """
+        Finds the cluster of a news item without adding it to the index.
+
+        The item joins the cluster of its most similar title, among the indexed
+        ones and ``pending``, if the estimated similarity reaches the threshold,
+        and founds a new cluster otherwise.
+
+        Args:
+            asset (str): The asset id.
+            title (str): The news title.
+            url (str): The news URL, which names the cluster if the item founds one.
+            published_at (datetime): Publication time, used to expire the item.
+            pending (Sequence): Entries returned by ``match`` that are not indexed
+                yet, such as the earlier items of the same batch.
+            cluster_key (str | None): Known cluster of the item, skipping the lookup.
+
+        Returns:
+            The entry of the item, with its ``cluster_key``; pass it to ``add``
+            once the item is stored.
+        """
+        signature = self.signature(title)
+        band_keys = self._band_keys(signature)
+        if cluster_key is None:
+            with self._lock:
+                buckets = self._buckets.get(asset, {})
+                candidates = {id(entry): entry for key in band_keys for entry in buckets.get(key, ())}
+            candidates.update((id(entry), entry) for entry in pending)
+            best, best_similarity = None, self.threshold
+            for entry in candidates.values():
+                similarity = np.count_nonzero(entry.signature == signature) / len(signature)
+                if similarity >= best_similarity:
+                    best, best_similarity = entry, similarity
+            cluster_key = best.cluster_key if best is not None else cluster_key_for(asset, url)
+        return _Entry(signature, band_keys, cluster_key, published_at)
+
+    def add(self, asset, entries):
+        """Indexes the entries returned by ``match``, oldest first."""
+        with self._lock:
+            indexed = self._entries.setdefault(asset, deque())
+            buckets = self._buckets.setdefault(asset, {})
+            for entry in entries:
+                self._expire(indexed, buckets, entry.published_at)
+                indexed.append(entry)
+                for key in entry.bands:
+                    buckets.setdefault(key, []).append(entry)
+
+    def _expire(self, entries, buckets, now):
+        # News arrives roughly in publication order, so the oldest entries are at the front.
+        horizon = now - self.window
+        while entries and entries[0].published_at < horizon:
+            entry = entries.popleft()
+            for key in entry.bands:
+                bucket = buckets[key]
+                bucket.remove(entry)
+                if not bucket:
+                    del buckets[key]
+
+    def size(self, asset):
+        """Returns the number of indexed titles of an asset."""
+        return len(self._entries.get(asset, ()))
+
+    def sizes(self):
+        """Returns the number of indexed titles of every loaded asset."""
+        with self._lock:
+            return {asset: len(entries) for asset, entries in self._entries.items()}
+
+
+news_clusters = NewsClusterIndex.from_settings()
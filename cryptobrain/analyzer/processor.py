@@ -1,20 +1,29 @@
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
+from .metrics import metrics
+from .series import PriceSeries
 
 logger = logging.getLogger(__name__)
 
+def _price_array(price_history):
+    """Returns the prices of a PriceSeries or of a list of price history entries as a float64 array."""
+    if isinstance(price_history, PriceSeries):
+        return price_history.prices
+    return np.fromiter((float(entry.price) for entry in price_history), dtype=np.float64)
+
+@metrics.timed('compute')
 def calculate_moving_average(price_history, window=7):
     """Calculates the moving average for a given price history."""
-    prices = list(map(lambda entry: float(entry.price), price_history))
+    prices = _price_array(price_history)
     if len(prices) < window:
         return 0.0
-    result = np.convolve(prices, np.ones(window) / window, mode='valid').tolist()[-1]
-    return result
+    return float(prices[-window:].mean())
 
+@metrics.timed('compute')
 def calculate_price_trend(price_history):
     """Calculates the price trend using linear regression and provides a qualitative description."""
-    prices = list(map(lambda entry: float(entry.price), price_history))
+    prices = _price_array(price_history)
     if len(prices) < 2:
         return {"slope": 0.0, "description": "Neutral"}
 
@@ -22,44 +31,151 @@ def calculate_price_trend(price_history):
     slope, _ = np.polyfit(x, prices, 1)
 
     mean_price = np.mean(prices)
+    result = {"slope": slope, "description": describe_trend(slope, mean_price)}
+    return result
+
+def describe_trend(slope, mean_price):
+    """Maps a regression slope, normalized by the mean price, to a qualitative description."""
     normalized_slope = (slope / mean_price) * 100 if mean_price > 0 else 0
 
     if normalized_slope > 0.5:
-        description = "Strongly Bullish"
+        return "Strongly Bullish"
     elif normalized_slope > 0.1:
-        description = "Bullish"
+        return "Bullish"
     elif normalized_slope < -0.5:
-        description = "Strongly Bearish"
+        return "Strongly Bearish"
     elif normalized_slope < -0.1:
-        description = "Bearish"
-    else:
-        description = "Neutral"
-    
-    result = {"slope": slope, "description": description}
-    return result
+        return "Bearish"
+    return "Neutral"
 
-def prepare_chart_data(price_history):
+@metrics.timed('compute')
+def prepare_chart_data(price_history, label_format='%b-%d %H:%M'):
     """Prepares data for Chart.js, formatting timestamps for readability."""
     if not price_history:
         return {'labels': [], 'prices': []}
-    
-    # Using map to apply a transformation function to each item in the lists
-    labels = list(map(lambda entry: entry.timestamp.strftime('%b-%d %H:%M'), price_history))
-    prices = list(map(lambda entry: float(entry.price), price_history))
-    
+
+    if isinstance(price_history, PriceSeries):
+        labels = [price_history.datetime_at(i).strftime(label_format) for i in range(len(price_history))]
+        prices = price_history.prices.tolist()
+    else:
+        labels = [entry.timestamp.strftime(label_format) for entry in price_history]
+        prices = [float(entry.price) for entry in price_history]
+
     chart_data = {
         'labels': labels,
         'prices': prices
     }
     return chart_data
 
-def preprocess_news_titles(news_titles):
-    """Cleans and deduplicates a list of news titles."""
+@metrics.timed('compute')
+def prepare_ohlc_chart_data(buckets, label_format='%b-%d %H:%M'):
+    """Prepares OHLCV buckets for Chart.js: the close price as the line plus high/low bands."""
+    labels = [
+        datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime(label_format)
+        for ts in buckets['timestamps'].tolist()
+    ]
+    return {
+        'labels': labels,
+        'prices': buckets['close'].tolist(),
+        'highs': buckets['high'].tolist(),
+        'lows': buckets['low'].tolist(),
+    }
+
+def estimate_tokens(text):
+    """Roughly estimates the number of LLM tokens in a text, at about four characters per token."""
+    return len(text) // 4 + 1
+
+@metrics.timed('compute')
+def preprocess_news_titles(news_titles, token_budget=None):
+    """
+    Cleans and deduplicates a list of news titles.
+
+    Args:
+        news_titles (list[str]): Titles, most relevant first.
+        token_budget (int | None): Estimated number of prompt tokens the titles
+            may take; the remaining titles are dropped once it is spent.
+
+    Returns:
+        list[str]: The cleaned titles, in their original order.
+    """
     processed = []
     seen = set()
+    spent = 0
     for title in news_titles:
         cleaned_title = title.strip()
         if cleaned_title and cleaned_title.lower() not in seen:
+            # Each title is sent as a "- title" line.
+            cost = estimate_tokens(cleaned_title) + 1
+            if token_budget is not None and spent + cost > token_budget:
+                break
             processed.append(cleaned_title)
             seen.add(cleaned_title.lower())
-    return processed
\ No newline at end of file
+            spent += cost
+    return processed
+
+_TREND_SCORES = {"Strongly Bullish": 2, "Bullish": 1, "Neutral": 0, "Bearish": -1, "Strongly Bearish": -2}
+_SENTIMENTS = {2: "Bullish", 1: "Cautiously Optimistic", 0: "Neutral", -1: "Cautiously Pessimistic", -2: "Bearish"}
+
+@metrics.timed('compute')
+def rule_based_analysis(indicators):
+    """
+    Computes a deterministic analysis from technical indicators alone, used
+    when the AI analysis is slow or unavailable.
+
+    The regression trend and the position of the price against its moving
+    average each vote for a direction; the 24h volume against its mean over the window raises or
+    lowers the confidence. News is not considered, so the confidence stays
+    well below what the model usually reports.
+
+    Args:
+        indicators (dict): A ``StreamingIndicators.snapshot``.
+
+    Returns:
+        dict: The fields of a ``ComprehensiveAnalysis``.
+    """
+    trend = indicators['trend']['description']
+    sma, price = indicators['sma'], indicators['price']
+    score = _TREND_SCORES.get(trend, 0)
+    reasons = [f"- Trend: the linear regression over the window is {trend.lower()}."]
+
+    if sma:
+        gap = (price - sma) / sma * 100
+        crossover = 1 if gap > 0.1 else -1 if gap < -0.1 else 0
+        score += crossover
+        position = {1: "above", -1: "below", 0: "in line with"}[crossover]
+        reasons.append(
+            f"- Moving average: the price (${price:,.2f}) is {position} the SMA (${sma:,.2f}), {gap:+.2f}%."
+        )
+    else:
+        crossover = 0
+        reasons.append("- Moving average: not enough ticks for an SMA yet.")
+    score = max(-2, min(2, score))
+
+    confidence = 0.2 + 0.1 * abs(score)
+    volume, mean_volume = indicators['volume_24h'], indicators.get('mean_volume')
+    if volume and mean_volume:
+        ratio = volume / mean_volume
+        if ratio >= 1.2 and score:
+            confidence += 0.1
+            effect = "confirming the move"
+        elif ratio <= 0.8:
+            confidence -= 0.1
+            effect = "a weakly supported move"
+        else:
+            effect = "no strong signal"
+        reasons.append(f"- Volume: the 24h volume is {ratio:.0%} of its average over the window, {effect}.")
+    else:
+        reasons.append("- Volume: not available.")
+    reasons.append("- News: not considered by the rule-based analysis.")
+
+    direction = "Uptrend" if score > 0 else "Downtrend" if score < 0 else "Sideways"
+    return {
+        "market_sentiment": _SENTIMENTS[score],
+        "trend_prediction": direction,
+        "confidence_score": round(max(0.1, min(confidence, 0.6)), 2),
+        "analysis_summary": (
+            f"Rule-based estimate at ${price:,.2f}: {trend.lower()} trend, "
+            f"price {'above' if crossover > 0 else 'below' if crossover < 0 else 'near'} its moving average."
+        ),
+        "detailed_reasoning": "\n".join(reasons),
+    }
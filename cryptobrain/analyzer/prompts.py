@@ -3,7 +3,7 @@
 ANALYSIS_PROMPT_TEMPLATE = """
 **Role:** You are a Senior Quantitative Financial Analyst for a top-tier investment firm. Your analysis must be objective, data-driven, and strictly confined to the information provided. Avoid any form of speculation or external knowledge.
 
-**Objective:** Conduct a comprehensive market analysis for Bitcoin (BTC) based on the real-time data feed below. Your output must be structured, precise, and ready for an executive briefing.
+**Objective:** Conduct a comprehensive market analysis for {asset_name} ({asset_symbol}) based on the real-time data feed below. Your output must be structured, precise, and ready for an executive briefing.
 
 **Core Data Points:**
 - **Current Price (USD):** ${current_price}
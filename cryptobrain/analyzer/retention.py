@@ -0,0 +1,155 @@
+import logging
+from datetime import timedelta
+from django.utils import timezone
+from .conf import app_settings
+from .storage import (
+    roll_up_price_history,
+    get_rollup_watermarks,
+    get_oldest_price_timestamp,
+    delete_price_partition,
+    floor_datetime,
+)
+
+logger = logging.getLogger(__name__)
+
+# Raw ticks are kept for RAW_DAYS, then rolled up into OHLCV tiers (RESOLUTION in
+# seconds, each a multiple of the previous one) kept for DAYS each (None = forever).
+# The buckets of the last LATE_SECONDS are rolled up again on every run, so ticks
+# stored late still count. Expired data is dropped one PARTITION_DAYS-wide
+# partition at a time on every INGESTION['PURGE_INTERVAL']. Charts read from the
+# coarsest tier that fits.
+DEFAULT_RETENTION_SETTINGS = {
+    'RAW_DAYS': 7,
+    'LATE_SECONDS': 21600,
+    'TIERS': [
+        {'RESOLUTION': 300, 'DAYS': 30},
+        {'RESOLUTION': 3600, 'DAYS': 365},
+        {'RESOLUTION': 86400, 'DAYS': None},
+    ],
+    'PARTITION_DAYS': 1,
+}
+
+
+def get_retention_settings():
+    """Returns the RETENTION settings merged over the built-in defaults."""
+    return app_settings('RETENTION', DEFAULT_RETENTION_SETTINGS)
+
+
+class RetentionPolicy:
+    """
+    Tiered retention of the price history.
+
+    Raw ticks are kept for ``raw_days``. Complete buckets are rolled up into
+    OHLCV tiers of increasing width (5 minutes, 1 hour and 1 day by default),
+    each kept for its own number of days. Data only expires once the next
+    tier has absorbed it, and it is removed one whole time partition at a
+    time: every partition is a single range delete on the time index in its
+    own short write transaction, instead of one large delete over the table.
+    """
+
+    def __init__(self, raw_days, tiers, partition_days, late_seconds=0):
+        """
+        Initializes the RetentionPolicy.
+
+        Args:
+            raw_days (int): Days of raw ticks to keep.
+            tiers (list[tuple[int, int | None]]): ``(resolution, days)`` pairs, finest first.
+                Each resolution, in seconds, must be a multiple of the previous one;
+                None keeps a tier forever.
+            partition_days (int): Width of the partitions removed at once, in days.
+            late_seconds (int): How long after their bucket ticks are still rolled up.
+                Must be shorter than the raw retention.
+        """
+        for (finer, _), (coarser, _) in zip(tiers, tiers[1:]):
+            if coarser % finer:
+                raise ValueError(f"Rollup resolution {coarser}s is not a multiple of {finer}s.")
+        if late_seconds >= raw_days * 86400:
+            raise ValueError(f"Late ticks ({late_seconds}s) must arrive within the raw retention ({raw_days} days).")
+        self.raw_days = raw_days
+        self.late_seconds = late_seconds
+        self.tiers = tiers
+        self.partition_seconds = partition_days * 86400
+
+    @classmethod
+    def from_settings(cls):
+        """Builds a retention policy from the RETENTION settings."""
+        config = get_retention_settings()
+        return cls(
+            raw_days=config['RAW_DAYS'],
+            tiers=[(tier['RESOLUTION'], tier['DAYS']) for tier in config['TIERS']],
+            partition_days=config['PARTITION_DAYS'],
+            late_seconds=config['LATE_SECONDS'],
+        )
+
+    @property
+    def resolutions(self):
+        return [resolution for resolution, _ in self.tiers]
+
+    def select_resolution(self, days, points):
+        """
+        Picks the coarsest source that covers ``days`` at ``points`` points or more.
+
+        If no source is both fine enough and retained long enough, the finest
+        source covering the range is used instead, and if none covers it, the
+        one with the longest retention.
+
+        Args:
+            days (int): Length of the requested range in days.
+            points (int): Number of points the range is displayed with.
+
+        Returns:
+            int | None: The bucket width of the rollup tier in seconds, or None for the raw ticks.
+        """
+        sources = [(None, self.raw_days)] + list(self.tiers)
+        covering = [source for source in sources if source[1] is None or source[1] >= days]
+        if not covering:
+            return max(sources, key=lambda source: source[1])[0]
+        step = days * 86400 / points
+        fine_enough = [source for source in covering if (source[0] or 0) <= step]
+        if fine_enough:
+            return max(fine_enough, key=lambda source: source[0] or 0)[0]
+        return min(covering, key=lambda source: source[0] or 0)[0]
+
+    async def enforce(self, asset, batch_size=500):
+        """
+        Rolls up the new complete buckets of an asset, then removes its expired partitions.
+
+        Returns:
+            int: The number of deleted rows.
+        """
+        written = await roll_up_price_history(
+            asset, self.resolutions, batch_size=batch_size, late_seconds=self.late_seconds
+        )
+        logger.debug("Rolled up %s: %s buckets written per resolution.", asset, written)
+
+        now = timezone.now()
+        watermarks = await get_rollup_watermarks(asset, self.resolutions)
+        deleted = 0
+        # Each source expires no later than the point up to which the next tier covers it.
+        sources = [(None, self.raw_days)] + list(self.tiers)
+        for (resolution, days), (next_resolution, _) in zip(sources, sources[1:] + [(None, None)]):
+            if days is None:
+                continue
+            cutoff = now - timedelta(days=days)
+            if next_resolution is not None:
+                covered = watermarks[next_resolution]
+                if covered is None:
+                    continue
+                cutoff = min(cutoff, covered)
+            deleted += await self._drop_partitions(asset, resolution, cutoff)
+        return deleted
+
+    async def _drop_partitions(self, asset, resolution, cutoff):
+        oldest = await get_oldest_price_timestamp(asset, resolution)
+        if oldest is None:
+            return 0
+        deleted = 0
+        start = floor_datetime(oldest, self.partition_seconds)
+        width = timedelta(seconds=self.partition_seconds)
+        while start + width <= cutoff:
+            deleted += await delete_price_partition(asset, resolution, start, start + width)
+            start += width
+        return deleted
+
+
+retention_policy = RetentionPolicy.from_settings()
@@ -0,0 +1,114 @@
+import numpy as np
+from datetime import datetime, timezone as dt_timezone
+from itertools import chain
+
+
+def _pairs_to_array(pairs):
+    """Converts a list of ``[x, y]`` pairs to an (n, 2) float64 array, with NaN for a null."""
+    try:
+        # Flattening is about twice as fast as letting NumPy walk the nested lists.
+        return np.fromiter(chain.from_iterable(pairs), dtype=np.float64, count=2 * len(pairs)).reshape(-1, 2)
+    except (TypeError, ValueError):
+        return np.array(pairs, dtype=np.float64).reshape(-1, 2)
+
+
+class PriceSeries:
+    """
+    Columnar, time-ordered price history backed by NumPy arrays.
+
+    Timestamps are int64 epoch milliseconds; prices and volumes are float64,
+    with NaN for a missing volume. Slicing by time range returns views that
+    share memory with the original arrays.
+    """
+    __slots__ = ('timestamps', 'prices', 'volumes')
+
+    def __init__(self, timestamps, prices, volumes):
+        """
+        Initializes the PriceSeries.
+
+        Args:
+            timestamps (np.ndarray): Sorted int64 epoch milliseconds.
+            prices (np.ndarray): float64 prices aligned with ``timestamps``.
+            volumes (np.ndarray): float64 24h volumes aligned with ``timestamps``.
+        """
+        self.timestamps = timestamps
+        self.prices = prices
+        self.volumes = volumes
+
+    @classmethod
+    def empty(cls):
+        """Returns a series with no points."""
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds a series from ``(datetime, price, volume)`` tuples ordered by time.
+
+        Args:
+            rows (Sequence[tuple]): Rows as returned by ``values_list``. A None
+                volume is stored as NaN.
+        """
+        count = len(rows)
+        timestamps = np.fromiter((int(row[0].timestamp() * 1000) for row in rows), dtype=np.int64, count=count)
+        prices = np.fromiter((row[1] for row in rows), dtype=np.float64, count=count)
+        volumes = np.fromiter(
+            (np.nan if row[2] is None else row[2] for row in rows), dtype=np.float64, count=count
+        )
+        return cls(timestamps, prices, volumes)
+
+    @classmethod
+    def from_market_chart(cls, prices, volumes):
+        """
+        Builds a series from the ``prices`` and ``total_volumes`` arrays of a
+        CoinGecko market chart, keeping the points that have a price and a volume.
+
+        The pairs are flattened straight into NumPy arrays; when both arrays share
+        their timestamps, as they normally do, no per-point matching is done.
+
+        Args:
+            prices (list[list]): ``[epoch ms, price]`` pairs ordered by time.
+            volumes (list[list]): ``[epoch ms, volume]`` pairs ordered by time.
+        """
+        price_points = _pairs_to_array(prices)
+        volume_points = _pairs_to_array(volumes)
+        timestamps = price_points[:, 0].astype(np.int64)
+        volume_timestamps = volume_points[:, 0].astype(np.int64)
+        if np.array_equal(timestamps, volume_timestamps):
+            prices, volumes = price_points[:, 1], volume_points[:, 1]
+        else:
+            timestamps, price_index, volume_index = np.intersect1d(
+                timestamps, volume_timestamps, return_indices=True
+            )
+            prices, volumes = price_points[price_index, 1], volume_points[volume_index, 1]
+        keep = ~(np.isnan(prices) | np.isnan(volumes))
+        if keep.all():
+            return cls(timestamps, np.ascontiguousarray(prices), np.ascontiguousarray(volumes))
+        return cls(timestamps[keep], prices[keep], volumes[keep])
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __bool__(self):
+        return len(self.timestamps) > 0
+
+    @property
+    def nbytes(self):
+        """Total memory used by the underlying arrays, in bytes."""
+        return self.timestamps.nbytes + self.prices.nbytes + self.volumes.nbytes
+
+    def slice(self, start_ms=None, end_ms=None):
+        """
+        Returns the points with ``start_ms <= timestamp < end_ms`` without copying.
+
+        Args:
+            start_ms (int | None): Inclusive lower bound in epoch milliseconds.
+            end_ms (int | None): Exclusive upper bound in epoch milliseconds.
+        """
+        start = 0 if start_ms is None else np.searchsorted(self.timestamps, start_ms, side='left')
+        end = len(self.timestamps) if end_ms is None else np.searchsorted(self.timestamps, end_ms, side='left')
+        return PriceSeries(self.timestamps[start:end], self.prices[start:end], self.volumes[start:end])
+
+    def datetime_at(self, index):
+        """Returns the timestamp at ``index`` as a timezone-aware UTC datetime."""
+        return datetime.fromtimestamp(self.timestamps[index] / 1000, tz=dt_timezone.utc)
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from .agent import agent_orchestrator, get_agent_settings
+from .assets import get_tracked_assets
+from .conf import app_settings
+from .http_client import http_client
+from .indicators import sync_indicators
+
+logger = logging.getLogger(__name__)
+
+
+# Used by run.py. Each of the WORKERS processes runs its own event loop and
+# lifespan hooks; GRACEFUL_SHUTDOWN_TIMEOUT is in seconds.
+DEFAULT_SERVER_SETTINGS = {
+    'HOST': '127.0.0.1',
+    'PORT': 8000,
+    'WORKERS': 1,
+    'GRACEFUL_SHUTDOWN_TIMEOUT': 10,
+    'LOG_LEVEL': 'info',
+}
+
+
+def get_server_settings():
+    """Returns the SERVER settings merged over the built-in defaults."""
+    return app_settings('SERVER', DEFAULT_SERVER_SETTINGS)
+
+
+_background_tasks = set()
+
+
+async def startup():
+    """
+    Prepares the shared per-process state before the worker accepts requests.
+
+    The indicator engines of every tracked asset are synced from the database
+    so the first analysis request does not pay for the full history load.
+    If AGENT['WARM_UP'] is enabled, the AI agent is loaded in the background;
+    the worker does not wait for it before serving requests.
+    """
+    assets = list(get_tracked_assets())
+    results = await asyncio.gather(*(sync_indicators(asset_id) for asset_id in assets), return_exceptions=True)
+    for asset_id, result in zip(assets, results):
+        if isinstance(result, Exception):
+            logger.warning("Could not warm up the indicators of %s: %s", asset_id, result)
+
+    if get_agent_settings()['WARM_UP']:
+        task = asyncio.get_running_loop().create_task(agent_orchestrator.warm_up())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+async def shutdown():
+    """Releases the shared per-process resources once the worker stops accepting requests."""
+    await http_client.close()
+
+
+class LifespanApplication:
+    """
+    Wraps the Django ASGI application to handle the ASGI lifespan protocol,
+    which Django does not implement itself.
+
+    ``startup`` runs once per worker process before it serves requests and
+    ``shutdown`` runs after in-flight requests finished during a graceful
+    shutdown. Every other scope is passed to Django unchanged.
+    """
+    def __init__(self, application):
+        """
+        Initializes the LifespanApplication.
+
+        Args:
+            application: The Django ASGI application.
+        """
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.application(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await startup()
+                except Exception as e:
+                    logger.exception("Lifespan startup failed.")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await shutdown()
+                except Exception as e:
+                    logger.exception("Lifespan shutdown failed.")
+                    await send({'type': 'lifespan.shutdown.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def run_server(host, port, workers=1, graceful_shutdown_timeout=10, log_level='info'):
+    """
+    Serves ``cryptobrain.asgi:application`` with uvicorn until interrupted.
+
+    With more than one worker, uvicorn spawns one process per worker and
+    supervises them; each worker runs its own event loop and lifespan.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind.
+        workers (int): Number of worker processes.
+        graceful_shutdown_timeout (int): Seconds in-flight requests are given to finish on shutdown.
+        log_level (str): uvicorn log level.
+    """
+    import uvicorn
+
+    uvicorn.run(
+        'cryptobrain.asgi:application',
+        host=host,
+        port=port,
+        workers=workers,
+        lifespan='on',
+        timeout_graceful_shutdown=graceful_shutdown_timeout,
+        log_level=log_level,
+    )
@@ -0,0 +1,398 @@
+import numpy as np
+from itertools import islice
+from asgiref.sync import sync_to_async
+from datetime import timedelta, datetime, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import FloatField, Max, Min
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .db_writer import db_writer
+from .downsampling import ohlcv_buckets, rollup_buckets, concat_buckets
+from .metrics import metrics
+from .models import BitcoinPriceHistory, PriceRollup, BitcoinNews
+from .news_clusters import news_clusters, cluster_key_for
+from .series import PriceSeries
+
+
+def save_price_history_bulk_sync(asset, price_data_list, batch_size=500):
+    """
+    Saves a list of historical price data points of one asset, ``batch_size``
+    rows per INSERT statement. Points whose timestamp is already stored are
+    skipped by the unique (asset, timestamp) constraint, so no pre-read is needed.
+
+    Args:
+        asset (str): The asset id the prices belong to.
+        price_data_list (list[dict]): A list of price data dictionaries.
+        batch_size (int): Maximum number of rows per INSERT statement.
+    """
+    prices = (BitcoinPriceHistory(asset=asset, **p) for p in price_data_list)
+    while batch := list(islice(prices, batch_size)):
+        BitcoinPriceHistory.objects.bulk_create(batch, ignore_conflicts=True)
+
+def save_single_price_history_sync(asset, price_data):
+    """
+    Saves a single, most recent price data point, replacing the price and
+    volume of an existing point with the same timestamp in one statement.
+
+    Args:
+        asset (str): The asset id the price belongs to.
+        price_data (dict): The price data to save.
+    """
+    BitcoinPriceHistory.objects.bulk_create(
+        [BitcoinPriceHistory(asset=asset, **price_data)],
+        update_conflicts=True,
+        unique_fields=['asset', 'timestamp'],
+        update_fields=['price', 'volume_24h'],
+    )
+
+# The writes run on the database writer thread; the synchronous bodies stay
+# importable for callers that already hold a transaction, such as bench_upsert.
+save_price_history_bulk = metrics.timed('db', 'save_price_history_bulk')(
+    db_writer.write(save_price_history_bulk_sync)
+)
+save_single_price_history = metrics.timed('db', 'save_single_price_history')(
+    db_writer.write(save_single_price_history_sync)
+)
+
+def _load_news_clusters(asset):
+    """Loads the near-duplicate index of an asset with the news published within its window."""
+    since = timezone.now() - news_clusters.window
+    news_clusters.load(
+        asset,
+        BitcoinNews.objects.filter(asset=asset, published_at__gte=since)
+        .order_by('published_at', 'id').values_list('title', 'url', 'cluster_key', 'published_at'),
+    )
+
+@metrics.timed('db')
+@db_writer.write
+def save_news_items(news_items, batch_size=500):
+    """
+    Saves a list of news items, ignoring duplicates based on the unique (asset, URL) pair.
+    Each new item is assigned to the cluster of its near-duplicates, oldest first. The
+    item that founds a cluster names it and keeps its size and newest publication.
+    The new items are added to the near-duplicate index once the write commits.
+
+    Args:
+        news_items (list[dict]): A list of news item dictionaries tagged with their ``asset``.
+        batch_size (int): Maximum number of rows per INSERT statement.
+
+    Returns:
+        set[str]: The ids of the assets that received at least one new item.
+    """
+    # The writer's transaction holds the write lock from its start, so every
+    # item not found here, once deduplicated, is created by the INSERT below.
+    existing = set(
+        BitcoinNews.objects.filter(url__in={item['url'] for item in news_items}).values_list('asset', 'url')
+    )
+    new_items = {}
+    for item in news_items:
+        key = (item['asset'], item['url'])
+        if key not in existing:
+            new_items.setdefault(key, item)
+    news_to_create = [
+        BitcoinNews(
+            asset=item['asset'],
+            url=item['url'],
+            title=item['title'][:200],
+            published_at=parse_datetime(item['published_at']) if isinstance(item['published_at'], str) else item['published_at'],
+            source=item['source']
+        )
+        for item in new_items.values()
+    ]
+    news_to_create.sort(key=lambda news: news.published_at)
+    entries = {}
+    heads = {}
+    joined = {}
+    for news in news_to_create:
+        if not news_clusters.is_loaded(news.asset):
+            _load_news_clusters(news.asset)
+        pending = entries.setdefault(news.asset, [])
+        entry = news_clusters.match(news.asset, news.title, news.url, news.published_at, pending)
+        pending.append(entry)
+        news.cluster_key = entry.cluster_key
+        key = (news.asset, news.cluster_key)
+        if news.cluster_key == cluster_key_for(news.asset, news.url):
+            news.cluster_updated_at = news.published_at
+            heads[key] = news
+        elif key in heads:
+            heads[key].cluster_size += 1
+            heads[key].cluster_updated_at = news.published_at
+        else:
+            joined.setdefault(key, []).append(news.published_at)
+    if news_to_create:
+        BitcoinNews.objects.bulk_create(news_to_create, ignore_conflicts=True, batch_size=batch_size)
+    if joined:
+        _update_cluster_heads(joined)
+    # A write that is rolled back, or retried on its own, drops this callback.
+    transaction.on_commit(lambda: _index_news(entries))
+    return {news.asset for news in news_to_create}
+
+def _index_news(entries):
+    """Adds the entries of committed news items, given as ``{asset: [entry, ...]}``, to the index."""
+    for asset, asset_entries in entries.items():
+        news_clusters.add(asset, asset_entries)
+
+def _update_cluster_heads(joined):
+    """Adds items saved into stored clusters, given as ``{(asset, cluster_key): [published_at, ...]}``."""
+    stored_heads = BitcoinNews.objects.filter(
+        cluster_key__in={cluster_key for _, cluster_key in joined}, cluster_updated_at__isnull=False
+    ).only('id', 'asset', 'cluster_key', 'cluster_size', 'cluster_updated_at')
+    updated = []
+    for head in stored_heads:
+        published = joined.get((head.asset, head.cluster_key))
+        if published:
+            head.cluster_size += len(published)
+            head.cluster_updated_at = max(head.cluster_updated_at, *published)
+            updated.append(head)
+    BitcoinNews.objects.bulk_update(updated, ['cluster_size', 'cluster_updated_at'])
+
+def _latest_stories(asset, limit):
+    """Returns the items naming the ``limit`` most recently updated clusters of an asset."""
+    return BitcoinNews.objects.filter(asset=asset, cluster_updated_at__isnull=False).order_by('-cluster_updated_at')[:limit]
+
+@metrics.timed('db')
+@sync_to_async
+def get_price_series_from_db(asset, days=7, since=None):
+    """
+    Loads price history into a columnar PriceSeries without building model instances.
+
+    Args:
+        asset (str): The asset id to load.
+        days (int): Number of days of history to load when ``since`` is not given.
+        since (datetime | None): Exclusive lower bound; only newer ticks are loaded.
+
+    Returns:
+        PriceSeries: The ticks ordered by timestamp.
+    """
+    if since is not None:
+        queryset = BitcoinPriceHistory.objects.filter(asset=asset, timestamp__gt=since)
+    else:
+        queryset = BitcoinPriceHistory.objects.filter(asset=asset, timestamp__gte=timezone.now() - timedelta(days=days))
+    return _series_from_queryset(queryset)
+
+def _series_from_queryset(queryset):
+    rows = list(
+        queryset.order_by('timestamp').values_list(
+            'timestamp', Cast('price', FloatField()), Cast('volume_24h', FloatField())
+        )
+    )
+    return PriceSeries.from_rows(rows)
+
+def _price_history(asset, resolution=None):
+    """Returns the queryset and time field of the raw ticks (resolution None) or of a rollup tier."""
+    if resolution is None:
+        return BitcoinPriceHistory.objects.filter(asset=asset), 'timestamp'
+    return PriceRollup.objects.filter(asset=asset, resolution=resolution), 'bucket_start'
+
+def floor_datetime(dt, seconds):
+    """Rounds a datetime down to a multiple of ``seconds`` since the epoch."""
+    return datetime.fromtimestamp(int(dt.timestamp()) // seconds * seconds, tz=dt_timezone.utc)
+
+def _load_rollup_buckets(asset, resolution, start=None, end=None):
+    queryset = PriceRollup.objects.filter(asset=asset, resolution=resolution)
+    if start is not None:
+        queryset = queryset.filter(bucket_start__gte=start)
+    if end is not None:
+        queryset = queryset.filter(bucket_start__lt=end)
+    rows = list(queryset.order_by('bucket_start').values_list(
+        'bucket_start', 'open', 'high', 'low', 'close', 'volume_24h', 'tick_count'
+    ))
+    count = len(rows)
+    columns = list(zip(*rows)) or [()] * 7
+    return {
+        'timestamps': np.fromiter((int(ts.timestamp() * 1000) for ts in columns[0]), dtype=np.int64, count=count),
+        'open': np.array(columns[1], dtype=np.float64),
+        'high': np.array(columns[2], dtype=np.float64),
+        'low': np.array(columns[3], dtype=np.float64),
+        'close': np.array(columns[4], dtype=np.float64),
+        'volume': np.array([np.nan if v is None else v for v in columns[5]], dtype=np.float64),
+        'count': np.array(columns[6], dtype=np.int64),
+    }
+
+@metrics.timed('db')
+@sync_to_async
+def get_price_buckets_from_db(asset, days, resolution):
+    """
+    Loads a time range of an asset as OHLCV buckets from a rollup tier.
+
+    Buckets that have not been rolled up yet (the most recent ones) are
+    aggregated on the fly from the raw ticks, so the result always reaches
+    the present.
+
+    Args:
+        asset (str): The asset id to load.
+        days (int): Number of days of history to load.
+        resolution (int): Bucket width of the tier, in seconds.
+
+    Returns:
+        dict: Buckets in the format of ``ohlcv_buckets``, ordered by time.
+    """
+    start = floor_datetime(timezone.now() - timedelta(days=days), resolution)
+    rolled = _load_rollup_buckets(asset, resolution, start=start)
+    if len(rolled['timestamps']):
+        tail_start = datetime.fromtimestamp(rolled['timestamps'][-1] / 1000 + resolution, tz=dt_timezone.utc)
+    else:
+        tail_start = start
+    tail = _series_from_queryset(BitcoinPriceHistory.objects.filter(asset=asset, timestamp__gte=tail_start))
+    return concat_buckets(rolled, ohlcv_buckets(tail, resolution * 1000))
+
+@metrics.timed('db')
+async def get_latest_news_from_db(asset, limit=10):
+    """
+    Fetches the most recently updated news stories of an asset from the database:
+    the item naming each cluster of near-duplicates, with its ``cluster_size``.
+    """
+    return [news async for news in _latest_stories(asset, limit)]
+
+@metrics.timed('db')
+@sync_to_async
+def get_newest_news_times(assets):
+    """
+    Returns the publication time of the newest stored news item of each of
+    ``assets``, or None for an asset without news. News fetches skip the
+    posts of an asset that are older than its own newest item.
+
+    Returns:
+        dict[str, datetime | None]: The newest publication time per asset id.
+    """
+    newest = dict(
+        BitcoinNews.objects.filter(asset__in=assets)
+        .values('asset').annotate(newest=Max('published_at')).values_list('asset', 'newest')
+    )
+    return {asset: newest.get(asset) for asset in assets}
+
+@metrics.timed('db')
+@sync_to_async
+def get_analysis_inputs_from_db(asset, since, news_limit=10):
+    """
+    Loads everything an analysis reads in a single hop to the database thread.
+
+    The ORM runs on one thread-sensitive executor, so separate reads awaited
+    together still run one after the other, each paying for its own hop.
+
+    Args:
+        asset (str): The asset id to load.
+        since (datetime): Exclusive lower bound of the price ticks to load.
+        news_limit (int): Number of most recent news stories to load.
+
+    Returns:
+        tuple[PriceSeries, list[BitcoinNews]]: The new ticks and the item naming
+            each recent story, see ``get_latest_news_from_db``.
+    """
+    series = _series_from_queryset(BitcoinPriceHistory.objects.filter(asset=asset, timestamp__gt=since))
+    return series, list(_latest_stories(asset, news_limit))
+
+@metrics.timed('db')
+@db_writer.write
+def roll_up_price_history(asset, resolutions, batch_size=500, late_seconds=0):
+    """
+    Aggregates the complete buckets of an asset that were not rolled up yet,
+    and aggregates again the buckets of the last ``late_seconds``, so that
+    ticks stored or updated after their bucket was rolled up are included.
+
+    Tiers are processed finest first: the first one is built from the raw
+    ticks and every following one from the tier before it, so each
+    resolution must be a multiple of the previous one.
+
+    Args:
+        asset (str): The asset id to roll up.
+        resolutions (list[int]): Bucket widths of the tiers in seconds, finest first.
+        batch_size (int): Maximum number of rows per INSERT statement.
+        late_seconds (int): How long after their bucket ticks are still rolled up.
+
+    Returns:
+        dict[int, int]: The number of buckets written per resolution.
+    """
+    now = timezone.now()
+    late_since = now - timedelta(seconds=late_seconds)
+    written = {}
+    source = None
+    for resolution in resolutions:
+        latest = PriceRollup.objects.filter(asset=asset, resolution=resolution).aggregate(
+            latest=Max('bucket_start')
+        )['latest']
+        start = None
+        if latest is not None:
+            start = min(latest + timedelta(seconds=resolution), floor_datetime(late_since, resolution))
+        end = floor_datetime(now, resolution)
+        if source is None:
+            ticks = BitcoinPriceHistory.objects.filter(asset=asset, timestamp__lt=end)
+            if start is not None:
+                ticks = ticks.filter(timestamp__gte=start)
+            buckets = ohlcv_buckets(_series_from_queryset(ticks), resolution * 1000)
+        else:
+            buckets = rollup_buckets(_load_rollup_buckets(asset, source, start, end), resolution * 1000)
+
+        rollups = [
+            PriceRollup(
+                asset=asset,
+                resolution=resolution,
+                bucket_start=datetime.fromtimestamp(ts / 1000, tz=dt_timezone.utc),
+                open=o, high=h, low=l, close=c,
+                volume_24h=None if np.isnan(v) else v,
+                tick_count=n,
+            )
+            for ts, o, h, l, c, v, n in zip(*(buckets[key].tolist() for key in (
+                'timestamps', 'open', 'high', 'low', 'close', 'volume', 'count'
+            )))
+        ]
+        if rollups:
+            PriceRollup.objects.bulk_create(
+                rollups,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['asset', 'resolution', 'bucket_start'],
+                update_fields=['open', 'high', 'low', 'close', 'volume_24h', 'tick_count'],
+            )
+        written[resolution] = len(rollups)
+        source = resolution
+    return written
+
+@metrics.timed('db')
+@sync_to_async
+def get_rollup_watermarks(asset, resolutions):
+    """
+    Returns the end of the most recent rolled-up bucket of each tier.
+
+    Returns:
+        dict[int, datetime | None]: The watermark per resolution, or None for an empty tier.
+    """
+    latest = dict(
+        PriceRollup.objects.filter(asset=asset, resolution__in=resolutions)
+        .values('resolution').annotate(latest=Max('bucket_start')).values_list('resolution', 'latest')
+    )
+    return {
+        resolution: latest[resolution] + timedelta(seconds=resolution) if resolution in latest else None
+        for resolution in resolutions
+    }
+
+@metrics.timed('db')
+@sync_to_async
+def get_oldest_price_timestamp(asset, resolution=None):
+    """Returns the oldest timestamp stored for an asset in the raw ticks (resolution None) or in a rollup tier."""
+    queryset, field = _price_history(asset, resolution)
+    return queryset.aggregate(oldest=Min(field))['oldest']
+
+@metrics.timed('db')
+@db_writer.write
+def delete_price_partition(asset, resolution, start, end):
+    """
+    Deletes one time partition of the raw ticks (resolution None) or of a rollup tier.
+
+    Returns:
+        int: The number of deleted rows.
+    """
+    queryset, field = _price_history(asset, resolution)
+    return queryset.filter(**{f'{field}__gte': start, f'{field}__lt': end}).delete()[0]
+
+@metrics.timed('db')
+async def get_latest_price_from_db(asset):
+    """Fetches the most recent price data point of an asset from the database."""
+    return await BitcoinPriceHistory.objects.filter(asset=asset).order_by('-timestamp').afirst()
+
+
+def map_price_data(price_data, timestamp):
+    """Maps raw price data to a structured dictionary with a timezone-aware datetime."""
+    dt = datetime.fromtimestamp(timestamp / 1000, tz=dt_timezone.utc) if timestamp else timezone.now()
+    return {'timestamp': dt, 'price': price_data.get('price', 0), 'volume_24h': price_data.get('volume_24h')}
@@ -1,3 +1,1351 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import aiohttp
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+from asgiref.sync import sync_to_async
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from .agent import AgentOrchestrator
+from .analysis_cache import AnalysisCache
+from .analysis_service import (
+    SLOW_ANALYSIS_MESSAGE, AnalysisUnavailableError, _progress_key, get_analysis_progress, run_analysis_job,
+)
+from .assets import get_tracked_assets
+from .cache_backends import SQLiteCache
+from .coalescing import SingleFlight
+from .db_writer import WriteQueue, db_writer
+from .indicators import IndicatorRegistry, StreamingIndicators
+from .fragments import fragment_cache
+from .ingestion import IngestionScheduler, market_snapshot_cache_key
+from .jobs import AnalysisJobQueue
+from . import live
+from .metrics import SHARED_METRICS_KEY, metrics
+from .downsampling import lttb, ohlcv_buckets, rollup_buckets
+from .models import AnalysisCacheEntry, AnalysisJob, BitcoinNews, BitcoinPriceHistory, PriceRollup
+from .news_clusters import news_clusters
+from .llm_chain import ComprehensiveAnalysis
+from .processor import calculate_moving_average, calculate_price_trend, rule_based_analysis
+from .retention import RetentionPolicy
+from .series import PriceSeries
+from .storage import (
+    _load_rollup_buckets, _series_from_queryset, delete_price_partition, floor_datetime, roll_up_price_history,
+    save_news_items, save_price_history_bulk, save_single_price_history,
+)
+from .upstream import (
+    CircuitBreaker, TokenBucket, UpstreamError, UpstreamProvider, UpstreamUnavailableError, upstream,
+)
+
+
+class ImportBudgetTests(SimpleTestCase):
+    """The startup of a server worker stays within its import budget."""
+
+    def test_setup_imports_no_heavy_packages(self):
+        code = (
+            "import json, sys, django; django.setup(); "
+            "print(json.dumps(sorted({name.split('.')[0] for name in sys.modules})))"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'cryptobrain.settings'}
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        loaded = set(json.loads(result.stdout.splitlines()[-1]))
+        for package in ('langchain', 'langchain_core', 'langchain_google_genai', 'numpy'):
+            self.assertNotIn(package, loaded)
+
+    def test_worker_startup_within_budget(self):
+        # Raises CommandError when LangChain is imported at startup or the imports
+        # are slow. The budget is relative to django.setup(), which a loaded test
+        # machine slows down just as much, rather than an absolute time.
+        call_command('check_import_budget', setup_ratio=3, stdout=StringIO())
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    """The SQLite cache backend. Every thread opens its own connection, like separate processes."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SQLiteCache(os.path.join(directory.name, 'cache.sqlite3'), {})
+
+    def in_threads(self, func, count=8):
+        with ThreadPoolExecutor(count) as executor:
+            return list(executor.map(lambda _: func(), range(count)))
+
+    def test_values_round_trip(self):
+        values = {
+            'int': 42, 'big': 2 ** 64, 'negative_big': -2 ** 70, 'float': 1.5, 'text': 'café',
+            'dict': {'a': [1, None, True]}, 'datetime': datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+        }
+        for key, value in values.items():
+            self.cache.set(key, value)
+        self.assertEqual(self.cache.get_many(values), values)
+
+    def test_add_is_atomic(self):
+        results = self.in_threads(lambda: self.cache.add('lock', threading.get_ident(), timeout=60))
+        self.assertEqual(results.count(True), 1)
+        self.assertFalse(self.cache.add('lock', 'other'))
+
+    def test_add_replaces_expired_entry(self):
+        self.cache.set('lock', 'old', timeout=0.05)
+        time.sleep(0.1)
+        self.assertTrue(self.cache.add('lock', 'new'))
+        self.assertEqual(self.cache.get('lock'), 'new')
+
+    def test_incr_is_atomic(self):
+        self.cache.set('counter', 0)
+        self.in_threads(lambda: [self.cache.incr('counter') for _ in range(50)])
+        self.assertEqual(self.cache.get('counter'), 400)
+
+    def test_incr_beyond_64_bits(self):
+        self.cache.set('counter', 2 ** 63 - 1)
+        self.assertEqual(self.cache.incr('counter'), 2 ** 63)
+        self.assertEqual(self.cache.incr('counter', 2 ** 64), 2 ** 64 + 2 ** 63)
+        self.assertEqual(self.cache.get('counter'), 2 ** 64 + 2 ** 63)
+
+    def test_incr_missing_or_expired_key(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('counter', 1, timeout=0.05)
+        time.sleep(0.1)
+        with self.assertRaises(ValueError):
+            self.cache.incr('counter')
+
+    def test_touch(self):
+        self.cache.set('key', 'value', timeout=0.1)
+        self.assertTrue(self.cache.touch('key', timeout=60))
+        time.sleep(0.15)
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertFalse(self.cache.touch('missing'))
+
+    def test_expired_entries_are_invisible(self):
+        self.cache.set('key', 'value', timeout=0.05)
+        self.cache.set('lock', 'token', timeout=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get_many(['key']), {})
+        self.assertFalse(self.cache.touch('key'))
+        self.assertFalse(self.cache.compare_and_delete('lock', 'token'))
+
+    def test_compare_and_set_is_atomic(self):
+        self.cache.set('key', 0)
+        results = self.in_threads(lambda: self.cache.compare_and_set('key', 0, threading.get_ident()))
+        self.assertEqual(results.count(True), 1)
+        self.assertTrue(self.cache.compare_and_delete('key', self.cache.get('key')))
+        self.assertIsNone(self.cache.get('key'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SingleFlightTests(SimpleTestCase):
+    """Cache miss coalescing and stale-while-revalidate."""
+
+    def setUp(self):
+        cache.clear()
+        self.single_flight = SingleFlight()
+        self.calls = 0
+
+    def loader(self, value, release=None):
+        async def compute():
+            self.calls += 1
+            while release is not None and not release.is_set():
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            return value
+        return compute
+
+    async def test_concurrent_misses_load_once(self):
+        results = await asyncio.gather(*(
+            self.single_flight.get_or_refresh('key', self.loader('value'), timeout=60) for _ in range(20)
+        ))
+        self.assertEqual(results, ['value'] * 20)
+        self.assertEqual(self.calls, 1)
+
+    async def test_failed_load_is_shared_with_waiters(self):
+        async def compute():
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            raise ValueError('upstream down')
+
+        results = await asyncio.gather(
+            *(self.single_flight.get_or_refresh('key', compute, timeout=60) for _ in range(5)), return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get('key'))
+
+    async def test_stale_value_is_served_during_one_refresh(self):
+        await self.single_flight.store('key', 'old', timeout=0, grace=60)
+        release = threading.Event()
+        compute = self.loader('new', release)
+
+        results = await asyncio.gather(*(
+            self.single_flight.get_or_refresh('key', compute, timeout=60) for _ in range(20)
+        ))
+        self.assertEqual(results, ['old'] * 20)
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while cache.get('key')['value'] != 'new' and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        self.assertEqual(await self.single_flight.get_or_refresh('key', compute, timeout=60), 'new')
+        self.assertEqual(self.calls, 1)
+
+    async def test_background_refresh_closes_its_connections(self):
+        await self.single_flight.store('key', 'old', timeout=0, grace=60)
+        used, closed = set(), set()
+        done = threading.Event()
+
+        @sync_to_async
+        def query():
+            used.add(threading.get_ident())
+            return 'new'
+
+        def close_all():
+            closed.add(threading.get_ident())
+            if len(closed) == 2:
+                done.set()
+
+        with mock.patch('analyzer.coalescing.connections', mock.Mock(close_all=close_all)):
+            self.assertEqual(await self.single_flight.get_or_refresh('key', query, timeout=60), 'old')
+            self.assertTrue(await asyncio.to_thread(done.wait, 5))
+        # The thread the ORM ran on and the refresh thread itself.
+        self.assertLessEqual(used, closed)
+        self.assertEqual(cache.get('key')['value'], 'new')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FragmentViewTests(TransactionTestCase):
+    """Polled partials are rendered once per data version and revalidated with their ETag."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = AsyncClient()
+        self.renders = fragment_cache.stats['renders']
+
+    async def store_snapshot(self, price):
+        await cache.aset(market_snapshot_cache_key('bitcoin'), {
+            'price_data': {'price': price, 'price_change_percentage_24h': 1.5, 'high_24h': price, 'low_24h': price},
+            'fetched_at': timezone.now(),
+        })
+
+    async def test_matching_etag_is_not_modified(self):
+        await self.store_snapshot(60_000)
+        first = await self.client.get('/market_data/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn(b'$60000.00', first.content)
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        second = await self.client.get('/market_data/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(fragment_cache.stats['renders'] - self.renders, 1)
+
+    async def test_publish_retires_the_fragment(self):
+        await self.store_snapshot(60_000)
+        first = await self.client.get('/market_data/')
+        await self.store_snapshot(61_000)
+        await live.publish('market_data', 'bitcoin')
+
+        second = await self.client.get('/market_data/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertIn(b'$61000.00', second.content)
+        self.assertEqual(fragment_cache.stats['renders'] - self.renders, 2)
+
+    async def test_uncacheable_fragment_is_rendered_every_time(self):
+        # Without a snapshot or a stored tick the partial shows an error, which is not cached.
+        responses = [await self.client.get('/market_data/') for _ in range(2)]
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'Market data is not available yet.', response.content)
+            self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(fragment_cache.stats['renders'] - self.renders, 2)
+
+
+SAMPLE_LINE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)\{(?P<labels>.*)\} (?P<value>\S+)$')
+LABEL_PAIR = re.compile(r'(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)="(?P<value>(?:[^"\\]|\\.)*)",?')
+
+
+def parse_exposition(text):
+    """Parses the Prometheus text format into ``{family: (type, help, [(sample name, labels, value)])}``."""
+    families = {}
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name, help_text = line[len('# HELP '):].split(' ', 1)
+            families[name] = [None, help_text, []]
+        elif line.startswith('# TYPE '):
+            name, kind = line[len('# TYPE '):].split(' ')
+            families[name][0] = kind
+        else:
+            match = SAMPLE_LINE.match(line)
+            if match is None:
+                raise ValueError(f"Invalid sample line: {line!r}")
+            labels = {
+                pair['name']: re.sub(r'\\(.)', lambda m: '\n' if m[1] == 'n' else m[1], pair['value'])
+                for pair in LABEL_PAIR.finditer(match['labels'])
+            }
+            name = match['name']
+            family = next(f for f in (name, name.rsplit('_', 1)[0]) if f in families)
+            families[family][2].append((name, labels, float(match['value'])))
+    return families
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MetricsExpositionTests(SimpleTestCase):
+    """/metrics/ is valid Prometheus text, with every process's series told apart."""
+
+    operation = 'odd "op" \\ with\nnewline'
+
+    def setUp(self):
+        cache.clear()
+        metrics.stage_seconds.observe(('test', self.operation), 0.02)
+        metrics.stage_seconds.observe(('test', self.operation), 100)
+        cache.set(SHARED_METRICS_KEY, {'pid': os.getpid() + 1, 'families': [{
+            'name': 'cryptobrain_llm_tokens_total', 'type': 'counter', 'help': "Tokens.",
+            'labelnames': ['kind'], 'series': [[['prompt'], 5]],
+        }]})
+
+    async def test_exposition_parses(self):
+        response = await AsyncClient().get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        families = parse_exposition(text)
+
+        for name, (kind, help_text, samples) in families.items():
+            # Families of both processes share a single HELP and TYPE.
+            self.assertEqual(text.count(f'# TYPE {name} '), 1, name)
+            self.assertIn(kind, ('counter', 'gauge', 'histogram'), name)
+            self.assertTrue(help_text, name)
+            for _, labels, _ in samples:
+                self.assertIn(labels['process'], ('web', 'ingestion'))
+        kind, _, samples = families['cryptobrain_stage_duration_seconds']
+        self.assertEqual(kind, 'histogram')
+
+        # The escaped operation label reads back unchanged.
+        series = [(name, labels, value) for name, labels, value in samples if labels['stage'] == 'test']
+        self.assertEqual({labels['operation'] for _, labels, _ in series}, {self.operation})
+        self.assertEqual({labels['pid'] for _, labels, _ in series}, {str(os.getpid())})
+        buckets = [(labels['le'], value) for name, labels, value in series if name.endswith('_bucket')]
+        bounds = [float(le) for le, _ in buckets]
+        self.assertEqual(buckets[-1], ('+Inf', 2))
+        self.assertEqual(bounds, sorted(bounds))
+        self.assertEqual([value for _, value in buckets], sorted(value for _, value in buckets))
+        self.assertEqual(dict((name, value) for name, _, value in series if not name.endswith('_bucket')), {
+            'cryptobrain_stage_duration_seconds_sum': 100.02,
+            'cryptobrain_stage_duration_seconds_count': 2,
+        })
+
+        # The ingestion process's series carry its own pid.
+        _, _, tokens = families['cryptobrain_llm_tokens_total']
+        self.assertIn(
+            ('cryptobrain_llm_tokens_total', {'process': 'ingestion', 'pid': str(os.getpid() + 1), 'kind': 'prompt'}, 5),
+            tokens,
+        )
+
+
+class LockedCacheTests(TransactionTestCase):
+    """A cache write waiting for the lock of the shared cache file only holds up its own request."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'cache.sqlite3')
+        override = override_settings(CACHES={'default': {
+            'BACKEND': 'analyzer.cache_backends.SQLiteCache', 'LOCATION': path, 'OPTIONS': {'TIMEOUT': 3},
+        }})
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.set('warm', True)
+        # Another process holding the write lock of the file.
+        self.locker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.locker.execute('BEGIN IMMEDIATE')
+        self.addCleanup(self.locker.close)
+
+    async def test_views_are_served_while_a_write_waits(self):
+        client = AsyncClient()
+        # Recording the demand for the analysis waits for the lock.
+        waiting = asyncio.ensure_future(client.get('/analysis/', {'asset': 'bitcoin'}))
+        await asyncio.sleep(0.2)
+        self.assertFalse(waiting.done())
+
+        started = time.monotonic()
+        responses = await asyncio.gather(*(
+            client.get('/analysis/status/', {'asset': asset}) for asset in ('bitcoin', 'ethereum', 'solana')
+        ))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        self.assertFalse(waiting.done())
+
+        self.locker.execute('ROLLBACK')
+        self.assertEqual((await waiting).status_code, 200)
+
+
+class StreamingIndicatorsTests(SimpleTestCase):
+    """The incremental indicators agree with the batch computations of the processor."""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.prices = 60_000 + np.cumsum(rng.normal(5, 40, 500))
+
+    def feed(self, engine, prices, start=0):
+        for offset, price in enumerate(prices):
+            engine.update(float(start + offset), price, 1e9 + offset)
+
+    def reference(self, prices):
+        series = PriceSeries(np.arange(len(prices), dtype=np.int64), np.asarray(prices, dtype=np.float64),
+                             np.zeros(len(prices)))
+        return calculate_price_trend(series), calculate_moving_average(series, window=7)
+
+    def assertMatches(self, engine, prices):
+        trend, moving_average = self.reference(prices)
+        self.assertAlmostEqual(engine.price_trend()['slope'], trend['slope'], places=6)
+        self.assertEqual(engine.price_trend()['description'], trend['description'])
+        self.assertAlmostEqual(engine.moving_average(), moving_average, places=6)
+
+    def test_matches_batch_computation(self):
+        engine = StreamingIndicators(window_seconds=10_000, sma_window=7, ema_span=7)
+        self.feed(engine, self.prices)
+        self.assertMatches(engine, self.prices)
+        self.assertEqual(engine.snapshot()['count'], len(self.prices))
+
+    def test_short_series(self):
+        engine = StreamingIndicators(window_seconds=10_000, sma_window=7, ema_span=7)
+        self.feed(engine, self.prices[:1])
+        self.assertEqual(engine.price_trend(), {'slope': 0.0, 'description': 'Neutral'})
+        self.assertEqual(engine.moving_average(), 0.0)
+
+    def test_window_eviction(self):
+        engine = StreamingIndicators(window_seconds=99, sma_window=7, ema_span=7)
+        # The extremes of the series are placed early, so they are evicted.
+        prices = self.prices.copy()
+        prices[3], prices[5] = 1_000, 100_000
+        self.feed(engine, prices)
+        window = prices[-100:]
+        snapshot = engine.snapshot()
+        self.assertEqual(snapshot['count'], 100)
+        self.assertEqual((snapshot['min'], snapshot['max']), (window.min(), window.max()))
+        self.assertAlmostEqual(snapshot['mean_price'], window.mean(), places=6)
+        # The return of the oldest kept tick is measured against the tick before it.
+        returns = np.diff(np.log(prices[-101:]))
+        self.assertAlmostEqual(snapshot['volatility'], returns.std(ddof=1), places=9)
+        self.assertMatches(engine, window)
+
+    def test_out_of_order_ticks_are_rejected(self):
+        engine = StreamingIndicators(window_seconds=10_000, sma_window=7, ema_span=7)
+        self.feed(engine, self.prices[:10])
+        before = engine.snapshot()
+        self.assertFalse(engine.update(9.0, 1.0))
+        self.assertFalse(engine.update(4.0, 1.0))
+        self.assertEqual(engine.snapshot(), before)
+        self.assertTrue(engine.update(10.0, self.prices[10]))
+
+    def test_results_survive_rebase(self):
+        with mock.patch('analyzer.indicators.REBASE_INTERVAL', 64):
+            rebased = StreamingIndicators(window_seconds=99, sma_window=7, ema_span=7)
+            self.feed(rebased, self.prices)
+        plain = StreamingIndicators(window_seconds=99, sma_window=7, ema_span=7)
+        self.feed(plain, self.prices)
+        self.assertLess(rebased._updates_since_rebase, 64)
+        self.assertMatches(rebased, self.prices[-100:])
+        for field in ('count', 'min', 'max', 'sma', 'ema', 'volume_24h'):
+            self.assertEqual(rebased.snapshot()[field], plain.snapshot()[field])
+        for field in ('mean_price', 'volatility', 'mean_volume'):
+            self.assertAlmostEqual(rebased.snapshot()[field], plain.snapshot()[field], places=6)
+
+
+class FakeClock:
+    """A monotonic clock that only moves when something sleeps on it."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+
+    def __init__(self, url, status=200, body=b'{}', headers=None):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(
+                mock.Mock(real_url=self.url), (), status=self.status, message='error', headers=self.headers
+            )
+
+    async def read(self):
+        return self.body
+
+
+class FakeSession:
+    """Answers each GET with the next of the given (status, body, headers) responses."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def get(self, url, params=None, headers=None):
+        self.requests += 1
+        status, body, response_headers = self.responses.pop(0)
+        return FakeResponse(url, status, body, response_headers)
+
+
+class UpstreamProviderTests(SimpleTestCase):
+    """Rate limiting, retries and the circuit breaker of an upstream provider, on a fake clock."""
+
+    url = 'https://api.example.com/price'
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.provider = UpstreamProvider(
+            'example', rate=1.0, burst=2, max_in_flight=1, max_retries=2, backoff_base=0.0, backoff_max=60,
+            failure_threshold=2, reset_timeout=120, clock=self.clock, sleep=self.clock.sleep,
+        )
+
+    async def fetch(self, *responses):
+        self.session = FakeSession(*responses)
+        with mock.patch('analyzer.upstream.http_client', mock.Mock(get_session=lambda: self.session)):
+            return await self.provider.fetch_json('price', self.url)
+
+    async def fail(self):
+        # Every attempt fails, so the call counts as one failure of the provider.
+        return await self.fetch(*[(503, b'', {})] * (self.provider.max_retries + 1))
+
+    def test_bucket_limits_the_rate(self):
+        bucket = TokenBucket(rate=2.0, burst=2, clock=self.clock)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+        self.clock.now += 10
+        self.assertEqual(bucket.reserve(), 0.0)
+        bucket.pause(30)
+        self.assertEqual(bucket.reserve(), 30)
+
+    async def test_retry_after_is_honoured(self):
+        result = await self.fetch((429, b'', {'Retry-After': '30'}), (200, b'{"usd": 1}', {}))
+        self.assertEqual(result, {'usd': 1})
+        self.assertEqual(self.clock.sleeps, [30.0])
+        self.assertEqual(self.provider.stats['throttled'], 1)
+        self.assertEqual(self.provider.stats['retried'], 1)
+        # Every other call to the provider was held back as well.
+        self.assertEqual(self.provider.bucket._blocked_until, 30.0)
+        self.assertEqual(self.provider.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_breaker_opens_after_threshold_and_short_circuits(self):
+        for _ in range(self.provider.breaker.failure_threshold):
+            with self.assertRaises(UpstreamError):
+                await self.fail()
+        self.assertEqual(self.provider.breaker.state, CircuitBreaker.OPEN)
+
+        with self.assertRaises(UpstreamUnavailableError):
+            await self.fetch((200, b'{"usd": 1}', {}))
+        self.assertEqual(self.session.requests, 0)
+        self.assertEqual(self.provider.stats['short_circuited'], 1)
+
+    async def test_half_open_probe_closes_breaker(self):
+        for _ in range(self.provider.breaker.failure_threshold):
+            with self.assertRaises(UpstreamError):
+                await self.fail()
+        self.clock.now += self.provider.breaker.reset_timeout
+        self.assertEqual(self.provider.breaker.state, CircuitBreaker.HALF_OPEN)
+
+        self.assertEqual(await self.fetch((200, b'{"usd": 2}', {})), {'usd': 2})
+        self.assertEqual(self.session.requests, 1)
+        self.assertEqual(self.provider.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_failed_probe_reopens_breaker(self):
+        for _ in range(self.provider.breaker.failure_threshold):
+            with self.assertRaises(UpstreamError):
+                await self.fail()
+        self.clock.now += self.provider.breaker.reset_timeout
+        with self.assertRaises(UpstreamError):
+            await self.fail()
+        self.assertEqual(self.provider.breaker.state, CircuitBreaker.OPEN)
+
+    async def test_last_good_value_is_served_while_open(self):
+        self.assertEqual(await self.fetch((200, b'{"usd": 1}', {})), {'usd': 1})
+        for _ in range(self.provider.breaker.failure_threshold):
+            self.assertEqual(await self.fail(), {'usd': 1})
+        self.assertEqual(self.provider.breaker.state, CircuitBreaker.OPEN)
+
+        self.assertEqual(await self.fetch((200, b'{"usd": 2}', {})), {'usd': 1})
+        self.assertEqual(self.session.requests, 0)
+        self.assertEqual(self.provider.stats['stale_served'], self.provider.breaker.failure_threshold + 1)
+
+
+class PriceSeriesTests(SimpleTestCase):
+    """Market charts keep the points with a price and a volume; time ranges are inclusive-exclusive views."""
+
+    def setUp(self):
+        self.series = PriceSeries(
+            np.arange(0, 10 * 60_000, 60_000, dtype=np.int64),
+            60_000 + np.arange(10, dtype=np.float64),
+            1e9 + np.arange(10, dtype=np.float64),
+        )
+
+    def test_slice_bounds(self):
+        window = self.series.slice(start_ms=120_000, end_ms=300_000)
+        self.assertEqual(window.timestamps.tolist(), [120_000, 180_000, 240_000])
+        self.assertEqual(self.series.slice(start_ms=119_999, end_ms=120_001).timestamps.tolist(), [120_000])
+        self.assertEqual(len(self.series.slice(end_ms=0)), 0)
+        self.assertEqual(len(self.series.slice()), 10)
+
+    def test_slice_after_latest_stored_point(self):
+        # Ingestion appends the points newer than the latest stored one with start_ms=latest + 1.
+        latest = int(self.series.timestamps[6])
+        newer = self.series.slice(start_ms=latest + 1)
+        self.assertEqual(newer.timestamps.tolist(), [420_000, 480_000, 540_000])
+        self.assertFalse(self.series.slice(start_ms=int(self.series.timestamps[-1]) + 1))
+
+    def test_slice_shares_memory(self):
+        window = self.series.slice(start_ms=60_000, end_ms=240_000)
+        self.assertTrue(np.shares_memory(window.prices, self.series.prices))
+        self.assertTrue(np.shares_memory(window.volumes, self.series.volumes))
+
+    def test_from_market_chart_drops_points_without_volume(self):
+        prices = [[0, 60_000.0], [60_000, 60_001.0], [120_000, None], [180_000, 60_003.0]]
+        volumes = [[0, 1e9], [60_000, None], [120_000, 3e9], [180_000, 4e9]]
+        series = PriceSeries.from_market_chart(prices, volumes)
+        self.assertEqual(series.timestamps.dtype, np.int64)
+        self.assertEqual(series.timestamps.tolist(), [0, 180_000])
+        self.assertEqual(series.prices.tolist(), [60_000.0, 60_003.0])
+        self.assertEqual(series.volumes.tolist(), [1e9, 4e9])
+
+    def test_from_market_chart_matches_uneven_volumes_by_timestamp(self):
+        prices = [[0, 60_000.0], [60_000, 60_001.0], [120_000, 60_002.0], [180_000, 60_003.0]]
+        # The volumes lack one point, carry one the prices do not, and one is null.
+        volumes = [[0, 1e9], [120_000, float('nan')], [180_000, 4e9], [240_000, 5e9]]
+        series = PriceSeries.from_market_chart(prices, volumes)
+        self.assertEqual(series.timestamps.tolist(), [0, 180_000])
+        self.assertEqual(series.prices.tolist(), [60_000.0, 60_003.0])
+        self.assertEqual(series.volumes.tolist(), [1e9, 4e9])
+
+    def test_from_market_chart_without_volumes_is_empty(self):
+        series = PriceSeries.from_market_chart([[0, 60_000.0], [60_000, 60_001.0]], [])
+        self.assertFalse(series)
+        self.assertEqual(series.timestamps.dtype, np.int64)
+
+    def test_from_rows_stores_missing_volume_as_nan(self):
+        moment = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        series = PriceSeries.from_rows([(moment, 60_000.0, None), (moment + timedelta(minutes=1), 60_001.0, 5.0)])
+        self.assertEqual(series.timestamps.tolist(), [1_704_067_200_000, 1_704_067_260_000])
+        self.assertTrue(np.isnan(series.volumes[0]))
+        self.assertEqual(series.datetime_at(1), moment + timedelta(minutes=1))
+
+
+class DownsamplingTests(SimpleTestCase):
+    """LTTB keeps the shape of a series; OHLCV buckets hold the first, highest, lowest and last price."""
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.series = PriceSeries(
+            np.arange(0, 1000 * 60_000, 60_000, dtype=np.int64),
+            60_000 + np.cumsum(rng.normal(0, 30, 1000)),
+            1e9 + np.arange(1000, dtype=np.float64),
+        )
+
+    def test_lttb_keeps_first_last_and_threshold(self):
+        self.series.prices[500] = 100_000
+        sampled = lttb(self.series, 100)
+        self.assertEqual(len(sampled), 100)
+        self.assertEqual(sampled.timestamps[0], self.series.timestamps[0])
+        self.assertEqual(sampled.timestamps[-1], self.series.timestamps[-1])
+        self.assertTrue(np.all(np.diff(sampled.timestamps) > 0))
+        self.assertTrue(np.isin(sampled.timestamps, self.series.timestamps).all())
+        self.assertIn(100_000, sampled.prices)
+
+    def test_lttb_passes_short_series_through(self):
+        short = self.series.slice(end_ms=self.series.timestamps[50])
+        self.assertIs(lttb(short, 50), short)
+        self.assertIs(lttb(short, 100), short)
+        self.assertIs(lttb(self.series, 2), self.series)
+
+    def test_ohlcv_buckets(self):
+        series = PriceSeries(
+            np.array([0, 10_000, 59_999, 60_000, 180_000, 200_000], dtype=np.int64),
+            np.array([5.0, 9.0, 1.0, 4.0, 7.0, 6.0]),
+            np.array([1.0, 2.0, 3.0, 4.0, np.nan, 6.0]),
+        )
+        buckets = ohlcv_buckets(series, 60_000)
+        expected = {
+            # The bucket from 120 000 ms has no ticks and is left out.
+            'timestamps': [0, 60_000, 180_000],
+            'open': [5.0, 4.0, 7.0],
+            'high': [9.0, 4.0, 7.0],
+            'low': [1.0, 4.0, 6.0],
+            'close': [1.0, 4.0, 6.0],
+            'volume': [3.0, 4.0, 6.0],
+            'count': [3, 1, 2],
+        }
+        for key, values in expected.items():
+            np.testing.assert_array_equal(buckets[key], values, err_msg=key)
+        self.assertEqual(len(ohlcv_buckets(PriceSeries.empty(), 60_000)['timestamps']), 0)
+
+    def test_rollup_of_buckets_matches_wider_buckets(self):
+        rolled = rollup_buckets(ohlcv_buckets(self.series, 300_000), 3_600_000)
+        direct = ohlcv_buckets(self.series, 3_600_000)
+        for key, values in direct.items():
+            np.testing.assert_array_equal(rolled[key], values, err_msg=key)
+
+
+class RetentionPolicyTests(SimpleTestCase):
+    """Charts read from the coarsest tier that still covers the range with enough points."""
+
+    def setUp(self):
+        self.policy = RetentionPolicy(raw_days=7, tiers=[(300, 30), (3600, 365), (86400, None)], partition_days=1)
+
+    def test_raw_ticks_up_to_their_retention(self):
+        self.assertIsNone(self.policy.select_resolution(7, 2017))
+        self.assertEqual(self.policy.select_resolution(7, 2016), 300)
+        # One day past the raw retention, the finest tier is used even if it has too few points.
+        self.assertEqual(self.policy.select_resolution(8, 10_000), 300)
+
+    def test_tier_edges(self):
+        self.assertEqual(self.policy.select_resolution(30, 8640), 300)
+        self.assertEqual(self.policy.select_resolution(31, 8640), 3600)
+        self.assertEqual(self.policy.select_resolution(365, 8760), 3600)
+        self.assertEqual(self.policy.select_resolution(365, 365), 86400)
+        self.assertEqual(self.policy.select_resolution(366, 10_000), 86400)
+
+    def test_longest_retention_when_nothing_covers_the_range(self):
+        policy = RetentionPolicy(raw_days=7, tiers=[(300, 30)], partition_days=1)
+        self.assertEqual(policy.select_resolution(60, 100), 300)
+
+    def test_invalid_policies(self):
+        with self.assertRaises(ValueError):
+            RetentionPolicy(raw_days=7, tiers=[(300, 30), (1000, None)], partition_days=1)
+        with self.assertRaises(ValueError):
+            RetentionPolicy(raw_days=1, tiers=[(300, 30)], partition_days=1, late_seconds=86400)
+
+
+class PriceHistoryWriteTests(TransactionTestCase):
+    """Price writes are idempotent: replays and overlapping batches never duplicate a tick."""
+
+    asset = 'bitcoin'
+
+    def ticks(self, count):
+        start = floor_datetime(timezone.now(), 3600) - timedelta(hours=1)
+        return [
+            {'timestamp': start + timedelta(seconds=30 * i), 'price': 60_000 + i, 'volume_24h': 1e9 + i}
+            for i in range(count)
+        ]
+
+    async def stored(self):
+        return [
+            row async for row in BitcoinPriceHistory.objects.filter(asset=self.asset)
+            .order_by('timestamp').values_list('timestamp', 'price', 'volume_24h')
+        ]
+
+    async def test_replayed_and_overlapping_batches_store_each_tick_once(self):
+        ticks = self.ticks(90)
+        await save_price_history_bulk(self.asset, ticks[:60], batch_size=7)
+        first = await self.stored()
+        await save_price_history_bulk(self.asset, ticks[:60], batch_size=7)
+        self.assertEqual(await self.stored(), first)
+
+        replaced = [{**tick, 'price': 1.0} for tick in ticks[30:90]]
+        await save_price_history_bulk(self.asset, replaced, batch_size=7)
+        rows = await self.stored()
+        self.assertEqual(len(rows), 90)
+        # Ticks already stored keep their first values; only the new ones are inserted.
+        self.assertEqual(rows[:60], first)
+        self.assertEqual({price for _, price, _ in rows[60:]}, {1.0})
+
+    async def test_single_price_is_updated_in_place(self):
+        tick = self.ticks(1)[0]
+        await save_single_price_history(self.asset, tick)
+        original = await BitcoinPriceHistory.objects.aget(asset=self.asset)
+        await save_single_price_history(self.asset, {**tick, 'price': 61_000.0, 'volume_24h': 2e9})
+        updated = await BitcoinPriceHistory.objects.aget(asset=self.asset)
+        self.assertEqual(updated.pk, original.pk)
+        self.assertEqual((updated.timestamp, updated.price, updated.volume_24h), (tick['timestamp'], 61_000.0, 2e9))
+
+
+class PriceRollupTests(TransactionTestCase):
+    """Rollups agree with the OHLCV aggregation of the raw ticks, and expire tier by tier."""
+
+    asset = 'bitcoin'
+
+    def ticks(self, start, end, step):
+        rng = np.random.default_rng(3)
+        return [
+            {
+                'timestamp': start + timedelta(seconds=offset),
+                'price': round(60_000 + float(rng.normal(0, 100)), 2),
+                'volume_24h': 1e9 + offset,
+            }
+            for offset in range(0, int((end - start).total_seconds()), step)
+        ]
+
+    @sync_to_async
+    def assertRolledUp(self, resolution):
+        series = _series_from_queryset(BitcoinPriceHistory.objects.filter(asset=self.asset))
+        expected = ohlcv_buckets(series, resolution * 1000)
+        rollups = _load_rollup_buckets(self.asset, resolution)
+        self.assertEqual(rollups.keys(), expected.keys())
+        for key, values in expected.items():
+            np.testing.assert_allclose(rollups[key], values, err_msg=key)
+
+    async def test_rollups_match_ohlcv_buckets(self):
+        start = floor_datetime(timezone.now(), 3600) - timedelta(hours=3)
+        await save_price_history_bulk(self.asset, self.ticks(start, start + timedelta(hours=3), 37))
+        written = await roll_up_price_history(self.asset, [300, 3600], late_seconds=6 * 3600)
+        self.assertEqual(written, {300: 36, 3600: 3})
+        await self.assertRolledUp(300)
+        await self.assertRolledUp(3600)
+
+    async def test_late_ticks_are_rolled_up_again(self):
+        start = floor_datetime(timezone.now(), 3600) - timedelta(hours=3)
+        await save_price_history_bulk(self.asset, self.ticks(start, start + timedelta(hours=3), 37))
+        await roll_up_price_history(self.asset, [300, 3600], late_seconds=6 * 3600)
+
+        # A tick stored after its bucket was rolled up, and a tick updated in place.
+        late = {'timestamp': start + timedelta(hours=3, seconds=-10), 'price': 70_000, 'volume_24h': 2e9}
+        await save_price_history_bulk(self.asset, [late])
+        await save_single_price_history(self.asset, {'timestamp': start, 'price': 50_000, 'volume_24h': 1e9})
+        await roll_up_price_history(self.asset, [300, 3600], late_seconds=6 * 3600)
+
+        self.assertEqual(await PriceRollup.objects.filter(asset=self.asset).acount(), 36 + 3)
+        await self.assertRolledUp(300)
+        await self.assertRolledUp(3600)
+        hour = await PriceRollup.objects.aget(asset=self.asset, resolution=3600, bucket_start=start + timedelta(hours=2))
+        self.assertEqual((hour.high, hour.close), (70_000, 70_000))
+
+    async def test_raw_ticks_are_kept_until_the_next_tier_covers_them(self):
+        today = floor_datetime(timezone.now(), 86400)
+        await save_price_history_bulk(
+            self.asset, self.ticks(today - timedelta(days=3), timezone.now() - timedelta(minutes=10), 600)
+        )
+        await roll_up_price_history(self.asset, [300, 3600])
+        policy = RetentionPolicy(raw_days=1, tiers=[(300, 2), (3600, None)], partition_days=1)
+        ticks = BitcoinPriceHistory.objects.filter(asset=self.asset)
+        total = await ticks.acount()
+
+        # The 5-minute tier lags behind: only the raw ticks it covers may expire.
+        covered = today - timedelta(days=2, hours=-6)
+        await PriceRollup.objects.filter(asset=self.asset, resolution=300, bucket_start__gte=covered).adelete()
+        deletes = mock.AsyncMock(side_effect=delete_price_partition)
+        with mock.patch('analyzer.retention.roll_up_price_history', mock.AsyncMock(return_value={})), \
+                mock.patch('analyzer.retention.delete_price_partition', deletes):
+            deleted = await policy.enforce(self.asset)
+
+        # Deletes run one day-wide partition at a time, and only over whole expired partitions.
+        day = (today - timedelta(days=3), today - timedelta(days=2))
+        self.assertEqual(deletes.await_args_list, [
+            mock.call(self.asset, None, *day), mock.call(self.asset, 300, *day),
+        ])
+        self.assertEqual(await ticks.filter(timestamp__lt=day[1]).acount(), 0)
+        self.assertEqual(await ticks.acount(), total - 144)
+        self.assertEqual(deleted, 144 + 144)
+
+        # Once the tier catches up, the raw ticks of the next expired day go as well.
+        await roll_up_price_history(self.asset, [300, 3600])
+        with mock.patch('analyzer.retention.timezone.now', return_value=today + timedelta(hours=1)):
+            await policy.enforce(self.asset)
+        self.assertEqual(await ticks.filter(timestamp__lt=today - timedelta(days=1)).acount(), 0)
+        self.assertEqual(await ticks.filter(timestamp__gte=today - timedelta(days=1)).acount(), total - 288)
+
+
+class QuotaError(Exception):
+    pass
+
+
+class AnalysisJobQueueTests(TransactionTestCase):
+    """The persistent analysis job queue. Its writes run on the database writer
+    thread, so the tests commit for real instead of running in a transaction."""
+
+    def setUp(self):
+        self.queue = AnalysisJobQueue(
+            concurrency=1, max_attempts=2, backoff=60, max_backoff=600, poll_interval=0.01, keep=timedelta(hours=1)
+        )
+
+    async def run_until(self, handler, done, timeout=5):
+        """Runs the worker pool until ``done()`` returns True."""
+        stop = asyncio.Event()
+        pool = asyncio.create_task(self.queue.run(handler, (QuotaError,), stop))
+        async def wait():
+            while not done():
+                await asyncio.sleep(0.01)
+
+        try:
+            await asyncio.wait_for(wait(), timeout)
+        finally:
+            stop.set()
+            await pool
+
+    async def test_enqueue_deduplicates_active_jobs(self):
+        first, created = await self.queue.enqueue('bitcoin', 'f1', {}, AnalysisJob.Priority.SCHEDULED)
+        self.assertTrue(created)
+        again, created = await self.queue.enqueue('bitcoin', 'f1', {}, AnalysisJob.Priority.USER)
+        self.assertEqual((again, created), (first, False))
+        job = await AnalysisJob.objects.aget(pk=first)
+        self.assertEqual(job.priority, AnalysisJob.Priority.USER)
+        self.assertEqual(await AnalysisJob.objects.acount(), 1)
+        self.assertEqual((self.queue.stats['enqueued'], self.queue.stats['deduplicated']), (1, 1))
+
+    async def test_enqueue_after_finish_creates_a_new_job(self):
+        first, _ = await self.queue.enqueue('bitcoin', 'f1', {})
+        await AnalysisJob.objects.filter(pk=first).aupdate(status=AnalysisJob.Status.DONE)
+        second, created = await self.queue.enqueue('bitcoin', 'f1', {})
+        self.assertTrue(created)
+        self.assertNotEqual(first, second)
+
+    async def test_one_active_job_per_fingerprint(self):
+        await AnalysisJob.objects.acreate(asset='bitcoin', fingerprint='f1', payload={})
+        await AnalysisJob.objects.acreate(asset='bitcoin', fingerprint='f1', payload={}, status=AnalysisJob.Status.DONE)
+        with self.assertRaises(IntegrityError):
+            await AnalysisJob.objects.acreate(
+                asset='bitcoin', fingerprint='f1', payload={}, status=AnalysisJob.Status.RUNNING
+            )
+
+    async def test_user_lane_runs_first_then_in_order(self):
+        await self.queue.enqueue('bitcoin', 'f1', {}, AnalysisJob.Priority.SCHEDULED)
+        await self.queue.enqueue('ethereum', 'f2', {}, AnalysisJob.Priority.USER)
+        await self.queue.enqueue('solana', 'f3', {}, AnalysisJob.Priority.USER)
+        await AnalysisJob.objects.acreate(
+            asset='cardano', fingerprint='f4', payload={}, run_after=timezone.now() + timedelta(hours=1)
+        )
+        order = []
+
+        async def handler(job):
+            order.append(job.asset)
+
+        await self.run_until(handler, lambda: self.queue.stats['completed'] == 3)
+        self.assertEqual(order, ['ethereum', 'solana', 'bitcoin'])
+        job = await AnalysisJob.objects.aget(asset='cardano')
+        self.assertEqual((job.status, job.attempts), (AnalysisJob.Status.PENDING, 0))
+
+    async def test_retryable_failure_backs_off_then_fails(self):
+        job_id, _ = await self.queue.enqueue('bitcoin', 'f1', {})
+
+        async def handler(job):
+            raise QuotaError('Quota exceeded.')
+
+        started = timezone.now()
+        await self.run_until(handler, lambda: self.queue.stats['retried'] == 1)
+        job = await AnalysisJob.objects.aget(pk=job_id)
+        self.assertEqual((job.status, job.attempts, job.error), (AnalysisJob.Status.PENDING, 1, 'Quota exceeded.'))
+        self.assertGreaterEqual(job.run_after, started + timedelta(seconds=60))
+
+        # The last attempt fails the job for good.
+        await AnalysisJob.objects.filter(pk=job_id).aupdate(run_after=timezone.now())
+        await self.run_until(handler, lambda: self.queue.stats['failed'] == 1)
+        job = await AnalysisJob.objects.aget(pk=job_id)
+        self.assertEqual((job.status, job.attempts), (AnalysisJob.Status.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    async def test_other_failures_are_not_retried(self):
+        job_id, _ = await self.queue.enqueue('bitcoin', 'f1', {})
+
+        async def handler(job):
+            raise ValueError('bad payload')
+
+        await self.run_until(handler, lambda: self.queue.stats['failed'] == 1)
+        job = await AnalysisJob.objects.aget(pk=job_id)
+        self.assertEqual((job.status, job.attempts, job.error), (AnalysisJob.Status.FAILED, 1, 'bad payload'))
+
+    async def test_interrupted_jobs_run_again_on_start(self):
+        stale = await AnalysisJob.objects.acreate(
+            asset='bitcoin', fingerprint='f1', payload={}, status=AnalysisJob.Status.RUNNING, attempts=1
+        )
+        handled = []
+
+        async def handler(job):
+            handled.append(job.pk)
+
+        await self.run_until(handler, lambda: self.queue.stats['completed'] == 1)
+        job = await AnalysisJob.objects.aget(pk=stale.pk)
+        self.assertEqual(handled, [stale.pk])
+        self.assertEqual((job.status, job.attempts), (AnalysisJob.Status.DONE, 2))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@mock.patch.dict(os.environ, {'CRYPTOPANIC_API_KEY': 'test'})
+class NewsIngestionTests(TransactionTestCase):
+    """Incremental news polling skips the posts that are already stored, and only those."""
+
+    def setUp(self):
+        self.scheduler = IngestionScheduler.from_settings()
+        for asset in self.scheduler.assets:
+            news_clusters.load(asset['id'], [])
+        self.feed = mock.AsyncMock()
+        patcher = mock.patch.object(upstream, 'provider', return_value=mock.Mock(fetch_json=self.feed))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, *posts, code='BTC'):
+        self.feed.return_value = {'results': [
+            {'slug': slug, 'title': title, 'published_at': published_at, 'currencies': [{'code': code}],
+             'source': {'title': 'Test'}}
+            for slug, title, published_at in posts
+        ]}
+
+    async def stored(self):
+        return [url.rsplit('/', 1)[1] async for url in BitcoinNews.objects.order_by('url').values_list('url', flat=True)]
+
+    async def test_older_posts_are_skipped(self):
+        self.respond(('a', 'Bitcoin ETF approved', '2024-05-01T12:00:00Z'))
+        await self.scheduler.ingest_news()
+        self.respond(
+            ('old', 'Miners sell reserves', '2024-05-01T11:00:00Z'),
+            ('same', 'Exchange lists new pairs', '2024-05-01T12:00:00Z'),
+            ('new', 'Halving countdown begins', '2024-05-01T13:00:00Z'),
+        )
+        await self.scheduler.ingest_news()
+        self.assertEqual(await self.stored(), ['a', 'new', 'same'])
+
+    async def test_quiet_asset_keeps_its_own_watermark(self):
+        self.respond(('eth', 'Ethereum upgrade scheduled', '2024-05-01T09:00:00Z'), code='ETH')
+        await self.scheduler.ingest_news()
+        self.respond(('btc', 'Bitcoin ETF approved', '2024-05-01T12:00:00Z'))
+        await self.scheduler.ingest_news()
+        # Older than the newest Bitcoin post, but newer than the newest Ethereum one.
+        self.respond(
+            ('eth-old', 'Ethereum fees fall', '2024-05-01T08:00:00Z'),
+            ('eth-new', 'Ethereum staking grows', '2024-05-01T10:00:00Z'),
+            code='ETH',
+        )
+        await self.scheduler.ingest_news()
+        self.assertEqual(await self.stored(), ['btc', 'eth', 'eth-new'])
+
+    async def test_failed_save_does_not_skip_posts(self):
+        self.respond(
+            ('a', 'Bitcoin ETF approved', '2024-05-01T12:00:00Z'),
+            ('b', 'Miners sell reserves', '2024-05-01T11:00:00Z'),
+        )
+        with mock.patch('analyzer.ingestion.save_news_items', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                await self.scheduler.ingest_news()
+        # A fresh scheduler, as after a restart, reads the watermark from the database.
+        self.scheduler = IngestionScheduler.from_settings()
+        await self.scheduler.ingest_news()
+        self.assertEqual(await self.stored(), ['a', 'b'])
+
+
+class NewsClusterIndexTests(TransactionTestCase):
+    """The near-duplicate index only holds the news items that were committed."""
+
+    def setUp(self):
+        news_clusters.load('bitcoin', [])
+        now = timezone.now()
+        self.items = [
+            {'asset': 'bitcoin', 'url': f'https://news.test/{slug}', 'title': title,
+             'published_at': now - timedelta(minutes=minutes), 'source': 'Test'}
+            for slug, title, minutes in [
+                ('a', 'Bitcoin ETF approved by the SEC', 3),
+                ('b', 'Bitcoin ETF approved by the SEC today', 2),
+                ('c', 'Miners sell their reserves', 1),
+            ]
+        ]
+
+    async def test_duplicates_are_indexed_once(self):
+        await save_news_items(self.items + self.items[:1])
+        await save_news_items(self.items)
+        self.assertEqual(news_clusters.size('bitcoin'), 3)
+        clusters = {url: cluster async for url, cluster in BitcoinNews.objects.values_list('url', 'cluster_key')}
+        self.assertEqual(clusters['https://news.test/a'], clusters['https://news.test/b'])
+        self.assertNotEqual(clusters['https://news.test/a'], clusters['https://news.test/c'])
+
+    async def test_rolled_back_save_is_not_indexed(self):
+        def fail():
+            raise IntegrityError('constraint failed')
+
+        with mock.patch('analyzer.storage.BitcoinNews.objects.bulk_create', side_effect=IntegrityError('locked')):
+            with self.assertRaises(IntegrityError):
+                await save_news_items(self.items)
+        self.assertEqual(news_clusters.size('bitcoin'), 0)
+
+        # A failing write committed in the same batch rolls the save back; it is then retried on its own.
+        retried = db_writer.stats['retried']
+        results = await asyncio.gather(
+            save_news_items(self.items), asyncio.wrap_future(db_writer.submit(fail)), return_exceptions=True
+        )
+        self.assertEqual(results[0], {'bitcoin'})
+        self.assertIsInstance(results[1], IntegrityError)
+        self.assertEqual(db_writer.stats['retried'], retried + 2)
+        self.assertEqual(news_clusters.size('bitcoin'), await BitcoinNews.objects.acount())
+
+
+class WriteQueueTests(TransactionTestCase):
+    """The single writer thread batches writes, skips cancelled ones and counts its work."""
+
+    def setUp(self):
+        self.writer = WriteQueue(max_batch=8, flush_interval=0.05)
+        self.addCleanup(self.writer.close)
+
+    def test_cancelled_write_is_skipped(self):
+        release = threading.Event()
+        calls = []
+        blocker = self.writer.submit(release.wait)
+        cancelled = self.writer.submit(calls.append, 'cancelled')
+        self.assertTrue(cancelled.cancel())
+        release.set()
+        self.assertTrue(blocker.result(timeout=5))
+        self.assertEqual(self.writer.submit(calls.append, 'kept').result(timeout=5), None)
+        self.assertEqual(calls, ['kept'])
+        self.assertTrue(self.writer._thread.is_alive())
+
+    def test_failed_batch_is_retried_one_by_one(self):
+        def fail():
+            raise ValueError('bad write')
+
+        futures = [self.writer.submit(int, '1'), self.writer.submit(fail), self.writer.submit(int, '3')]
+        self.assertEqual(futures[0].result(timeout=5), 1)
+        with self.assertRaises(ValueError):
+            futures[1].result(timeout=5)
+        self.assertEqual(futures[2].result(timeout=5), 3)
+        self.assertEqual(self.writer.snapshot(), {'writes': 2, 'transactions': 2, 'retried': 3})
+
+
+class AnalysisCacheTests(TransactionTestCase):
+    """The persistent store of analysis results, written through the database writer thread."""
+
+    def setUp(self):
+        self.cache = AnalysisCache(ttl=3600, max_entries=2, price_tolerance=0.005, volume_tolerance=0.05)
+
+    async def test_hits_are_written_in_batches(self):
+        await self.cache.set('f1', {'summary': 'one'})
+        for _ in range(3):
+            self.assertEqual(await self.cache.get('f1'), {'summary': 'one'})
+        self.assertIsNone(await self.cache.get('f2'))
+        entry = await AnalysisCacheEntry.objects.aget(fingerprint='f1')
+        self.assertEqual(entry.hit_count, 0)
+
+        await self.cache.flush()
+        used = await AnalysisCacheEntry.objects.aget(fingerprint='f1')
+        self.assertEqual(used.hit_count, 3)
+        self.assertGreater(used.last_used_at, entry.last_used_at)
+        self.assertEqual(self.cache.stats()['hits'], 3)
+
+    async def test_least_recently_used_entry_is_evicted(self):
+        await self.cache.set('f1', {'summary': 'one'})
+        await self.cache.set('f2', {'summary': 'two'})
+        await self.cache.get('f1')
+        # The pending use of f1 is written before the eviction.
+        await self.cache.set('f3', {'summary': 'three'})
+        fingerprints = [fingerprint async for fingerprint in AnalysisCacheEntry.objects.order_by(
+            'fingerprint').values_list('fingerprint', flat=True)]
+        self.assertEqual(fingerprints, ['f1', 'f3'])
+
+    async def test_concurrent_lookups_and_stores(self):
+        await asyncio.gather(*(
+            self.cache.set(f'f{i}', {'summary': i}) if i % 2 else self.cache.get(f'f{i - 1}') for i in range(40)
+        ))
+        await self.cache.flush()
+        self.assertEqual(await AnalysisCacheEntry.objects.acount(), 2)
+
+
+COMPLETION = {
+    'market_sentiment': 'Bullish',
+    'trend_prediction': 'Uptrend',
+    'confidence_score': 0.8,
+    'analysis_summary': 'Demand is outpacing supply.',
+    'detailed_reasoning': 'ETF inflows keep rising while exchange reserves fall.',
+}
+
+ANALYSIS_INPUTS = {
+    'news_titles': ['Bitcoin ETF inflows hit a record'],
+    'price_trend': {'slope': 1.0, 'description': 'Bullish'},
+    'moving_average': 60_000.0,
+    'current_price': 61_000.0,
+    'volume_24h': 1e9,
+    'asset_name': 'Bitcoin',
+    'asset_symbol': 'BTC',
+}
+
+
+class SlowChatModel(GenericFakeChatModel):
+    """Streams its completion word by word, ``delay`` seconds apart."""
+
+    delay: float = 0.0
+
+    def _stream(self, *args, **kwargs):
+        for chunk in super()._stream(*args, **kwargs):
+            time.sleep(self.delay)
+            yield chunk
+
+
+def slow_orchestrator(delay):
+    """Returns an uncached orchestrator whose model streams ``COMPLETION`` in a JSON code block."""
+    completion = AIMessage(content=f"```json\n{json.dumps(COMPLETION, indent=2)}\n```")
+    return AgentOrchestrator(llm=SlowChatModel(messages=iter([completion]), delay=delay))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StreamingAnalysisTests(SimpleTestCase):
+    """The fields of an analysis are published one by one while the model is still generating."""
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_fields_are_reported_as_they_complete(self):
+        reported = []
+
+        async def on_partial(fields):
+            reported.append(fields)
+
+        result = await slow_orchestrator(0.001).get_comprehensive_analysis(**ANALYSIS_INPUTS, on_partial=on_partial)
+        self.assertEqual(result, COMPLETION)
+        # A field is reported once the next one starts; the last one only with the result.
+        fields = list(COMPLETION)
+        self.assertEqual(reported, [{name: COMPLETION[name] for name in fields[:n]} for n in range(1, len(fields))])
+
+    async def test_job_publishes_progress_then_result(self):
+        asset = get_tracked_assets()['bitcoin']
+        published = []
+
+        async def publish(topic, asset_id):
+            published.append((await cache.aget(_progress_key(asset_id)) or {}).get('fields'))
+
+        job = AnalysisJob(asset='bitcoin', fingerprint='f1', payload=ANALYSIS_INPUTS, created_at=timezone.now())
+        with mock.patch('analyzer.analysis_service.agent_orchestrator', slow_orchestrator(0.001)), \
+                mock.patch('analyzer.analysis_service.publish', publish):
+            await run_analysis_job(job)
+
+        self.assertEqual(published[0], {'market_sentiment': 'Bullish'})
+        self.assertNotIn('detailed_reasoning', published[-2])
+        # The complete analysis replaces the progress.
+        self.assertIsNone(published[-1])
+        context, complete = await get_analysis_progress(asset)
+        self.assertTrue(complete)
+        self.assertEqual(context['sentiment_prediction'], {'sentiment': 'Bullish', 'confidence_percentage': 80})
+        self.assertFalse(context['streaming'])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}, AGENT={'DEADLINE': 0}
+)
+class AnalysisDeadlineTests(TransactionTestCase):
+    """Past the deadline the panel shows the rule-based analysis until the model's arrives."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('analyzer.indicators.indicator_engines', IndicatorRegistry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.asset = get_tracked_assets()['bitcoin']
+        self.shown = []
+
+    async def store_history(self):
+        start = timezone.now() - timedelta(hours=1)
+        await save_price_history_bulk('bitcoin', [
+            {'timestamp': start + timedelta(minutes=minute), 'price': 60_000 + 100 * minute, 'volume_24h': 1e9}
+            for minute in range(60)
+        ])
+        # The panel queued the analysis, as in _request_from_panel.
+        await cache.aset(_progress_key('bitcoin'), {})
+
+    async def run_job(self, orchestrator):
+        async def publish(topic, asset_id):
+            self.shown.append(await get_analysis_progress(self.asset))
+
+        job = AnalysisJob(asset='bitcoin', fingerprint='f1', payload=ANALYSIS_INPUTS, created_at=timezone.now())
+        with mock.patch('analyzer.analysis_service.agent_orchestrator', orchestrator), \
+                mock.patch('analyzer.analysis_service.publish', publish):
+            await run_analysis_job(job)
+
+    async def test_fallback_until_the_model_finishes(self):
+        await self.store_history()
+        await self.run_job(slow_orchestrator(0.005))
+
+        fallback, complete = self.shown[0]
+        self.assertFalse(complete)
+        self.assertEqual(fallback['fallback_reason'], SLOW_ANALYSIS_MESSAGE)
+        self.assertEqual(fallback['trend_prediction']['prediction'], 'Uptrend')
+        # Decoded fields of the model take over from the fallback, then its complete analysis.
+        self.assertIn((False, 'Bullish', None), [
+            (complete, context.get('sentiment_prediction', {}).get('sentiment'), context['fallback_reason'])
+            for context, complete in self.shown
+        ])
+        context, complete = self.shown[-1]
+        self.assertTrue(complete)
+        self.assertIsNone(context['fallback_reason'])
+        self.assertEqual(context['analysis_summary'], COMPLETION['analysis_summary'])
+        self.assertEqual(await get_analysis_progress(self.asset), (context, True))
+
+    async def test_fallback_when_the_model_fails(self):
+        await self.store_history()
+        with self.assertRaises(AnalysisUnavailableError):
+            await self.run_job(AgentOrchestrator(llm=GenericFakeChatModel(messages=iter([]))))
+
+        context, complete = await get_analysis_progress(self.asset)
+        self.assertFalse(complete)
+        self.assertEqual(context['fallback_reason'], 'AI analysis is temporarily unavailable.')
+        self.assertEqual(context['sentiment_prediction']['sentiment'], 'Bullish')
+
+
+class RuleBasedAnalysisTests(SimpleTestCase):
+    """The rule-based analysis votes with the trend and the moving average, weighted by volume."""
+
+    def indicators(self, trend, price, sma, volume=None, mean_volume=None):
+        return {'trend': {'slope': 0.0, 'description': trend}, 'price': price, 'sma': sma,
+                'volume_24h': volume, 'mean_volume': mean_volume}
+
+    def analyze(self, *args, **kwargs):
+        result = rule_based_analysis(self.indicators(*args, **kwargs))
+        # Shaped like the model's analysis.
+        self.assertEqual(ComprehensiveAnalysis(**result).dict(), result)
+        return result
+
+    def test_agreeing_signals_with_volume(self):
+        result = self.analyze('Strongly Bullish', 102, 100, volume=1.5e9, mean_volume=1e9)
+        self.assertEqual(
+            (result['market_sentiment'], result['trend_prediction'], result['confidence_score']),
+            ('Bullish', 'Uptrend', 0.5),
+        )
+        self.assertIn('above the SMA', result['detailed_reasoning'])
+        self.assertIn('confirming the move', result['detailed_reasoning'])
+
+    def test_weak_volume_lowers_confidence(self):
+        result = self.analyze('Bearish', 99, 100, volume=0.5e9, mean_volume=1e9)
+        self.assertEqual(
+            (result['market_sentiment'], result['trend_prediction'], result['confidence_score']),
+            ('Bearish', 'Downtrend', 0.3),
+        )
+
+    def test_conflicting_signals_are_sideways(self):
+        result = self.analyze('Bullish', 99, 100, volume=1.5e9, mean_volume=1e9)
+        self.assertEqual(
+            (result['market_sentiment'], result['trend_prediction'], result['confidence_score']),
+            ('Neutral', 'Sideways', 0.2),
+        )
+        self.assertIn('below its moving average', result['analysis_summary'])
+
+    def test_missing_indicators(self):
+        result = self.analyze('Neutral', 100, 0.0)
+        self.assertEqual((result['market_sentiment'], result['confidence_score']), ('Neutral', 0.2))
+        self.assertIn('not enough ticks for an SMA', result['detailed_reasoning'])
+        self.assertIn('Volume: not available', result['detailed_reasoning'])
 
-# Create your tests here.
@@ -0,0 +1,432 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from datetime import datetime, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+import aiohttp
+import orjson
+from .conf import app_settings
+from .http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+# Every call to a provider waits for a token (RATE per second, up to BURST back
+# to back) and for one of MAX_IN_FLIGHT slots. 429, 5xx and network errors are
+# retried up to MAX_RETRIES times with jittered exponential backoff (seconds)
+# that honours Retry-After. After FAILURE_THRESHOLD failed calls in a row the
+# provider is left alone for RESET_TIMEOUT seconds and the last good result of
+# each request is served instead.
+DEFAULT_UPSTREAM_SETTINGS = {
+    'PROVIDERS': {
+        'coingecko': {'RATE': 0.25, 'BURST': 3, 'MAX_IN_FLIGHT': 2},
+        'cryptopanic': {'RATE': 0.1, 'BURST': 2, 'MAX_IN_FLIGHT': 1},
+    },
+    'MAX_RETRIES': 3,
+    'BACKOFF_BASE': 1.0,
+    'BACKOFF_MAX': 60,
+    'FAILURE_THRESHOLD': 5,
+    'RESET_TIMEOUT': 120,
+}
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def get_upstream_settings():
+    """Returns the UPSTREAM settings merged over the built-in defaults."""
+    return app_settings('UPSTREAM', DEFAULT_UPSTREAM_SETTINGS)
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream call failed and no previous result can be served instead."""
+    pass
+
+
+class UpstreamUnavailableError(UpstreamError):
+    """Raised while the circuit breaker of a provider is open and no previous result is known."""
+    pass
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header given in seconds or as an HTTP date.
+
+    Returns:
+        float | None: The delay in seconds, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(dt_timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the request rate to a provider.
+
+    Callers reserve a token and sleep until it is available, so waiting
+    callers are served in order. ``pause`` blocks every caller until a point
+    in time, e.g. the Retry-After of a 429 response.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=asyncio.sleep):
+        """
+        Initializes the TokenBucket.
+
+        Args:
+            rate (float): Tokens added per second.
+            burst (int): Maximum number of tokens, i.e. requests sent back to back.
+            clock (Callable[[], float]): Monotonic clock, in seconds.
+            sleep (Callable[[float], Awaitable]): Sleeps for a number of seconds.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, possibly ahead of time.
+
+        Returns:
+            float: Seconds to wait before the token may be used.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._blocked_until - now)
+
+    async def acquire(self):
+        """
+        Waits for a token.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            await self._sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """Blocks all callers for ``seconds`` and drops the tokens accumulated so far."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider after repeated failures.
+
+    After ``failure_threshold`` consecutive failed calls the circuit opens and
+    calls are refused for ``reset_timeout`` seconds. Then one trial call is let
+    through: if it succeeds the circuit closes, otherwise it opens again. A
+    trial that never reports back (e.g. a cancelled call) is replaced by a new
+    one after another ``reset_timeout``.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        """
+        Initializes the CircuitBreaker.
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open before a trial call.
+            clock (Callable[[], float]): Monotonic clock, in seconds.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.failures = 0
+        self._opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(self._clock())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return self.CLOSED
+        if now - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self):
+        """Returns whether a call may be made now."""
+        with self._lock:
+            now = self._clock()
+            state = self._state(now)
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and (
+                self._trial_started is None or now - self._trial_started >= self.reset_timeout
+            ):
+                self._trial_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_started = None
+
+    def record_failure(self):
+        """Records a failed call. Returns True if this failure opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            reopened = self._trial_started is not None
+            self._trial_started = None
+            if reopened or (self._opened_at is None and self.failures >= self.failure_threshold):
+                self._opened_at = self._clock()
+                return True
+            return False
+
+
+class UpstreamProvider:
+    """
+    Schedules the calls to one upstream API.
+
+    Every call waits for a token of the provider's bucket and for a free
+    in-flight slot. Rate limiting (429) and transient failures (5xx, network
+    errors, timeouts) are retried with exponential backoff and full jitter,
+    never sooner than the Retry-After the provider asked for; a 429 also
+    pauses every other call to the provider. While the circuit breaker is
+    open, or when retries are exhausted, the last good result of the same
+    request is served instead, if there is one.
+    """
+
+    def __init__(self, name, rate, burst, max_in_flight, max_retries, backoff_base, backoff_max,
+                 failure_threshold, reset_timeout, clock=time.monotonic, sleep=asyncio.sleep):
+        """
+        Initializes the UpstreamProvider.
+
+        Args:
+            name (str): Provider name used in logs and stats.
+            rate (float): Requests per second allowed on average.
+            burst (int): Requests allowed back to back.
+            max_in_flight (int): Maximum number of concurrent requests.
+            max_retries (int): Retries of a failed call before giving up.
+            backoff_base (float): Backoff of the first retry, in seconds.
+            backoff_max (float): Upper bound of a single backoff, in seconds.
+            failure_threshold (int): Consecutive failed calls that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open.
+            clock (Callable[[], float]): Monotonic clock, in seconds.
+            sleep (Callable[[float], Awaitable]): Sleeps for a number of seconds.
+        """
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock=clock)
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._last_good = {}
+        self._validators = {}
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'calls': 0, 'requests': 0, 'throttled': 0, 'retried': 0, 'failed': 0,
+            'short_circuited': 0, 'stale_served': 0, 'not_modified': 0, 'bytes_received': 0,
+            'wait_seconds': 0.0,
+        }
+
+    def _count(self, field, amount=1):
+        with self._stats_lock:
+            self.stats[field] += amount
+
+    def _semaphore(self):
+        # asyncio primitives are bound to the loop they are first used on.
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        return semaphore
+
+    def backoff(self, attempt, retry_after=None):
+        """Returns the delay before retry number ``attempt`` (0-based)."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def request(self, key, call):
+        """
+        Runs ``call`` under the provider's limits.
+
+        Args:
+            key (str): Identifies the request; the last good result is stored under it.
+            call (Callable[[aiohttp.ClientSession], Awaitable]): Performs the request
+                and returns its decoded result, or None if there is nothing new.
+                It must raise ``aiohttp.ClientResponseError`` for error statuses.
+
+        Returns:
+            The result of ``call``, or the last good result of ``key`` if the
+            provider is unavailable.
+
+        Raises:
+            UpstreamUnavailableError: If the circuit is open and ``key`` has no previous result.
+            UpstreamError: If the call failed and ``key`` has no previous result.
+        """
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            return self._fallback(key, UpstreamUnavailableError(f"{self.name} circuit is open"))
+
+        attempt = 0
+        while True:
+            self._count('wait_seconds', await self.bucket.acquire())
+            delay = None
+            try:
+                async with self._semaphore():
+                    self._count('requests')
+                    result = await call(http_client.get_session())
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRYABLE_STATUSES:
+                    self.breaker.record_success()  # The provider is up; the request itself is wrong.
+                    raise UpstreamError(f"{self.name} returned {e.status}: {e.message}") from e
+                if e.status == 429:
+                    self._count('throttled')
+                    delay = self.backoff(attempt, parse_retry_after((e.headers or {}).get('Retry-After')))
+                    self.bucket.pause(delay)
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            except Exception as e:
+                self.breaker.record_success()  # The provider answered, but not with what we expected.
+                raise UpstreamError(f"{self.name} returned an invalid response: {e!r}") from e
+            else:
+                self.breaker.record_success()
+                if result is not None:
+                    self._last_good[key] = result
+                return result
+
+            if attempt >= self.max_retries:
+                self._count('failed')
+                if self.breaker.record_failure():
+                    logger.warning("Upstream %s failed repeatedly; pausing calls for %ss.",
+                                   self.name, self.breaker.reset_timeout)
+                return self._fallback(key, UpstreamError(f"{self.name} request failed: {error!r}"), error)
+            self._count('retried')
+            await self._sleep(self.backoff(attempt) if delay is None else delay)
+            attempt += 1
+
+    async def fetch_json(self, key, url, params=None, conditional=False, decode=None):
+        """
+        GETs a JSON document through ``request`` and decodes the raw body with
+        orjson, whatever its content type.
+
+        With ``conditional``, the ETag and Last-Modified validators of the
+        previous response to ``key`` are sent back as If-None-Match and
+        If-Modified-Since, and a 304 Not Modified costs neither a download nor
+        a decode.
+
+        Args:
+            key (str): Identifies the request, see ``request``.
+            url (str): URL of the document.
+            params (dict | None): Query string parameters.
+            conditional (bool): Whether to send the validators of the previous response.
+            decode (Callable | None): Converts the decoded document, e.g. into
+                NumPy arrays, so that the last good result is stored in that form
+                and the document itself can be freed right away.
+
+        Returns:
+            The decoded (and converted) document, or None if it has not been modified.
+        """
+        async def call(session):
+            headers = {}
+            etag, last_modified = self._validators.get(key, (None, None)) if conditional else (None, None)
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+            async with session.get(url, params=params, headers=headers) as response:
+                if response.status == 304:
+                    self._count('not_modified')
+                    return None
+                response.raise_for_status()
+                body = await response.read()
+                self._count('bytes_received', len(body))
+                data = orjson.loads(body)
+                if decode is not None:
+                    data = decode(data)
+                if conditional:
+                    self._validators[key] = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                return data
+
+        return await self.request(key, call)
+
+    def _fallback(self, key, error, cause=None):
+        if key in self._last_good:
+            self._count('stale_served')
+            logger.info("Serving the last good %s result for %s: %s", self.name, key, error)
+            return self._last_good[key]
+        raise error from cause
+
+    def snapshot(self):
+        """Returns the counters and the circuit state of the provider."""
+        with self._stats_lock:
+            return {**self.stats, 'circuit': self.breaker.state}
+
+
+class UpstreamScheduler:
+    """Holds the ``UpstreamProvider`` of every configured upstream API."""
+
+    def __init__(self, providers):
+        """
+        Initializes the UpstreamScheduler.
+
+        Args:
+            providers (dict[str, UpstreamProvider]): The providers by name.
+        """
+        self.providers = providers
+
+    @classmethod
+    def from_settings(cls):
+        """Builds the providers from the UPSTREAM settings."""
+        config = get_upstream_settings()
+        return cls({
+            name: UpstreamProvider(
+                name,
+                rate=provider['RATE'],
+                burst=provider['BURST'],
+                max_in_flight=provider['MAX_IN_FLIGHT'],
+                max_retries=config['MAX_RETRIES'],
+                backoff_base=config['BACKOFF_BASE'],
+                backoff_max=config['BACKOFF_MAX'],
+                failure_threshold=config['FAILURE_THRESHOLD'],
+                reset_timeout=config['RESET_TIMEOUT'],
+            )
+            for name, provider in config['PROVIDERS'].items()
+        })
+
+    def provider(self, name):
+        """Returns the provider called ``name``."""
+        return self.providers[name]
+
+    def stats(self):
+        """Returns the counters of every provider."""
+        return {name: provider.snapshot() for name, provider in self.providers.items()}
+
+
+upstream = UpstreamScheduler.from_settings()
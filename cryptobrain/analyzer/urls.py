@@ -6,5 +6,8 @@ urlpatterns = [
     path('market_data/', views.market_data, name='market_data'),
     path('latest_news/', views.latest_news, name='latest_news'),
     path('analysis/', views.analysis, name='analysis'),
+    path('analysis/status/', views.analysis_status, name='analysis_status'),
     path('price_chart/', views.price_chart, name='price_chart'),
+    path('live/', views.live_updates, name='live_updates'),
+    path('metrics/', views.prometheus_metrics, name='metrics'),
 ]
@@ -1,229 +1,332 @@
 import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.utils import timezone
 from django.core.cache import cache
-from .fetchers import fetch_bitcoin_price, fetch_bitcoin_historical_price, fetch_bitcoin_news
-from .models import BitcoinPriceHistory, BitcoinNews
-import asyncio
-from asgiref.sync import sync_to_async
-from datetime import timedelta, datetime
-from .processor import calculate_moving_average, calculate_price_trend
-from .agent import agent_orchestrator, APIQuotaExceededError
+from .assets import get_tracked_assets, get_asset, get_request_asset
+from .storage import (
+    get_price_series_from_db,
+    get_price_buckets_from_db,
+    get_latest_news_from_db,
+    get_latest_price_from_db,
+)
+from .ingestion import market_snapshot_cache_key, get_ingestion_settings
+from .fragments import fragment_cache
+from .processor import prepare_chart_data, prepare_ohlc_chart_data
+from .downsampling import lttb, ohlcv_buckets, rollup_buckets
+from .retention import retention_policy
+from .series import PriceSeries
+from .analysis_service import AnalysisUnavailableError, get_analysis_progress, record_analysis_demand
+from .jobs import get_latest_job
+from .live import live_hub, get_live_updates_settings, data_version
+from .metrics import metrics
+from .models import AnalysisJob
+
+
+def render_partial(template_name, context):
+    """Renders a template to a string, timing it under the ``render`` stage."""
+    # One operation for every partial keeps the number of series of the exposition small.
+    with metrics.timer('render', 'partial'):
+        return render_to_string(template_name, context)
 
-
-@sync_to_async
-def save_price_history_bulk(price_data_list):
+async def dashboard(request):
+    """Renders the main dashboard page for the asset selected by the ``asset`` query parameter."""
+    asset = get_request_asset(request)
+    context = {
+        'asset': asset,
+        'assets': list(get_tracked_assets().values()),
+        'crypto': asset['symbol'],
+    }
+    with metrics.timer('render', 'page'):
+        return render(request, 'dashboard.html', context)
+
+
+async def build_market_data_context(asset_id):
+    """Builds the market data context from the most recent stored price tick."""
+    latest_price_data = await get_latest_price_from_db(asset_id)
+    if not latest_price_data:
+        return None
+    return {
+        'price_data': {
+            'price': latest_price_data.price,
+            'total_volume': latest_price_data.volume_24h,
+        },
+        'last_updated': latest_price_data.timestamp.strftime('%H:%M:%S')
+    }
+
+async def render_market_data(asset):
     """
-    Saves a list of historical price data points in a single bulk operation,
-    avoiding duplicates by checking existing timestamps.
+    Renders the market data partial from the latest snapshot written by the
+    ingestion scheduler, falling back to the most recent stored price tick.
 
-    Args:
-        price_data_list (list[dict]): A list of price data dictionaries.
+    Returns:
+        tuple[str, bool]: The HTML and whether it may be cached.
     """
-    timestamps = [p['timestamp'] for p in price_data_list]
-    existing_timestamps = set(
-        BitcoinPriceHistory.objects.filter(timestamp__in=timestamps).values_list('timestamp', flat=True)
-    )
-    new_prices = [
-        BitcoinPriceHistory(**p) for p in price_data_list if p['timestamp'] not in existing_timestamps
-    ]
-    if new_prices:
-        BitcoinPriceHistory.objects.bulk_create(new_prices)
+    snapshot = await cache.aget(market_snapshot_cache_key(asset['id']))
+    if snapshot:
+        context = {
+            'asset': asset,
+            'price_data': snapshot['price_data'],
+            'last_updated': snapshot['fetched_at'].strftime('%H:%M:%S')
+        }
+        return render_partial('partials/market_data.html', context), True
 
-@sync_to_async
-def save_single_price_history(price_data):
-    """
-    Saves a single, most recent price data point.
+    try:
+        context = await build_market_data_context(asset['id'])
+        if not context:
+            return render_partial('partials/market_data.html', {'asset': asset, 'error': 'Market data is not available yet.'}), False
+        return render_partial('partials/market_data.html', {**context, 'asset': asset}), True
+    except Exception:
+        return render_partial('partials/market_data.html', {'asset': asset, 'error': 'An unexpected error occurred.'}), False
 
-    Args:
-        price_data (dict): The price data to save.
+async def market_data(request):
+    """Serves the market data partial from the fragment cache."""
+    asset = get_request_asset(request)
+    return await fragment_cache.respond(request, 'market_data', asset['id'], lambda: render_market_data(asset))
+
+async def build_latest_news_context(asset_id):
+    """Builds the latest news context from the database, or None if there is no news yet."""
+    news_items = await get_latest_news_from_db(asset_id, limit=20)
+    if not news_items:
+        return None
+    return {
+        'news': news_items,
+        'last_updated': timezone.now().strftime('%H:%M:%S')
+    }
+
+async def render_latest_news(asset):
     """
-    BitcoinPriceHistory.objects.update_or_create(
-        timestamp=price_data['timestamp'],
-        defaults={'price': price_data['price'], 'volume_24h': price_data['volume_24h']}
-    )
+    Renders the latest news partial from the database. The fragment cache
+    keys the result on the news data version, so newly ingested news is
+    loaded and rendered once, then shared by every request and live update.
 
-@sync_to_async
-def save_news_items(news_items):
-    """
-    Saves a list of news items, ignoring duplicates based on the unique URL field.
-
-    Args:
-        news_items (list[dict]): A list of news item dictionaries.
-    """
-    news_to_create = [
-        BitcoinNews(
-            url=item['url'],
-            title=item['title'],
-            published_at=item['published_at'],
-            source=item['source']
-        )
-        for item in news_items
-    ]
-    if news_to_create:
-        BitcoinPriceHistory.objects.bulk_create(news_to_create, ignore_conflicts=True)
-
-@sync_to_async
-def get_price_history_from_db():
-    """Fetches price history from the last 7 days from the database."""
-    seven_days_ago = timezone.now() - timedelta(days=7)
-    return list(BitcoinPriceHistory.objects.filter(timestamp__gte=seven_days_ago).order_by('timestamp'))
-
-@sync_to_async
-def get_latest_news_from_db(limit=10):
-    """Fetches the most recent news items from the database."""
-    return list(BitcoinNews.objects.all().order_by('-published_at')[:limit])
-
-@sync_to_async
-def purge_old_price_data():
-    """Removes price data older than 7 days to keep the database clean."""
-    seven_days_ago = timezone.now() - timedelta(days=7)
-    BitcoinPriceHistory.objects.filter(timestamp__lt=seven_days_ago).delete()
-
-@sync_to_async
-def get_latest_price_from_db():
-    """Fetches the most recent price data point from the database."""
-    return BitcoinPriceHistory.objects.order_by('-timestamp').first()
-
-
-def map_price_data(price_data, timestamp):
-    """Maps raw price data to a structured dictionary with a timezone-aware datetime."""
-    dt = datetime.fromtimestamp(timestamp / 1000) if timestamp else timezone.now()
-    if timezone.is_naive(dt):
-        dt = timezone.make_aware(dt, timezone.get_default_timezone())
-    return {'timestamp': dt, 'price': price_data.get('price', 0), 'volume_24h': price_data.get('volume_24h')}
+    Returns:
+        tuple[str, bool]: The HTML and whether it may be cached.
+    """
+    try:
+        context = await build_latest_news_context(asset['id'])
+        return render_partial('partials/latest_news.html', {**(context or {'news': []}), 'asset': asset}), True
+    except Exception:
+        return render_partial('partials/latest_news.html', {'asset': asset, 'error': 'Could not load news.'}), False
 
+async def latest_news(request):
+    """Serves the latest news partial from the fragment cache."""
+    asset = get_request_asset(request)
+    return await fragment_cache.respond(request, 'latest_news', asset['id'], lambda: render_latest_news(asset))
 
-async def dashboard(request):
-    """Renders the main dashboard page."""
-    return render(request, 'dashboard.html', {'crypto': 'BTC'})
+async def render_analysis(asset):
+    """
+    Renders the AI analysis partial without waiting for the model. Without a
+    cached analysis, one is queued and the fields decoded so far are rendered;
+    each further field is published and pushed as a live update. Until the
+    analysis is complete, the partial also polls ``analysis_status``.
 
+    Returns:
+        tuple[str, bool]: The HTML and whether it may be cached.
+    """
+    # Read first, so that a state published while rendering is not missed by the poll.
+    version = await data_version('analysis', asset['id'])
+    try:
+        # A partial analysis is short-lived, so only the complete one is cached.
+        context, cacheable = await get_analysis_progress(asset)
+    except AnalysisUnavailableError as e:
+        context, cacheable = {'error': str(e)}, False
+    except Exception:
+        context, cacheable = {'error': 'AI analysis is temporarily unavailable.'}, False
+    poll_version = None if cacheable else version
+    return render_partial(
+        'partials/analysis.html', {**context, 'asset': asset, 'poll_version': poll_version}
+    ), cacheable
 
-async def market_data(request):
+async def analysis(request):
     """
-    Renders the market data partial view, serving from cache if available
-    or fetching fresh data from the CoinGecko API.
+    Serves the AI analysis partial from the fragment cache. Every new analysis
+    bumps the analysis data version, which retires the cached fragment.
+    Viewing an asset also keeps it on the scheduled analysis refresh list.
     """
-    cache_key = 'market_data'
-    context = cache.get(cache_key)
-    if context:
-        return render(request, 'partials/market_data.html', context)
-
-    try:
-        price_data = await fetch_bitcoin_price()
-        if not price_data:
-            return render(request, 'partials/market_data.html', {'error': 'Could not fetch market data.'})
+    asset = get_request_asset(request)
+    await record_analysis_demand(asset['id'], get_ingestion_settings()['ANALYSIS_DEMAND_WINDOW'])
+    return await fragment_cache.respond(request, 'analysis', asset['id'], lambda: render_analysis(asset))
 
-        context = {
-            'price_data': price_data,
-            'last_updated': timezone.now().strftime('%H:%M:%S')
-        }
-        cache.set(cache_key, context, timeout=60)  # Cache for 1 minute
-        return render(request, 'partials/market_data.html', context)
-    except Exception:
-        return render(request, 'partials/market_data.html', {'error': 'An unexpected error occurred.'})
+async def analysis_status(request):
+    """
+    Reports the state of the latest analysis job of an asset as JSON, from a
+    single indexed query, for clients polling without live updates.
 
-async def latest_news(request):
+    With the ``version`` of the analysis the client shows, the response also
+    carries an ``analysis-updated`` HX-Trigger once a newer state has been
+    published, or status 286, which stops htmx polling, once nothing more
+    will change.
     """
-    Renders the latest news partial view, serving from cache or fetching from the DB.
+    asset = get_request_asset(request)
+    job = await get_latest_job(asset['id'])
+    version = await data_version('analysis', asset['id'])
+    status = job['status'] if job else 'idle'
+    retrying = job is not None and status == AnalysisJob.Status.PENDING and job['attempts'] > 0
+    response = JsonResponse({
+        'asset': asset['id'],
+        'status': status,
+        'attempts': job['attempts'] if job else 0,
+        'retry_at': job['run_after'].isoformat() if retrying else None,
+        'error': job['error'] if job else '',
+        'version': version,
+    })
+    seen = request.GET.get('version')
+    if seen is not None:
+        if seen != str(version):
+            response['HX-Trigger'] = 'analysis-updated'
+        elif status not in (AnalysisJob.Status.PENDING, AnalysisJob.Status.RUNNING):
+            response.status_code = 286
+    return response
+
+def parse_price_chart_params(request):
     """
-    cache_key = 'latest_news'
-    context = cache.get(cache_key)
-    if context:
-        return render(request, 'partials/latest_news.html', context)
+    Reads and validates the range, mode and resolution query parameters of the price chart.
 
+    Returns:
+        tuple[str, str, int]: The range key, the mode ('line' or 'ohlc') and the target point count.
+    """
+    config = settings.PRICE_CHART
+    range_key = request.GET.get('range', config['DEFAULT_RANGE'])
+    if range_key not in config['RANGES']:
+        range_key = config['DEFAULT_RANGE']
+    mode = request.GET.get('mode', 'line')
+    if mode not in ('line', 'ohlc'):
+        mode = 'line'
     try:
-        news_items = await get_latest_news_from_db(limit=20)
-        if not news_items:
-            return render(request, 'partials/latest_news.html', {'news': []})
+        points = int(request.GET.get('points', config['DEFAULT_POINTS']))
+    except ValueError:
+        points = config['DEFAULT_POINTS']
+    points = max(10, min(points, config['MAX_POINTS']))
+    return range_key, mode, points
 
-        context = {
-            'news': news_items,
-            'last_updated': timezone.now().strftime('%H:%M:%S')
-        }
-        cache.set(cache_key, context, timeout=900)  # Cache for 15 minutes
-        return render(request, 'partials/latest_news.html', context)
-    except Exception:
-        return render(request, 'partials/latest_news.html', {'error': 'Could not load news.'})
+async def build_price_chart_data(asset_id, range_key, mode, points):
+    """
+    Loads the requested range from the coarsest retention tier that still has
+    enough resolution, and downsamples it to at most ``points`` points.
 
-async def analysis(request):
+    Returns:
+        str | None: The Chart.js data as JSON, or None if there is no price data.
     """
-    Renders the AI analysis partial view. It gathers data from the database,
-    calculates technical indicators, and invokes the AI agent to get a
-    comprehensive market analysis.
+    days = settings.PRICE_CHART['RANGES'][range_key]
+    label_format = '%H:%M' if days <= 1 else '%b %d'
+    bucket_ms = max(1, (days * 86400 * 1000) // points)
+    resolution = retention_policy.select_resolution(days, points)
+
+    if resolution is None:
+        series = await get_price_series_from_db(asset_id, days=days)
+        if not series:
+            return None
+        if mode == 'ohlc':
+            chart_data = prepare_ohlc_chart_data(ohlcv_buckets(series, bucket_ms), label_format=label_format)
+        else:
+            chart_data = prepare_chart_data(lttb(series, points), label_format=label_format)
+        return json.dumps(chart_data)
+
+    buckets = await get_price_buckets_from_db(asset_id, days, resolution)
+    if not len(buckets['timestamps']):
+        return None
+    if mode == 'ohlc':
+        bucket_ms = -(-bucket_ms // (resolution * 1000)) * resolution * 1000
+        chart_data = prepare_ohlc_chart_data(rollup_buckets(buckets, bucket_ms), label_format=label_format)
+    else:
+        closes = PriceSeries(buckets['timestamps'], buckets['close'], buckets['volume'])
+        chart_data = prepare_chart_data(lttb(closes, points), label_format=label_format)
+    return json.dumps(chart_data)
+
+async def render_price_chart(asset, range_key, mode, points):
     """
-    cache_key = 'analysis_data'
-    context = cache.get(cache_key)
-    if context:
-        return render(request, 'partials/analysis.html', context)
+    Renders the price chart partial for a range, mode and resolution.
 
+    Returns:
+        tuple[str, bool]: The HTML and whether it may be cached.
+    """
     try:
-        latest_price_data, price_history_db, news_items = await asyncio.gather(
-            get_latest_price_from_db(),
-            get_price_history_from_db(),
-            get_latest_news_from_db()
-        )
-
-        if not all([latest_price_data, price_history_db, news_items]):
-            return render(request, 'partials/analysis.html', {'error': 'Not enough data for analysis. Please refresh in a moment.'})
-
-        price_trend, moving_average = await asyncio.gather(
-            sync_to_async(calculate_price_trend)(price_history_db),
-            sync_to_async(calculate_moving_average)(price_history_db)
-        )
+        chart_data = await build_price_chart_data(asset['id'], range_key, mode, points)
     except Exception:
-        return render(request, 'partials/analysis.html', {'error': 'Could not retrieve market data for analysis.'})
+        return render_partial('partials/price_chart.html', {'asset': asset, 'error': 'Could not load chart data.'}), False
+    if not chart_data:
+        return render_partial('partials/price_chart.html', {'asset': asset, 'error': 'No price data available.'}), False
+
+    context = {
+        'asset': asset,
+        'chart_data': chart_data,
+        'range_key': range_key,
+        'ranges': list(settings.PRICE_CHART['RANGES']),
+        'mode': mode,
+    }
+    return render_partial('partials/price_chart.html', context), True
 
-    try:
-        analysis_result = await agent_orchestrator.get_comprehensive_analysis(
-            current_price=latest_price_data.price,
-            volume_24h=latest_price_data.volume_24h or 0,
-            price_trend=price_trend,
-            moving_average=moving_average,
-            news_titles=[news.title for news in news_items]
-        )
-
-        if not analysis_result:
-            context = {'error': 'AI analysis returned no data.'}
-        else:
-            context = {
-                'sentiment_prediction': {
-                    'sentiment': analysis_result.get('market_sentiment'),
-                    'confidence_percentage': round(analysis_result.get('confidence_score', 0.0) * 100)
-                },
-                'trend_prediction': {
-                    'prediction': analysis_result.get('trend_prediction'),
-                    'confidence_percentage': round(analysis_result.get('confidence_score', 0.0) * 100),
-                    'reasoning': analysis_result.get('detailed_reasoning')
-                },
-                'analysis_summary': analysis_result.get('analysis_summary'),
-                'last_updated': timezone.now().strftime('%H:%M:%S')
-            }
-            cache.set(cache_key, context, timeout=900) 
-
-    except APIQuotaExceededError as e:
-        context = {'error': str(e)}
-    except Exception:
-        context = {'error': 'AI analysis is temporarily unavailable.'}
+async def price_chart(request):
+    """
+    Serves the price chart partial. The selected range is downsampled
+    server-side (LTTB for the line, OHLCV buckets for the high/low view) and
+    the rendered chart is cached per asset, data version, range, mode and resolution.
+    """
+    asset = get_request_asset(request)
+    range_key, mode, points = parse_price_chart_params(request)
+    return await fragment_cache.respond(
+        request, 'price_chart', asset['id'],
+        lambda: render_price_chart(asset, range_key, mode, points),
+        variant=f'{range_key}:{mode}:{points}',
+        timeout=settings.PRICE_CHART['CACHE_TIMEOUT'],
+    )
 
-    return render(request, 'partials/analysis.html', context)
+async def render_price_chart_update(asset_id):
+    """
+    Notifies clients that the price history changed. Each client reloads the
+    chart for the range and mode it is displaying, so no fragment is pushed.
+    """
+    return ''
 
-async def price_chart(request):
+def fragment_update(topic, render):
     """
-    Renders the price chart partial view, fetching historical data and
-    formatting it for Chart.js.
+    Builds the live update renderer of a topic from its fragment renderer.
+    Pushed fragments come from the fragment cache, so a live update and the
+    polls that follow it share one render.
     """
-    try:
-        prices = await get_price_history_from_db()
-        if not prices:
-            return render(request, 'partials/price_chart.html', {'error': 'No price data available.'})
+    async def render_update(asset_id):
+        asset = get_asset(asset_id)
+        html, _ = await fragment_cache.get_or_render(topic, asset_id, lambda: render(asset))
+        return html.decode()
+    return render_update
+
+live_hub.register('market_data', fragment_update('market_data', render_market_data))
+live_hub.register('latest_news', fragment_update('latest_news', render_latest_news))
+live_hub.register('analysis', fragment_update('analysis', render_analysis))
+live_hub.register('price_chart', render_price_chart_update)
+
+async def live_updates(request):
+    """
+    Streams Server-Sent Events with the rendered partials of the selected asset
+    whenever ingestion or analysis produces new data.
 
-        chart_data = {
-            'labels': [p.timestamp.strftime('%b %d') for p in prices],
-            'prices': [float(p.price) for p in prices]
-        }
+    Live updates need the ASGI server; under WSGI the stream would hold a
+    worker thread per client, so a 204 tells the browser not to reconnect.
+    """
+    asset = get_request_asset(request)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    config = get_live_updates_settings()
+    subscriber = await live_hub.subscribe(asset['id'])
+    response = StreamingHttpResponse(
+        live_hub.stream(subscriber, config['HEARTBEAT_INTERVAL'], config['RETRY_MS']),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-        context = {'chart_data': json.dumps(chart_data)}
-        return render(request, 'partials/price_chart.html', context)
-    except Exception:
-        return render(request, 'partials/price_chart.html', {'error': 'Could not load chart data.'})
\ No newline at end of file
+async def prometheus_metrics(request):
+    """
+    Exposes the timings and counters of this process, and the shared ones of
+    the ingestion scheduler, in the Prometheus text format.
+    """
+    # Rendering reads the shared snapshot from the cache, so it runs off the event loop.
+    body = await sync_to_async(metrics.render, thread_sensitive=False)()
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
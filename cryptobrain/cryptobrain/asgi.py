@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cryptobrain.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after the app registry is ready; adds lifespan startup/shutdown hooks.
+from analyzer.server import LifespanApplication  # noqa: E402
+
+application = LifespanApplication(django_application)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import os
 import sys
 
 # Determine the base directory in a way that works for both development and PyInstaller
@@ -48,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'analyzer.metrics.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,18 +78,41 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'cryptobrain.wsgi.application'
+ASGI_APPLICATION = 'cryptobrain.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Production profile for SQLite: WAL lets readers run while a write is in
+# progress, synchronous=NORMAL only syncs at checkpoints (safe in WAL mode),
+# and the larger page cache plus memory-mapped I/O keep hot pages in memory.
+# Write transactions start IMMEDIATE so concurrent writers wait for the lock
+# instead of failing on upgrade, and connections are reused for CONN_MAX_AGE.
+
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',  # 256 MiB
+    'PRAGMA cache_size=-65536',  # 64 MiB
+    'PRAGMA temp_store=MEMORY',
+]
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
         'OPTIONS': {
             'timeout': 30,  # Increase timeout to 30 seconds
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(SQLITE_PRAGMAS),
         },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # Tests use a file as well: the default shared-cache in-memory database
+        # takes table locks that ignore the timeout, so reads racing the writer
+        # thread fail with "database table is locked".
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -143,14 +168,74 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Caching
 # https://docs.djangoproject.com/en/5.1/topics/cache/
-
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'crypto_brain_cache',
+# The cache is shared by every process (server workers, the ingestion
+# scheduler, management commands), so each value is computed once per TTL
+# window. By default it lives in a local SQLite file; set REDIS_URL to use a
+# Redis-protocol server instead (requires the `redis` package).
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'analyzer.cache_backends.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': 'cryptobrain',
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'analyzer.cache_backends.SQLiteCache',
+            'LOCATION': BASE_DIR / 'cache.sqlite3',
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+            },
+        }
+    }
+
+# Tracked assets
+# Keyed by CoinGecko id. The symbol is used for CryptoPanic and the prompts.
+
+TRACKED_ASSETS = {
+    'bitcoin': {'symbol': 'BTC', 'name': 'Bitcoin'},
+    'ethereum': {'symbol': 'ETH', 'name': 'Ethereum'},
+    'solana': {'symbol': 'SOL', 'name': 'Solana'},
+}
+
+DEFAULT_ASSET = 'bitcoin'
+
+# Price chart
+# RANGES maps the `range` query parameter to a number of days. Responses are
+# downsampled to at most `points` points and cached per (range, mode, points).
+
+PRICE_CHART = {
+    'RANGES': {'1d': 1, '7d': 7, '30d': 30, '1y': 365},
+    'DEFAULT_RANGE': '7d',
+    'DEFAULT_POINTS': 500,
+    'MAX_POINTS': 2000,
+    'CACHE_TIMEOUT': 300,
 }
 
+# Analyzer settings
+# Each analyzer module keeps the defaults of its setting, documented next to the
+# code that uses them (DEFAULT_<NAME>_SETTINGS). Define a setting here with only
+# the keys to change, e.g. INGESTION = {'NEWS_INTERVAL': 600}:
+#
+#   AGENT             analyzer.agent
+#   ANALYSIS_CACHE    analyzer.analysis_cache
+#   ANALYSIS_JOBS     analyzer.jobs
+#   CACHE_COALESCING  analyzer.coalescing
+#   DB_WRITER         analyzer.db_writer
+#   FRAGMENT_CACHE    analyzer.fragments
+#   HTTP_CLIENT       analyzer.http_client
+#   INDICATORS        analyzer.indicators
+#   INGESTION         analyzer.ingestion
+#   LIVE_UPDATES      analyzer.live
+#   METRICS           analyzer.metrics
+#   NEWS_CLUSTERING   analyzer.news_clusters
+#   RETENTION         analyzer.retention
+#   SERVER            analyzer.server
+#   UPSTREAM          analyzer.upstream
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
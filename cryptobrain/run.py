@@ -1,35 +1,65 @@
+import multiprocessing
 import os
 import webbrowser
-from waitress import serve
 
-print("--- CryptoBrain Dashboard: Starting ---")
 
-try:
-    # Set the Django settings module environment variable
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cryptobrain.settings')
-    print("DJANGO_SETTINGS_MODULE set to 'cryptobrain.settings'")
+def main():
+    print("--- CryptoBrain Dashboard: Starting ---")
 
-    from cryptobrain.wsgi import application
-    print("Successfully imported Django WSGI application.")
+    try:
+        # Set the Django settings module environment variable
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cryptobrain.settings')
+        print("DJANGO_SETTINGS_MODULE set to 'cryptobrain.settings'")
 
-    # Define host and port
-    host = '127.0.0.1'
-    port = 8000
-    url = f"http://{host}:{port}"
+        import django
+        django.setup()
+        print("Django initialized.")
 
-    print(f"Starting production server with Waitress at {url}")
-    print("The application will open in your default browser shortly.")
-    print("Press Ctrl+C in this window to exit.")
+        from analyzer.server import get_server_settings, run_server
+        config = get_server_settings()
 
-    # Open the URL in the default web browser
-    webbrowser.open(url)
+        # Start the background ingestion scheduler so the dashboard has data to show.
+        # It runs once in this process, not in every server worker.
+        from analyzer.ingestion import start_background_ingestion
+        scheduler = start_background_ingestion()
+        if scheduler:
+            print("Background ingestion scheduler started.")
 
-    # Serve the Django application
-    serve(application, host=host, port=port)
+        # Define host and port
+        host = config['HOST']
+        port = config['PORT']
+        url = f"http://{host}:{port}"
 
-except Exception as e:
-    print("--- FATAL ERROR DURING STARTUP ---")
-    print(f"An error occurred: {e}")
-    # In a real production environment, you would log this to a file.
-    # The input() call will pause the console window so you can read the error.
-    input("Press Enter to exit.")
+        print(f"Starting ASGI server with Uvicorn at {url} ({config['WORKERS']} worker(s))")
+        print("The application will open in your default browser shortly.")
+        print("Press Ctrl+C in this window to exit.")
+
+        # Open the URL in the default web browser
+        webbrowser.open(url)
+
+        # Serve the Django application; returns after a graceful shutdown
+        try:
+            run_server(
+                host=host,
+                port=port,
+                workers=config['WORKERS'],
+                graceful_shutdown_timeout=config['GRACEFUL_SHUTDOWN_TIMEOUT'],
+                log_level=config['LOG_LEVEL'],
+            )
+        finally:
+            if scheduler:
+                scheduler.stop()
+                print("Background ingestion scheduler stopped.")
+
+    except Exception as e:
+        print("--- FATAL ERROR DURING STARTUP ---")
+        print(f"An error occurred: {e}")
+        # In a real production environment, you would log this to a file.
+        # The input() call will pause the console window so you can read the error.
+        input("Press Enter to exit.")
+
+
+if __name__ == '__main__':
+    # Required for the worker processes spawned from the PyInstaller executable.
+    multiprocessing.freeze_support()
+    main()
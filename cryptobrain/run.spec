@@ -26,6 +26,17 @@ a = Analysis(
         'jinja2',
         'colorama',
         'numpy',
+        # Imported lazily by the AI agent on the first analysis.
+        'analyzer.llm_chain',
+        # Uvicorn loads its server components and the app by import string.
+        'cryptobrain.asgi',
+        'uvicorn.logging',
+        'uvicorn.loops.auto',
+        'uvicorn.loops.asyncio',
+        'uvicorn.protocols.http.auto',
+        'uvicorn.protocols.http.h11_impl',
+        'uvicorn.protocols.websockets.auto',
+        'uvicorn.lifespan.on',
     ],
     # This is the crucial part: we tell PyInstaller where to find our custom hooks.
     hookspath=['pyinstaller-hooks'],